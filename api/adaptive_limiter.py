@@ -0,0 +1,279 @@
+import asyncio
+import time
+from collections import deque
+
+# Error codes and HTTP statuses upstreams use to signal "slow down"
+THROTTLING_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+THROTTLING_STATUSES = {429, 503, 529}
+
+# EWMA weights of the short-term (recent) and long-term (baseline) latency
+# and in-flight averages: about the last 5 and the last 50 calls
+RECENT_ALPHA = 0.2
+BASELINE_ALPHA = 0.02
+# Successful calls of a latency class before its latency is judged
+MIN_LATENCY_SAMPLES = 20
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for errors that mean the upstream is at capacity (timeouts, throttling)."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    if getattr(error, "status_code", None) in THROTTLING_STATUSES:
+        return True
+    # botocore ClientError
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in THROTTLING_CODES
+    return False
+
+
+class _LatencyClass:
+    """Short- and long-term RTT averages of one kind of call."""
+
+    __slots__ = ("recent", "baseline", "samples")
+
+    def __init__(self):
+        self.recent: float | None = None
+        self.baseline: float | None = None
+        self.samples = 0
+
+    def observe(self, rtt: float) -> None:
+        if self.recent is None:
+            self.recent = self.baseline = rtt
+        else:
+            self.recent += (rtt - self.recent) * RECENT_ALPHA
+        self.samples += 1
+
+    def settle(self, rtt: float) -> None:
+        """Moves the baseline toward a sample accepted as normal latency."""
+        self.baseline += (rtt - self.baseline) * BASELINE_ALPHA
+
+    def stats(self) -> dict:
+        return {
+            "baseline_rtt_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            "recent_rtt_ms": round(self.recent * 1000, 1) if self.recent is not None else None,
+            "samples": self.samples,
+        }
+
+
+class Permit:
+    """One acquired slot. Lets the caller report an outcome the limiter cannot see."""
+
+    def __init__(self, limiter: "AdaptiveLimiter", wait_ms: float, latency_class: str):
+        self.limiter = limiter
+        self.wait_ms = wait_ms
+        self.latency_class = latency_class
+        # Calls in flight (this one included) when the slot was granted
+        self.inflight = limiter.inflight
+        self.start = time.perf_counter()
+        self.outcome: str | None = None
+
+    def classify(self, latency_class: str) -> None:
+        """The call turned out to be of another kind (e.g. it was hedged)."""
+        self.latency_class = latency_class
+
+    def dropped(self) -> None:
+        """The call was throttled or timed out (handled inside the block)."""
+        self.outcome = "dropped"
+
+    def ignore(self) -> None:
+        """The call failed for a reason unrelated to capacity: no sample."""
+        self.outcome = "ignored"
+
+    async def __aenter__(self) -> "Permit":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        rtt = time.perf_counter() - self.start
+        outcome = self.outcome
+        if outcome is None:
+            if exc is None:
+                outcome = "success"
+            elif is_overload_error(exc):
+                outcome = "dropped"
+            else:
+                outcome = "ignored"
+        self.limiter._release(self, outcome, rtt)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for one upstream that follows its real capacity
+    (AIMD with a latency guard, in the spirit of Netflix concurrency-limits).
+
+    - Additive increase: each successful call while the limit is in use adds
+      1/limit, so the limit grows by about one per round of calls, as long
+      as latency stays within tolerance x the baseline RTT.
+    - Multiplicative decrease: a throttling error or timeout multiplies the
+      limit by backoff. Latency above tolerance x baseline multiplies it by a
+      gentler 0.9, but only while the in-flight count is above its own
+      baseline too: latency that rises with our load is queueing upstream,
+      latency that rises on its own is not ours to fix.
+      At most one decrease per round trip (recent RTT, or cooldown seconds
+      before any call has completed), so the burst of failures from a single
+      overload episode does not collapse the limit to the minimum.
+    - Latency is tracked per latency class (e.g. single, batch and hedged
+      calls): the recent RTT (short EWMA) of a class is compared with its
+      own baseline (long EWMA), so a slow kind of call or the normal spread
+      of one does not read as overload. The baseline only learns from calls
+      made at a steady or falling load, so our own ramp-up does not become
+      the norm. All classes share the one limit.
+    - Callers beyond the limit wait in FIFO order (queue_depth).
+
+    Usage:
+        async with limiter.acquire("batch") as permit:
+            ...
+            permit.dropped()  # optional, for throttling handled in the block
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        backoff: float = 0.7,
+        tolerance: float = 2.0,
+        cooldown: float = 1.0,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.inflight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self._latency: dict[str, _LatencyClass] = {}
+        # Short- and long-term averages of the in-flight count at grant time
+        self._recent_inflight: float | None = None
+        self._baseline_inflight: float | None = None
+        self.successes = 0
+        self.drops = 0
+        self.latency_decreases = 0
+        self.peak_queue = 0
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def available(self) -> int:
+        return max(self.current_limit - self.inflight, 0)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, latency_class: str = "default") -> "_Acquire":
+        return _Acquire(self, latency_class)
+
+    async def _acquire(self, latency_class: str) -> Permit:
+        start = time.perf_counter()
+        if self.inflight < self.current_limit and not self._waiters:
+            self.inflight += 1
+            return Permit(self, 0.0, latency_class)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.peak_queue = max(self.peak_queue, len(self._waiters))
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted and cancelled in the same tick: hand the slot on
+                self.inflight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+        return Permit(self, (time.perf_counter() - start) * 1000, latency_class)
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < self.current_limit:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.inflight += 1
+            future.set_result(None)
+
+    def _release(self, permit: Permit, outcome: str, rtt: float) -> None:
+        self.inflight -= 1
+        now = time.monotonic()
+        latency = self._latency.get(permit.latency_class)
+        if outcome == "dropped":
+            self.drops += 1
+            self._decrease(now, self.backoff, latency)
+        elif outcome == "success":
+            self.successes += 1
+            if latency is None:
+                latency = self._latency[permit.latency_class] = _LatencyClass()
+            latency.observe(rtt)
+            if self._recent_inflight is None:
+                self._recent_inflight = self._baseline_inflight = float(permit.inflight)
+            self._recent_inflight += (permit.inflight - self._recent_inflight) * RECENT_ALPHA
+            loaded = self._recent_inflight > self._baseline_inflight
+            self._baseline_inflight += (permit.inflight - self._baseline_inflight) * BASELINE_ALPHA
+            slow = latency.samples >= MIN_LATENCY_SAMPLES and latency.recent > latency.baseline * self.tolerance
+            if slow and loaded:
+                # Latency rising with our load: queueing upstream
+                if self._decrease(now, 0.9, latency):
+                    self.latency_decreases += 1
+            if not loaded:
+                # Only latency seen at a steady or falling load becomes the
+                # normal one, so a slow ramp-up cannot drag the baseline along
+                latency.settle(rtt)
+            if not slow and permit.inflight >= self.current_limit * 0.5:
+                # Only grow when the limit is actually being used
+                self.limit = min(self.limit + 1.0 / self.limit, float(self.max_limit))
+        self._wake()
+
+    def _decrease(self, now: float, factor: float, latency: _LatencyClass | None) -> bool:
+        window = latency.recent if latency is not None and latency.recent is not None else self.cooldown
+        if now - self._last_decrease < window:
+            return False
+        self._last_decrease = now
+        self.limit = max(self.limit * factor, float(self.min_limit))
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.current_limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "inflight": self.inflight,
+            "available": self.available,
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue,
+            "latency": {name: latency.stats() for name, latency in self._latency.items()},
+            "successes": self.successes,
+            "drops": self.drops,
+            "latency_decreases": self.latency_decreases,
+        }
+
+
+class _Acquire:
+    """Awaitable context manager returned by AdaptiveLimiter.acquire()."""
+
+    def __init__(self, limiter: AdaptiveLimiter, latency_class: str):
+        self.limiter = limiter
+        self.latency_class = latency_class
+        self.permit: Permit | None = None
+
+    async def __aenter__(self) -> Permit:
+        self.permit = await self.limiter._acquire(self.latency_class)
+        return self.permit
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.permit.__aexit__(exc_type, exc, tb)
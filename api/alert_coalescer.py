@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import hashlib
+import re
+import time
+import unicodedata
+from typing import Callable
+
+# Alerts listed per digest; the count covers the rest, and the highest
+# scoring absorbed alert is always listed (tracked outside this cap)
+MAX_DIGEST_ALERTS = 50
+
+
+def reason_fingerprint(reason: str) -> str:
+    """
+    Fingerprint of an alert reason that ignores case, accents, punctuation
+    and numbers, so rewordings of the same verdict ("transferir $500" /
+    "Transferir 300") coalesce.
+    """
+    text = unicodedata.normalize("NFKD", reason or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    text = re.sub(r"\d+", "0", text)
+    text = " ".join(re.findall(r"\w+", text))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class _Window:
+    __slots__ = (
+        "key", "channel", "recipient", "opened", "deadline", "delivery_id",
+        "alerts", "count", "max_scoring", "max_alert", "task",
+    )
+
+    def __init__(
+        self, key: tuple, channel: str, recipient: str, delivery_id: str, scoring: float, now: float, window: float
+    ):
+        self.key = key
+        self.channel = channel
+        self.recipient = recipient
+        self.opened = now
+        self.deadline = now + window
+        self.delivery_id = delivery_id
+        self.alerts: list[dict] = []
+        self.count = 0
+        # Highest scoring already sent for the key, and the highest absorbed alert
+        self.max_scoring = scoring
+        self.max_alert: dict | None = None
+        self.task: asyncio.Task | None = None
+
+
+class AlertCoalescer:
+    """
+    Per-recipient deduplication of alert notifications.
+
+    Alerts are keyed on (channel, recipient, type, reason fingerprint). The
+    first alert of a key is sent at once and opens a window; repeats inside
+    it are absorbed and push its close to window seconds after the repeat,
+    but never later than max_delay after it opened. When it closes, the absorbed alerts go
+    out as one digest, which opens the next window, so a risky conversation
+    that stays on screen costs one message per window instead of one per
+    capture. A repeat whose scoring is higher than any already sent for the
+    key is an escalation: it is sent at once instead of waiting for the
+    digest.
+
+    send(channel, recipient, alerts, total) queues the actual message (one
+    alert, or a digest of total alerts of which the first MAX_DIGEST_ALERTS
+    are listed) and returns its delivery record. Windows are per worker
+    process. With window <= 0 every alert is sent.
+    """
+
+    def __init__(self, send: Callable[[str, str, list[dict], int], dict], window: float = 60, max_delay: float = 300):
+        self.send = send
+        self.window = window
+        self.max_delay = max(max_delay, window)
+        self._windows: dict[tuple, _Window] = {}
+        self.received = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.digests = 0
+        self.escalated = 0
+        self.dropped = 0
+
+    def submit(self, channel: str, recipient: str, alert: dict) -> dict:
+        """
+        Sends or absorbs an alert ({"scoring", "reason", "type"}; scoring is
+        optional). Returns {"status": "queued" | "coalesced", "delivery_id"}; for a coalesced
+        alert delivery_id is the message already sent for the key. Errors
+        of send (e.g. a full notification queue) propagate.
+        """
+        self.received += 1
+        now = time.monotonic()
+        alert = {**alert, "received_at": time.time()}
+        if self.window <= 0:
+            delivery = self.send(channel, recipient, [alert], 1)
+            self.sent += 1
+            return {"status": delivery["status"], "delivery_id": delivery["id"]}
+
+        key = (channel, recipient, alert.get("type", ""), reason_fingerprint(alert.get("reason", "")))
+        scoring = alert.get("scoring") or 0
+        window = self._windows.get(key)
+        if window is not None and scoring > window.max_scoring:
+            # Escalation: never hold a higher risk back for the digest
+            delivery = self.send(channel, recipient, [alert], 1)
+            self.sent += 1
+            self.escalated += 1
+            window.max_scoring = scoring
+            window.delivery_id = delivery["id"]
+            return {"status": delivery["status"], "delivery_id": delivery["id"]}
+
+        if window is not None:
+            window.count += 1
+            if len(window.alerts) < MAX_DIGEST_ALERTS:
+                window.alerts.append(alert)
+            if window.max_alert is None or scoring > (window.max_alert.get("scoring") or 0):
+                window.max_alert = alert
+            window.deadline = min(now + self.window, window.opened + self.max_delay)
+            self.coalesced += 1
+            return {"status": "coalesced", "delivery_id": window.delivery_id}
+
+        delivery = self.send(channel, recipient, [alert], 1)
+        self.sent += 1
+        window = self._windows[key] = _Window(key, channel, recipient, delivery["id"], scoring, now, self.window)
+        # Fresh context: the flush outlives the request that opened the window
+        window.task = asyncio.get_running_loop().create_task(self._run(window), context=contextvars.Context())
+        return {"status": delivery["status"], "delivery_id": delivery["id"]}
+
+    async def _run(self, window: _Window) -> None:
+        try:
+            while True:
+                while (delay := window.deadline - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+                if not window.count:
+                    return
+                self._flush(window)
+        finally:
+            if self._windows.get(window.key) is window:
+                del self._windows[window.key]
+
+    def _flush(self, window: _Window) -> None:
+        """Sends the absorbed alerts as one digest and starts the next window."""
+        alerts, count = window.alerts, window.count
+        # Past the cap the highest scoring alert may not be listed; it goes last
+        if window.max_alert is not None and not any(alert is window.max_alert for alert in alerts):
+            alerts = alerts + [window.max_alert]
+        window.alerts, window.count, window.max_alert = [], 0, None
+        now = time.monotonic()
+        window.opened, window.deadline = now, now + self.window
+        try:
+            delivery = self.send(window.channel, window.recipient, alerts, count)
+        except Exception:
+            self.dropped += count
+            return
+        window.delivery_id = delivery["id"]
+        self.digests += 1
+
+    async def flush_all(self) -> None:
+        """Sends every pending digest now (shutdown)."""
+        windows = list(self._windows.values())
+        for window in windows:
+            if window.count:
+                self._flush(window)
+            window.task.cancel()
+        await asyncio.gather(*(window.task for window in windows), return_exceptions=True)
+        self._windows.clear()
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window,
+            "max_delay_seconds": self.max_delay,
+            "open_windows": len(self._windows),
+            "received": self.received,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "digests": self.digests,
+            "escalated": self.escalated,
+            "dropped": self.dropped,
+        }
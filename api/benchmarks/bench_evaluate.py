@@ -0,0 +1,367 @@
+"""
+Offline load test for /evaluate.
+
+Starts the local upstream stand-ins (stub_upstreams.py) and the API itself
+(uvicorn main:app) pointed at them, drives /evaluate with a synthetic
+screenshot workload at a fixed concurrency and reports throughput, client
+latency percentiles, per-stage server latency (from /metrics), cache hit
+rates, upstream calls and the API's memory. No AWS or Anthropic calls are
+made, so it runs on a laptop or in CI.
+
+Usage (from the api/ directory):
+    uv run python benchmarks/bench_evaluate.py
+    uv run python benchmarks/bench_evaluate.py --requests 500 --concurrency 32 --duplicate-ratio 0.3
+    uv run python benchmarks/bench_evaluate.py --claude-median-ms 1500 --claude-capacity 10 --max-p99-ms 8000
+
+Options not listed in --help (e.g. --claude-median-ms, --textract-error-rate)
+are passed to stub_upstreams.py. With --max-p99-ms / --min-throughput the
+exit status is 1 when the run misses them (CI regression gate).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench_preprocessing import encode, render_chat_screenshot
+
+API_DIR = Path(__file__).resolve().parent.parent
+STARTUP_TIMEOUT = 60
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# Server-side histograms reported per stage: (title, metric, label filter)
+STAGES = [
+    ("request /evaluate", "http_request_duration_seconds", {"route": "/evaluate"}),
+    ("cache lookup", "cache_lookup_duration_seconds", {}),
+    ("preprocessing", "pipeline_stage_duration_seconds", {"stage": "preprocessing"}),
+    ("ocr", "ocr_duration_seconds", {}),
+    ("claude (stage)", "pipeline_stage_duration_seconds", {"stage": "claude"}),
+    ("claude haiku call", "claude_call_duration_seconds", {"model": "haiku"}),
+    ("claude sonnet call", "claude_call_duration_seconds", {"model": "sonnet"}),
+    ("limiter wait claude", "limiter_wait_seconds", {"limiter": "claude"}),
+    ("limiter wait textract", "limiter_wait_seconds", {"limiter": "textract"}),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(args: list[str], env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=API_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, log_path: Path) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited during startup, see {log_path}:\n{log_path.read_text()[-2000:]}")
+        try:
+            if (await client.get(url, timeout=1)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {STARTUP_TIMEOUT}s, see {log_path}")
+
+
+def memory_kb(pid: int) -> dict:
+    """Current and peak RSS of a process (Linux /proc; empty elsewhere)."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return {}
+    fields = dict(line.split(":", 1) for line in status.splitlines() if ":" in line)
+    return {key: int(fields[field].split()[0]) for key, field in (("rss_kb", "VmRSS"), ("peak_rss_kb", "VmHWM"))
+            if field in fields}
+
+
+def parse_metrics(text: str) -> dict[tuple[str, tuple], float]:
+    """Prometheus text format into {(sample name, sorted labels): value}."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE_RE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, tuple(sorted(LABEL_RE.findall(labels or ""))))] = float(value)
+    return samples
+
+
+def diff_metrics(after: dict, before: dict) -> dict:
+    """Counters and histogram buckets accumulated between two scrapes."""
+    return {key: value - before.get(key, 0.0) for key, value in after.items()}
+
+
+def histogram(samples: dict, metric: str, match: dict) -> tuple[list[tuple[float, float]], float, float]:
+    """Buckets (le, cumulative count) summed over the label sets that match, plus count and sum."""
+    buckets: dict[float, float] = {}
+    count = total = 0.0
+    for (name, labels), value in samples.items():
+        label_map = dict(labels)
+        if any(label_map.get(key) != wanted for key, wanted in match.items()):
+            continue
+        if name == f"{metric}_bucket":
+            le = float("inf") if label_map["le"] == "+Inf" else float(label_map["le"])
+            buckets[le] = buckets.get(le, 0.0) + value
+        elif name == f"{metric}_count":
+            count += value
+        elif name == f"{metric}_sum":
+            total += value
+    return sorted(buckets.items()), count, total
+
+
+def histogram_quantile(q: float, buckets: list[tuple[float, float]]) -> float | None:
+    """Quantile by linear interpolation inside the bucket, like PromQL histogram_quantile."""
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if cumulative == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (cumulative - lower_count)
+        lower_bound, lower_count = bound, cumulative
+    return lower_bound
+
+
+def counter(samples: dict, metric: str, match: dict | None = None) -> float:
+    match = match or {}
+    return sum(
+        value for (name, labels), value in samples.items()
+        if name == metric and all(dict(labels).get(key) == wanted for key, wanted in match.items())
+    )
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def build_workload(args: argparse.Namespace) -> tuple[list[bytes], list[int]]:
+    """Unique screenshots and the order they are sent in (with re-sends of earlier ones)."""
+    width, height = (int(v) for v in args.resolution.split("x"))
+    images = [encode(render_chat_screenshot(width, height, seed=args.seed * 10_000 + i), "PNG")
+              for i in range(args.unique)]
+    rng = random.Random(args.seed)
+    order, sent = [], []
+    next_new = 0
+    for _ in range(args.warmup + args.requests):
+        if sent and (rng.random() < args.duplicate_ratio or next_new >= len(images)):
+            order.append(rng.choice(sent))
+        else:
+            order.append(next_new)
+            sent.append(next_new)
+            next_new += 1
+    return images, order
+
+
+async def drive(client: httpx.AsyncClient, url: str, images: list[bytes], order: list[int], concurrency: int):
+    """Sends the workload with concurrency requests in flight; returns (latency_ms, status) per request."""
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for index in order:
+        queue.put_nowait(index)
+    results = []
+
+    async def worker() -> None:
+        while not queue.empty():
+            index = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, files={"file": (f"{index}.png", images[index], "image/png")})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results.append(((time.perf_counter() - start) * 1000, status))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def format_ms(value: float | None) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+async def run(args: argparse.Namespace, stub_args: list[str]) -> dict:
+    stub_port, api_port = free_port(), free_port()
+    stub_url, api_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{api_port}"
+    log_dir = Path(tempfile.mkdtemp(prefix="bench_evaluate_"))
+
+    env = {**os.environ}
+    # Defaults of a clean deployment unless the caller overrides them
+    env.setdefault("CACHE_BACKEND", "memory")
+    env.setdefault("BENIGN_GATE_MODEL_PATH", str(log_dir / "no_benign_gate.npz"))
+    env.update({
+        "ANTHROPIC_API_KEY": "bench",
+        "ANTHROPIC_API_URL": stub_url,
+        "ANTHROPIC_BASE_URL": stub_url,
+        "TEXTRACT_ENDPOINT_URL": stub_url,
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_REGION": "us-east-1",
+    })
+
+    print(f"Rendering {args.unique} screenshots ({args.resolution})...")
+    images, order = build_workload(args)
+
+    stub = start_process([sys.executable, str(Path(__file__).parent / "stub_upstreams.py"),
+                          "--port", str(stub_port), "--seed", str(args.seed), *stub_args], env, log_dir / "stub.log")
+    api = start_process([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                         "--port", str(api_port), "--log-level", "warning"], env, log_dir / "api.log")
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client, stub_url, stub, log_dir / "stub.log")
+            await wait_ready(client, f"{api_url}/health", api, log_dir / "api.log")
+            memory_start = memory_kb(api.pid)
+
+            if args.warmup:
+                await drive(client, f"{api_url}/evaluate", images, order[:args.warmup], args.concurrency)
+            before = parse_metrics((await client.get(f"{api_url}/metrics")).text)
+            stub_before = (await client.get(f"{stub_url}/stats")).json()
+
+            start = time.perf_counter()
+            results = await drive(client, f"{api_url}/evaluate", images, order[args.warmup:], args.concurrency)
+            elapsed = time.perf_counter() - start
+
+            samples = diff_metrics(parse_metrics((await client.get(f"{api_url}/metrics")).text), before)
+            stub_after = (await client.get(f"{stub_url}/stats")).json()
+            memory_end = memory_kb(api.pid)
+    finally:
+        for process in (api, stub):
+            process.terminate()
+        for process in (api, stub):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    latencies = [latency for latency, status in results if status == 200]
+    statuses: dict[str, int] = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    stages = {}
+    for title, metric, match in STAGES:
+        buckets, count, total = histogram(samples, metric, match)
+        if count:
+            stages[title] = {
+                "count": int(count),
+                "avg_ms": total / count * 1000,
+                **{f"p{int(q * 100)}_ms": histogram_quantile(q, buckets) * 1000 for q in (0.5, 0.95, 0.99)},
+            }
+
+    lookups = counter(samples, "cache_lookups_total")
+    near_lookups = counter(samples, "near_duplicate_lookups_total", {"pipeline": "unified"})
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "json"} | {"stub_args": stub_args},
+        "requests": len(results),
+        "statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=None),
+        },
+        "stages": stages,
+        "cache": {
+            "response_hit_rate": counter(samples, "cache_lookups_total", {"result": "hit"}) / lookups if lookups else 0.0,
+            "near_duplicate_hit_rate": (
+                counter(samples, "near_duplicate_lookups_total", {"pipeline": "unified", "result": "hit"}) / near_lookups
+                if near_lookups else 0.0
+            ),
+        },
+        "claude": {
+            "hedges": counter(samples, "claude_hedges_total"),
+            "fallbacks": counter(samples, "claude_fallbacks_total"),
+            "batches": counter(samples, "llm_batches_total"),
+            "deadline_exceeded": counter(samples, "request_deadline_exceeded_total"),
+        },
+        "upstreams": {
+            name: {key: stub_after[name][key] - stub_before[name].get(key, 0) for key in ("calls", "throttled", "errors")}
+            for name in stub_after
+        },
+        "memory": {"start": memory_start, "end": memory_end},
+        "logs": str(log_dir),
+    }
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(f"\nRequests: {report['requests']} in {report['elapsed_s']:.1f}s "
+          f"-> {report['throughput_rps']:.1f} req/s   statuses: {report['statuses']}")
+    print(f"Client latency ms: p50 {format_ms(latency['p50'])}  p95 {format_ms(latency['p95'])}  "
+          f"p99 {format_ms(latency['p99'])}  max {format_ms(latency['max'])}")
+
+    print(f"\n{'stage':<24}{'count':>8}{'avg ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for title, stage in report["stages"].items():
+        print(f"{title:<24}{stage['count']:>8}{format_ms(stage['avg_ms']):>10}{format_ms(stage['p50_ms']):>10}"
+              f"{format_ms(stage['p95_ms']):>10}{format_ms(stage['p99_ms']):>10}")
+
+    cache = report["cache"]
+    print(f"\nCache hit rate: response {cache['response_hit_rate']:.1%}, "
+          f"near-duplicate {cache['near_duplicate_hit_rate']:.1%}")
+    print(f"Claude: {report['claude']}")
+    print(f"Upstream calls: {report['upstreams']}")
+    memory = report["memory"]
+    if memory["end"]:
+        print(f"API memory: RSS {memory['start'].get('rss_kb', 0) / 1024:.0f} -> "
+              f"{memory['end'].get('rss_kb', 0) / 1024:.0f} MB, peak {memory['end'].get('peak_rss_kb', 0) / 1024:.0f} MB")
+    print(f"Logs: {report['logs']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--unique", type=int, default=60, help="Distinct screenshots in the workload")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="Share of re-sent screenshots")
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--timeout", type=float, default=90, help="Client timeout per request (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report as JSON to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if client p99 latency is above this")
+    parser.add_argument("--min-throughput", type=float, help="Fail if requests/s is below this")
+    args, stub_args = parser.parse_known_args()
+
+    report = asyncio.run(run(args, stub_args))
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+    failures = []
+    p99 = report["latency_ms"]["p99"]
+    if args.max_p99_ms is not None and (p99 is None or p99 > args.max_p99_ms):
+        failures.append(f"p99 {format_ms(p99)} ms > {args.max_p99_ms} ms")
+    if args.min_throughput is not None and report["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']:.1f} req/s < {args.min_throughput}")
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark for the image preprocessing stage (image_preprocessing.preprocess_image).
+
+Runs over a corpus of typical screenshot resolutions and reports ms/image and
+output bytes for the current engine and for the previous implementation
+(full decode + Lanczos resize + optimized JPEG), plus pool throughput.
+
+Usage (from the api/ directory):
+    uv run python benchmarks/bench_preprocessing.py
+    uv run python benchmarks/bench_preprocessing.py --corpus ~/screenshots --repeat 10
+"""
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_preprocessing import PreprocessingPool, preprocess_image  # noqa: E402
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "retina-15": (2880, 1800),
+    "4k": (3840, 2160),
+    "retina-5k": (5120, 2880),
+}
+
+WORDS = (
+    "hola mamá perdí mi teléfono este es mi número nuevo transferir urgente cuenta "
+    "banco verificar contraseña código enlace premio seguridad mensaje reunión mañana"
+).split()
+
+
+def render_chat_screenshot(width: int, height: int, seed: int) -> Image.Image:
+    """Synthetic chat/web screenshot: browser chrome, sidebar and text bubbles."""
+    rng = random.Random(seed)
+    scale = width / 1920
+    font = ImageFont.load_default(size=max(12, int(16 * scale)))
+    image = Image.new("RGB", (width, height), (239, 234, 226))
+    draw = ImageDraw.Draw(image)
+
+    chrome = int(88 * scale)
+    draw.rectangle((0, 0, width, chrome), fill=(222, 225, 230))
+    draw.rounded_rectangle((int(160 * scale), int(48 * scale), int(1400 * scale), int(78 * scale)),
+                           radius=int(12 * scale), fill=(255, 255, 255))
+    draw.text((int(180 * scale), int(52 * scale)), "https://web.whatsapp.com/", fill=(40, 40, 40), font=font)
+
+    sidebar = int(480 * scale)
+    draw.rectangle((0, chrome, sidebar, height), fill=(255, 255, 255))
+    line_height = int(28 * scale)
+    for row, y in enumerate(range(chrome + line_height, height - line_height, line_height * 3)):
+        draw.text((int(24 * scale), y), f"Contacto {row}", fill=(20, 20, 20), font=font)
+        draw.text((int(24 * scale), y + line_height), " ".join(rng.choices(WORDS, k=5)),
+                  fill=(110, 110, 110), font=font)
+
+    y = chrome + line_height
+    while y < height - 3 * line_height:
+        words = " ".join(rng.choices(WORDS, k=rng.randint(4, 14)))
+        text_width = int(draw.textlength(words, font=font))
+        incoming = rng.random() < 0.5
+        x = sidebar + int(40 * scale) if incoming else width - text_width - int(80 * scale)
+        fill = (255, 255, 255) if incoming else (217, 253, 211)
+        draw.rounded_rectangle((x - 12, y - 6, x + text_width + 12, y + line_height + 4),
+                               radius=int(8 * scale), fill=fill)
+        draw.text((x, y), words, fill=(17, 27, 33), font=font)
+        y += line_height * 2
+    return image
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def legacy_optimize(image_bytes: bytes, max_width: int = 1500, jpeg_quality: int = 85) -> bytes:
+    """Previous optimize_image_for_textract, kept as the benchmark baseline."""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.width > max_width:
+        new_height = int(max_width * image.height / image.width)
+        image = image.resize((max_width, new_height), Image.Resampling.LANCZOS)
+    if image.mode != 'L':
+        image = image.convert('L')
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format='JPEG', quality=jpeg_quality, optimize=True)
+    return output_buffer.getvalue()
+
+
+def build_corpus(corpus_dir: str | None, per_resolution: int) -> list[tuple[str, bytes]]:
+    if corpus_dir:
+        paths = sorted(p for p in Path(corpus_dir).expanduser().iterdir()
+                       if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+        return [(p.name, p.read_bytes()) for p in paths]
+
+    corpus = []
+    for name, (width, height) in RESOLUTIONS.items():
+        for index in range(per_resolution):
+            image = render_chat_screenshot(width, height, seed=index)
+            corpus.append((f"{name}.png", encode(image, "PNG")))
+            corpus.append((f"{name}.jpg", encode(image, "JPEG")))
+    return corpus
+
+
+def measure(fn, image_bytes: bytes, repeat: int) -> tuple[list[float], int]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(image_bytes)
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(output)
+    return timings, size
+
+
+def report_latency(corpus: list[tuple[str, bytes]], repeat: int) -> None:
+    engine = lambda data: preprocess_image(data, width_threshold=0).data  # noqa: E731
+
+    print(f"{'image':<16}{'input KB':>10}{'legacy ms':>11}{'legacy KB':>11}{'engine ms':>11}{'engine KB':>11}{'speedup':>9}")
+    grouped: dict[str, list] = {}
+    for name, image_bytes in corpus:
+        grouped.setdefault(name, []).append(image_bytes)
+
+    for name, items in grouped.items():
+        legacy_ms, engine_ms, legacy_kb, engine_kb = [], [], [], []
+        for image_bytes in items:
+            timings, size = measure(legacy_optimize, image_bytes, repeat)
+            legacy_ms += timings
+            legacy_kb.append(size / 1024)
+            timings, size = measure(engine, image_bytes, repeat)
+            engine_ms += timings
+            engine_kb.append(size / 1024)
+
+        input_kb = statistics.mean(len(b) for b in items) / 1024
+        legacy_p50 = statistics.median(legacy_ms)
+        engine_p50 = statistics.median(engine_ms)
+        print(f"{name:<16}{input_kb:>10.0f}{legacy_p50:>11.1f}{statistics.mean(legacy_kb):>11.0f}"
+              f"{engine_p50:>11.1f}{statistics.mean(engine_kb):>11.0f}{legacy_p50 / engine_p50:>8.2f}x")
+
+
+async def report_throughput(corpus: list[tuple[str, bytes]], workers: int, rounds: int) -> None:
+    jobs = [image_bytes for _, image_bytes in corpus] * rounds
+    for mode in ("thread", "process"):
+        pool = PreprocessingPool(mode=mode, workers=workers)
+        pool.start()
+        # Warm up the workers (imports, encoder probing) before timing
+        await asyncio.gather(*(pool.run(b, width_threshold=0) for b in jobs[:workers]))
+        start = time.perf_counter()
+        await asyncio.gather(*(pool.run(b, width_threshold=0) for b in jobs))
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        print(f"{mode:<8} workers={workers:<3} {len(jobs) / elapsed:>7.1f} images/s "
+              f"({elapsed * 1000 / len(jobs):.1f} ms/image wall)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory with real screenshots (png/jpg) instead of the synthetic corpus")
+    parser.add_argument("--per-resolution", type=int, default=2, help="Synthetic screenshots per resolution")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per image")
+    parser.add_argument("--workers", type=int, default=4, help="Pool workers for the throughput run")
+    parser.add_argument("--rounds", type=int, default=2, help="Passes over the corpus for the throughput run")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.corpus, args.per_resolution)
+    print(f"Corpus: {len(corpus)} images\n")
+    report_latency(corpus, args.repeat)
+    print()
+    asyncio.run(report_throughput(corpus, args.workers, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
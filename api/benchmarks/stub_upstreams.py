@@ -0,0 +1,222 @@
+"""
+Local stand-ins for the upstream APIs of /evaluate, for offline load tests.
+
+One HTTP server plays both upstreams:
+- AWS Textract detect_document_text (JSON protocol, POST / with
+  X-Amz-Target: Textract.DetectDocumentText). The returned lines are derived
+  from the image hash, so the same screenshot always yields the same text.
+- The Anthropic messages API (POST /v1/messages). It answers the forced
+  tool call of with_structured_output with schema-shaped input, one verdict
+  per "<<<TEXTO N ...>>>" block for batched calls, and reports token usage.
+
+Each upstream has a lognormal latency (median and sigma), a random error
+rate and a capacity: calls beyond capacity in flight are throttled
+(ThrottlingException / HTTP 429) like the real services do.
+
+Usage (from the api/ directory):
+    uv run python benchmarks/stub_upstreams.py --port 9100 --claude-median-ms 800 --textract-capacity 20
+Then start the API with TEXTRACT_ENDPOINT_URL and ANTHROPIC_BASE_URL set to
+http://127.0.0.1:9100 (bench_evaluate.py does all of this).
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+WORDS = (
+    "hola equipo reunión mañana informe ventas presentación proyecto revisar correo calendario "
+    "documento cliente pedido factura entrega saludos gracias semana oficina horario"
+).split()
+RISKY_LINES = [
+    "Su cuenta ha sido bloqueada, verifique su contraseña en el siguiente enlace",
+    "Hola mamá, perdí mi teléfono, este es mi número nuevo, necesito una transferencia urgente",
+    "Ganaste un premio, ingresa los datos de tu tarjeta para recibirlo",
+]
+
+
+@dataclass
+class UpstreamProfile:
+    median_ms: float
+    sigma: float
+    error_rate: float
+    capacity: int
+    inflight: int = 0
+    calls: int = 0
+    throttled: int = 0
+    errors: int = 0
+
+    def latency(self) -> float:
+        return random.lognormvariate(0, self.sigma) * self.median_ms / 1000
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "inflight": self.inflight,
+        }
+
+
+def ocr_lines(image_bytes: bytes, risky_ratio: float) -> list[str]:
+    """Deterministic text for an image: a few lines of ordinary words, sometimes a risky one."""
+    seed = int.from_bytes(hashlib.sha256(image_bytes).digest()[:8], "big")
+    rng = random.Random(seed)
+    lines = [" ".join(rng.choices(WORDS, k=rng.randint(4, 10))) for _ in range(rng.randint(3, 12))]
+    if rng.random() < risky_ratio:
+        lines.insert(rng.randrange(len(lines)), rng.choice(RISKY_LINES))
+    return lines
+
+
+def fill_schema(schema: dict, defs: dict, text: str, index: int = 1):
+    """Schema-shaped value for a tool input (integers in range, short strings, one item per text)."""
+    if "$ref" in schema:
+        return fill_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, text, index)
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: index if name == "index" else fill_schema(prop, defs, text, index)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = max(text.count("<<<TEXTO "), 1)
+        return [fill_schema(schema.get("items", {}), defs, text, i) for i in range(1, count + 1)]
+    if kind == "integer":
+        return random.randint(schema.get("minimum", 1), schema.get("maximum", 10))
+    if kind == "number":
+        return random.random()
+    if kind == "boolean":
+        return False
+    return "Revisión automática"
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    textract = UpstreamProfile(args.textract_median_ms, args.textract_sigma, args.textract_error_rate, args.textract_capacity)
+    claude = UpstreamProfile(args.claude_median_ms, args.claude_sigma, args.claude_error_rate, args.claude_capacity)
+    app = FastAPI()
+
+    async def call(profile: UpstreamProfile) -> str | None:
+        """Simulates the upstream; returns None on success or the failure kind."""
+        profile.calls += 1
+        if profile.inflight >= profile.capacity:
+            profile.throttled += 1
+            await asyncio.sleep(0.005)
+            return "throttled"
+        profile.inflight += 1
+        try:
+            await asyncio.sleep(profile.latency())
+        finally:
+            profile.inflight -= 1
+        if random.random() < profile.error_rate:
+            profile.errors += 1
+            return "error"
+        return None
+
+    @app.get("/")
+    async def root():
+        return {"stub": True}
+
+    @app.get("/stats")
+    async def stats():
+        return {"textract": textract.stats(), "claude": claude.stats()}
+
+    @app.post("/")
+    async def textract_api(request: Request):
+        target = request.headers.get("X-Amz-Target", "")
+        if not target.endswith("DetectDocumentText"):
+            return JSONResponse({"__type": "UnknownOperationException"}, status_code=400)
+        body = json.loads(await request.body())
+        failure = await call(textract)
+        if failure == "throttled":
+            return JSONResponse({"__type": "ThrottlingException", "message": "Rate exceeded"}, status_code=400)
+        if failure == "error":
+            return JSONResponse({"__type": "InternalServerError", "message": "Stub error"}, status_code=500)
+        lines = ocr_lines(base64.b64decode(body["Document"]["Bytes"]), args.risky_ratio)
+        return {
+            "DocumentMetadata": {"Pages": 1},
+            "Blocks": [
+                {
+                    "BlockType": "LINE",
+                    "Text": line,
+                    "Confidence": 99.0,
+                    # Lines stacked top to bottom (incremental OCR merges by position)
+                    "Geometry": {"BoundingBox": {
+                        "Left": 0.05, "Top": i / len(lines), "Width": 0.6, "Height": 0.8 / len(lines),
+                    }},
+                }
+                for i, line in enumerate(lines)
+            ],
+        }
+
+    @app.post("/v1/messages")
+    async def messages_api(request: Request):
+        body = await request.json()
+        failure = await call(claude)
+        if failure == "throttled":
+            return JSONResponse(
+                {"type": "error", "error": {"type": "rate_limit_error", "message": "Stub rate limit"}}, status_code=429
+            )
+        if failure == "error":
+            return JSONResponse(
+                {"type": "error", "error": {"type": "overloaded_error", "message": "Stub overloaded"}}, status_code=529
+            )
+
+        text = json.dumps(body.get("messages", []), ensure_ascii=False)
+        system = json.dumps(body.get("system", ""), ensure_ascii=False)
+        tool = body["tools"][0]
+        schema = tool["input_schema"]
+        # Steady state: the system prefix is always served from the prompt cache
+        prefix_tokens = len(system) // 4
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": [{
+                "type": "tool_use",
+                "id": f"toolu_{uuid.uuid4().hex}",
+                "name": tool["name"],
+                "input": fill_schema(schema, schema.get("$defs", {}), text),
+            }],
+            "stop_reason": "tool_use",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": len(text) // 4,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": prefix_tokens,
+                "output_tokens": 40,
+            },
+        }
+
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--risky-ratio", type=float, default=0.2, help="Share of screenshots with a risky line")
+    for name, median, capacity in (("textract", 300, 50), ("claude", 800, 40)):
+        parser.add_argument(f"--{name}-median-ms", type=float, default=median)
+        parser.add_argument(f"--{name}-sigma", type=float, default=0.4, help="Lognormal sigma (tail weight)")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{name}-capacity", type=int, default=capacity, help="In-flight calls before throttling")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    random.seed(args.seed)
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
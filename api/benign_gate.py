@@ -0,0 +1,278 @@
+"""
+Benign-screen gate: a local linear classifier on OCR text that recognises
+ordinary, clearly safe screens so /evaluate can answer them without Claude.
+
+Features are hashed word unigrams/bigrams and character trigrams (hashing
+trick, no vocabulary to ship); the model is a logistic regression trained
+offline from (text, UnifiedEvaluation) pairs logged by the API.
+
+Training (from the api/ directory):
+    uv run python benign_gate.py --data .cache/verdicts.jsonl --out .cache/benign_gate.npz
+"""
+import argparse
+import json
+import math
+import queue
+import random
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from text_cache import normalize_text
+
+# 2^18 hashed feature buckets
+FEATURE_BITS = 18
+# Verdicts with a score at or below this are labelled benign when training
+BENIGN_MAX_SCORE = 3
+# Texts shorter than this are never gated (too little signal)
+MIN_TOKENS = 8
+
+
+def extract_features(text: str, bits: int = FEATURE_BITS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed feature vector of a text as (indexes, values), L2-normalized.
+    crc32 keeps the hashes stable across processes and machines.
+    """
+    tokens = normalize_text(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    joined = " ".join(tokens)
+    features += [f"#{joined[i:i + 3]}" for i in range(len(joined) - 2)]
+
+    mask = (1 << bits) - 1
+    counts: dict[int, float] = {}
+    for feature in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        # Sign bit halves the bias of hash collisions
+        sign = 1.0 if h & 0x80000000 else -1.0
+        index = h & mask
+        counts[index] = counts.get(index, 0.0) + sign
+
+    indexes = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return indexes, values
+
+
+class BenignGate:
+    """
+    Decides whether a text is clearly benign.
+
+    should_skip(text) returns the benign probability when it reaches
+    threshold (the LLM call can be skipped), None otherwise. Without a
+    trained model the gate never skips.
+    """
+
+    def __init__(self, threshold: float = 0.97):
+        self.threshold = threshold
+        self.weights: np.ndarray | None = None
+        self.bias = 0.0
+        self.bits = FEATURE_BITS
+        self.metadata: dict = {}
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.skipped = 0
+        self.total_ns = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.weights is not None
+
+    def load(self, path: str) -> None:
+        with np.load(path, allow_pickle=False) as data:
+            self.weights = data["weights"]
+            self.bias = float(data["bias"])
+            self.bits = int(data["bits"])
+            self.metadata = json.loads(str(data["metadata"]))
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            bits=self.bits,
+            metadata=json.dumps(self.metadata),
+        )
+
+    def probability(self, text: str) -> float:
+        """Probability that text is benign."""
+        indexes, values = extract_features(text, self.bits)
+        score = float(self.weights[indexes] @ values) + self.bias
+        return 1.0 / (1.0 + math.exp(-max(min(score, 50.0), -50.0)))
+
+    def should_skip(self, text: str) -> float | None:
+        if self.weights is None or len(text.split()) < MIN_TOKENS:
+            return None
+        start = time.perf_counter_ns()
+        probability = self.probability(text)
+        skip = probability >= self.threshold
+        with self._lock:
+            self.evaluated += 1
+            self.skipped += skip
+            self.total_ns += time.perf_counter_ns() - start
+        return probability if skip else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "threshold": self.threshold,
+                "evaluated": self.evaluated,
+                "skipped": self.skipped,
+                "skip_ratio": round(self.skipped / self.evaluated, 4) if self.evaluated else 0.0,
+                "avg_us": round(self.total_ns / self.evaluated / 1000, 1) if self.evaluated else 0.0,
+                "model": self.metadata,
+            }
+
+
+class VerdictLog:
+    """
+    Appends (text, verdict) pairs to a JSON-lines file: the training data of
+    the gate. append() only queues the line; a writer thread appends queued
+    lines in batches, so the event loop never waits on the disk. When
+    max_pending lines are already waiting, new ones are dropped.
+    """
+
+    def __init__(self, path: str | None, max_pending: int = 10_000):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._writer: threading.Thread | None = None
+        self.written = 0
+        self.dropped = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, text: str, verdict) -> None:
+        if not self.path:
+            return
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name="verdict-log-writer", daemon=True)
+            self._writer.start()
+        line = json.dumps({"text": text, **verdict.model_dump()}, ensure_ascii=False)
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run_writer(self) -> None:
+        while True:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in lines
+            lines = [line for line in lines if line is not None]
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(line + "\n" for line in lines))
+                self.written += len(lines)
+            except OSError:
+                self.dropped += len(lines)
+            if stop:
+                return
+
+    def close(self) -> None:
+        """Writes the queued lines, then stops the writer thread."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+
+def load_pairs(path: str) -> list[tuple[str, int]]:
+    """Reads a verdict log into (text, label) pairs, label 1 = benign."""
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            pairs.append((record["text"], int(record["scoring"] <= BENIGN_MAX_SCORE)))
+    return pairs
+
+
+def train(
+    pairs: list[tuple[str, int]],
+    epochs: int = 8,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6,
+    bits: int = FEATURE_BITS,
+    seed: int = 0,
+) -> BenignGate:
+    """Logistic regression by SGD with AdaGrad step sizes over hashed features."""
+    rng = random.Random(seed)
+    samples = [(extract_features(text, bits), label) for text, label in pairs]
+    weights = np.zeros(1 << bits)
+    squared = np.full(1 << bits, 1e-8)
+    bias, bias_squared = 0.0, 1e-8
+
+    for _ in range(epochs):
+        rng.shuffle(samples)
+        for (indexes, values), label in samples:
+            score = float(weights[indexes] @ values) + bias
+            prediction = 1.0 / (1.0 + math.exp(-max(min(score, 50.0), -50.0)))
+            error = prediction - label
+            gradient = error * values + l2 * weights[indexes]
+            squared[indexes] += gradient ** 2
+            weights[indexes] -= learning_rate * gradient / np.sqrt(squared[indexes])
+            bias_squared += error ** 2
+            bias -= learning_rate * error / math.sqrt(bias_squared)
+
+    gate = BenignGate()
+    gate.weights = weights.astype(np.float32)
+    gate.bias = bias
+    gate.bits = bits
+    return gate
+
+
+def evaluate(gate: BenignGate, pairs: list[tuple[str, int]], thresholds: list[float]) -> list[dict]:
+    """Skip ratio and missed-risk ratio (risky texts skipped) per threshold."""
+    probabilities = [(gate.probability(text), label) for text, label in pairs]
+    risky = sum(1 for _, label in probabilities if label == 0)
+    rows = []
+    for threshold in thresholds:
+        skipped = [label for probability, label in probabilities if probability >= threshold]
+        missed = sum(1 for label in skipped if label == 0)
+        rows.append({
+            "threshold": threshold,
+            "skip_ratio": round(len(skipped) / len(probabilities), 4) if probabilities else 0.0,
+            "missed_risky": missed,
+            "missed_risky_ratio": round(missed / risky, 4) if risky else 0.0,
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", required=True, help="Verdict log (JSON lines with text and scoring)")
+    parser.add_argument("--out", required=True, help="Output model file (.npz)")
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of pairs kept for evaluation")
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.data)
+    random.Random(0).shuffle(pairs)
+    split = int(len(pairs) * (1 - args.holdout))
+    train_pairs, test_pairs = pairs[:split], pairs[split:]
+    print(f"{len(train_pairs)} training pairs, {len(test_pairs)} held out, "
+          f"{sum(label for _, label in pairs) / max(len(pairs), 1):.1%} benign")
+
+    gate = train(train_pairs, epochs=args.epochs)
+    print(f"{'threshold':>10}{'skipped':>10}{'missed risky':>14}")
+    for row in evaluate(gate, test_pairs, [0.9, 0.95, 0.97, 0.99, 0.995]):
+        print(f"{row['threshold']:>10}{row['skip_ratio']:>10.1%}{row['missed_risky']:>8} ({row['missed_risky_ratio']:.1%})")
+
+    gate.metadata = {"pairs": len(train_pairs), "trained_at": int(time.time())}
+    gate.save(args.out)
+    print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
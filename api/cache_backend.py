@@ -0,0 +1,326 @@
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from cachetools import TTLCache
+
+
+class CacheBackend:
+    """
+    Interface shared by every response cache backend.
+
+    Values are arbitrary picklable objects (pydantic models, strings); size
+    limits are expressed in bytes of the pickled value.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def value_size(value: Any) -> int:
+    """Byte weight of a cached value (size of its pickled form)."""
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that reports size evictions and TTL expirations to its owner."""
+
+    def __init__(self, owner: "MemoryCacheBackend", maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl, getsizeof=value_size)
+        self._owner = owner
+
+    def popitem(self):
+        item = super().popitem()
+        self._owner.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self._owner.expirations += len(expired)
+        return expired
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process TTL cache bounded by the byte weight of its values."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        super().__init__()
+        self._cache = _CountingTTLCache(self, maxsize=max_bytes, ttl=ttl)
+
+    def get(self, key: str) -> Any | None:
+        value = self._cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            self._cache[key] = value
+        except ValueError:
+            # Single value larger than the whole cache: do not cache it
+            pass
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["bytes"] = self._cache.currsize
+        stats["max_bytes"] = self._cache.maxsize
+        return stats
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    On-disk cache shared by every worker process on the host.
+
+    Uses SQLite in WAL mode, so reads never wait for writers, and survives
+    restarts and deploys. Entries are evicted by TTL and, once the total
+    pickled size exceeds max_bytes, least recently used first.
+
+    Lookups are primary-key reads on a local file (tens of microseconds) and
+    are issued directly from the event loop. Every write (new entries,
+    recency refreshes, sweeps) goes to one writer thread that applies them
+    in batched transactions, so a database locked by another worker never
+    stalls the loop; an entry becomes visible a moment after set() returns.
+    Recency is refreshed at most every TOUCH_INTERVAL seconds per entry.
+    Entry and byte totals are counted by the writer thread at start and on
+    every sweep, so stats() never scans the table from the loop.
+
+    Values are stored pickled and unpickled on read: the database file must
+    only be writable by this service.
+    """
+
+    # Minimum seconds between eviction sweeps in one process
+    SWEEP_INTERVAL = 1.0
+    # Minimum seconds between accessed_at refreshes of one entry
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._writes: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+        self._last_sweep = 0.0
+        self._entries = 0
+        self._bytes = 0
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache (accessed_at)")
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so every worker process gets its own connections
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name="sqlite-cache-writer", daemon=True)
+            self._writer.start()
+
+    def _write(self, statement: str, params: tuple) -> None:
+        self._start_writer()
+        self._writes.put((statement, params))
+
+    def _count(self, conn: sqlite3.Connection) -> int:
+        self._entries, self._bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache"
+        ).fetchone()
+        return self._bytes
+
+    def _run_writer(self) -> None:
+        conn = self._open()
+        try:
+            self._count(conn)
+            while True:
+                batch = [self._writes.get()]
+                while True:
+                    try:
+                        batch.append(self._writes.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                writes = [write for write in batch if write is not None]
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    for statement, params in writes:
+                        conn.execute(statement, params)
+                    now = time.time()
+                    if now - self._last_sweep >= self.SWEEP_INTERVAL:
+                        self._last_sweep = now
+                        self._sweep(conn, now)
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    # Database busy or broken: a cache can lose writes
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Any | None:
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at, accessed_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            # Expired rows are removed by the sweep
+            self.misses += 1
+            return None
+
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            # Entry written by an incompatible version of the models: drop it
+            self._write("DELETE FROM response_cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+        if now - row[2] >= self.TOUCH_INTERVAL:
+            self._write("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO response_cache (key, value, size, expires_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, blob, len(blob), now + self.ttl, now),
+        )
+
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,)).rowcount
+        self.expirations += max(expired, 0)
+
+        total = self._count(conn)
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until back under the byte budget
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM response_cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM response_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+        self._entries -= len(victims)
+        self._bytes -= freed
+
+    def __len__(self) -> int:
+        # As of the last count by the writer thread
+        self._start_writer()
+        return self._entries
+
+    def close(self) -> None:
+        """Applies pending writes, then closes the connections."""
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        stats["path"] = self.path
+        stats["pending_writes"] = self._writes.qsize()
+        return stats
+
+
+def create_cache_backend(kind: str, max_bytes: int, ttl: float, path: str | None = None) -> CacheBackend:
+    """
+    Builds the configured cache backend.
+
+    Args:
+        kind: "memory" (per process) or "sqlite" (shared on-disk file)
+        max_bytes: Byte budget for cached values
+        ttl: Time to live of each entry in seconds
+        path: Database file for the sqlite backend
+    """
+    if kind == "memory":
+        return MemoryCacheBackend(max_bytes=max_bytes, ttl=ttl)
+    if kind == "sqlite":
+        if not path:
+            raise ValueError("The sqlite cache backend requires a database path")
+        return SQLiteCacheBackend(path=path, max_bytes=max_bytes, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {kind}")
@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Minimum intensity step between neighbouring pixels counted as an edge
+EDGE_THRESHOLD = 24
+# Edge pixels a row/column needs to count as text-bearing; dividers and
+# borders only produce one or two per line
+MIN_EDGES_PER_LINE = 4
+# Rows/columns with a standard deviation below this are uniform bands
+UNIFORM_STD = 3.0
+# Browser chrome (tabs, address bar, toolbars) is searched in this top fraction
+MAX_CHROME_FRACTION = 0.2
+# Never crop to less than this fraction of the original area
+MIN_CONTENT_AREA = 0.05
+# Pixels of margin kept around the detected content
+CONTENT_PADDING = 8
+
+
+def _first_last(mask: np.ndarray) -> tuple[int, int] | None:
+    indexes = np.flatnonzero(mask)
+    if indexes.size == 0:
+        return None
+    return int(indexes[0]), int(indexes[-1])
+
+
+def find_chrome_bottom(gray: np.ndarray) -> int:
+    """
+    Finds the row where browser chrome ends, or 0 if none is detected.
+
+    Chrome is recognised by the divider that separates it from the page:
+    a uniform row in the top MAX_CHROME_FRACTION of the screen whose
+    brightness differs from the rows around it (a 1-2px toolbar border), or
+    a uniform band where the background colour changes.
+    """
+    limit = int(gray.shape[0] * MAX_CHROME_FRACTION)
+    if limit < 3:
+        return 0
+
+    top = gray[:limit + 2].astype(np.float32)
+    row_mean = top.mean(axis=1)
+    row_std = top.std(axis=1)
+    uniform = row_std < UNIFORM_STD
+
+    # Divider lines: uniform rows that stand out from both neighbours
+    above = row_mean[:-2]
+    middle = row_mean[1:-1]
+    below = row_mean[2:]
+    is_divider = uniform[1:-1] & (np.abs(middle - above) > 10) & (np.abs(middle - below) > 10)
+    # Background switches: uniform row followed by a differently coloured uniform row
+    is_switch = uniform[1:-1] & uniform[2:] & (np.abs(below - middle) > 12)
+
+    candidates = np.flatnonzero(is_divider | is_switch)
+    if candidates.size == 0:
+        return 0
+    return int(candidates[-1]) + 2
+
+
+def find_content_box(gray: np.ndarray, drop_chrome: bool = False) -> tuple[int, int, int, int] | None:
+    """
+    Locates the text-bearing area of a grayscale screenshot.
+
+    Uses row/column projection profiles of edge pixels: text produces dense
+    edges, while empty margins and uniform bands produce none. Optionally
+    skips detected browser chrome at the top.
+
+    Returns:
+        (left, top, right, bottom) box in pixel coordinates, or None when
+        cropping would not save anything meaningful.
+    """
+    height, width = gray.shape
+    if height < 16 or width < 16:
+        return None
+
+    top_offset = find_chrome_bottom(gray) if drop_chrome else 0
+    region = gray[top_offset:].astype(np.int16)
+
+    # Rows are profiled with horizontal gradients and columns with vertical
+    # ones: glyphs produce both, while straight toolbar borders and panel
+    # dividers only produce edges across their own direction
+    edges_h = np.abs(np.diff(region, axis=1)) > EDGE_THRESHOLD
+    edges_v = np.abs(np.diff(region, axis=0)) > EDGE_THRESHOLD
+    row_profile = edges_h.sum(axis=1)
+    col_profile = edges_v.sum(axis=0)
+
+    rows = _first_last(row_profile >= MIN_EDGES_PER_LINE)
+    cols = _first_last(col_profile >= MIN_EDGES_PER_LINE)
+    if rows is None or cols is None:
+        return None
+
+    left = max(cols[0] - CONTENT_PADDING, 0)
+    right = min(cols[1] + 1 + CONTENT_PADDING, width)
+    top = max(rows[0] + top_offset - CONTENT_PADDING, top_offset)
+    bottom = min(rows[1] + 1 + top_offset + CONTENT_PADDING, height)
+
+    area = (right - left) * (bottom - top)
+    if area >= height * width or area < height * width * MIN_CONTENT_AREA:
+        return None
+    return left, top, right, bottom
+
+
+class CropStats:
+    """
+    Aggregated savings of the cropping stage. Recorded by the API process
+    from preprocessing results, which may come from other threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.cropped = 0
+        self.pixels_in = 0
+        self.pixels_saved = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record_crop(self, pixels_in: int, pixels_out: int) -> None:
+        with self._lock:
+            self.images += 1
+            self.pixels_in += pixels_in
+            if pixels_out < pixels_in:
+                self.cropped += 1
+                self.pixels_saved += pixels_in - pixels_out
+
+    def record_bytes(self, bytes_in: int, bytes_out: int) -> None:
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "cropped": self.cropped,
+                "pixels_saved": self.pixels_saved,
+                "pixels_saved_ratio": round(self.pixels_saved / self.pixels_in, 4) if self.pixels_in else 0.0,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+            }
+
+
+crop_stats = CropStats()
+
+
+def crop_to_content(image: Image.Image, drop_chrome: bool = False) -> Image.Image:
+    """Crops a grayscale ('L') image to its text-bearing area."""
+    box = find_content_box(np.asarray(image), drop_chrome=drop_chrome)
+    if box is None:
+        return image
+    return image.crop(box)
@@ -0,0 +1,202 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+# Headers a client uses to say which app and window a frame comes from
+CLIENT_APP_HEADER = "X-Client-App"
+CLIENT_WINDOW_HEADER = "X-Client-Window"
+
+# Apps whose frames are scored as conversations (matched as substrings of
+# the reported app, so "WhatsApp Desktop" and "org.telegram.messenger" count)
+DEFAULT_CHAT_APPS = ("whatsapp", "telegram", "messenger", "signal", "instagram", "discord", "slack", "teams")
+
+# A line needs a word of at least this many letters to be worth evaluating
+# (timestamps, read receipts and counters are marked seen but never sent)
+MIN_WORD_LETTERS = 3
+_WORD_RE = re.compile(rf"[^\W\d_]{{{MIN_WORD_LETTERS},}}")
+
+
+def conversation_key(
+    client_id: str | None, app: str | None, window: str | None, chat_apps: tuple[str, ...] = DEFAULT_CHAT_APPS
+) -> str | None:
+    """Key of the conversation a frame belongs to, or None if it does not come from a chat app."""
+    if not client_id or not app:
+        return None
+    app = app.strip().lower()
+    if not any(name in app for name in chat_apps):
+        return None
+    return "\x1f".join((client_id, app, (window or "").strip()))
+
+
+def normalize_line(line: str) -> str:
+    """Case, spacing and edge punctuation differences between OCR readings of the same line."""
+    return " ".join(line.lower().split()).strip(" .,;:!?¡¿\"'()[]")
+
+
+class ConversationState:
+    """What a session's conversation looked like after its last evaluated frame."""
+
+    __slots__ = ("seen", "summary", "scoring", "reason", "title", "frames", "evaluations", "last_seen")
+
+    def __init__(self):
+        # Hashes of the normalized lines already evaluated, oldest first
+        self.seen: OrderedDict[int, None] = OrderedDict()
+        self.summary = ""
+        self.scoring = 1
+        self.reason = ""
+        self.title = ""
+        self.frames = 0
+        self.evaluations = 0
+        self.last_seen = time.monotonic()
+
+
+class ConversationStore:
+    """
+    Per-session conversation state for incremental evaluation of chat
+    screenshots: the lines already scored, the latest verdict for the whole
+    conversation and a rolling risk summary written by the model. A new
+    frame only sends its unseen lines plus that summary.
+
+    Sessions are keyed by client, app and window (see conversation_key); a
+    frame that shares no line with its session's state starts it over
+    (another chat shown in the same window).
+
+    Memory is bounded: at most max_sessions sessions (LRU), max_lines line
+    hashes and max_summary_chars of summary each; a session expires ttl
+    seconds after its last frame. State is per worker process.
+
+    Frames of one session are evaluated one at a time: callers hold
+    lock(session_id) from reading the state to recording the verdict, so a
+    slower frame's update cannot overwrite a newer verdict or summary.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl: float = 1800,
+        max_lines: int = 500,
+        max_summary_chars: int = 800,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_lines = max_lines
+        self.max_summary_chars = max_summary_chars
+        self._sessions: OrderedDict[str, ConversationState] = OrderedDict()
+        # Session -> (lock, frames holding or waiting for it); dropped when unused
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+        self.lock_waits = 0
+        self.frames = 0
+        self.frames_without_new_text = 0
+        self.lines_total = 0
+        self.lines_new = 0
+        self.expired = 0
+        self.resets = 0
+
+    @asynccontextmanager
+    async def lock(self, session_id: str) -> AsyncIterator[None]:
+        """Serializes the frames of a session (read state, evaluate, update)."""
+        lock, users = self._locks.get(session_id) or (asyncio.Lock(), 0)
+        self._locks[session_id] = (lock, users + 1)
+        self.lock_waits += lock.locked()
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[session_id]
+            if users > 1:
+                self._locks[session_id] = (lock, users - 1)
+            else:
+                del self._locks[session_id]
+
+    def get(self, session_id: str) -> ConversationState | None:
+        state = self._sessions.get(session_id)
+        if state is not None and time.monotonic() - state.last_seen > self.ttl:
+            del self._sessions[session_id]
+            self.expired += 1
+            return None
+        return state
+
+    def new_lines(self, state: ConversationState | None, text: str) -> tuple[list[str], list[str], int]:
+        """
+        Splits a frame's text into (lines to evaluate, all unseen lines,
+        number of lines with words already seen), in screen order and
+        without repeats. Lines to evaluate are the unseen ones with actual
+        words.
+        """
+        self.frames += 1
+        unseen, pending = [], set()
+        shared = 0
+        lines = [line for line in text.splitlines() if line.strip()]
+        for line in lines:
+            key = hash(normalize_line(line))
+            if key in pending:
+                continue
+            if state is not None and key in state.seen:
+                shared += bool(_WORD_RE.search(line))
+                continue
+            pending.add(key)
+            unseen.append(line)
+        meaningful = [line for line in unseen if _WORD_RE.search(line)]
+        self.lines_total += len(lines)
+        self.lines_new += len(meaningful)
+        if not meaningful:
+            self.frames_without_new_text += 1
+        return meaningful, unseen, shared
+
+    def reset(self, session_id: str) -> None:
+        """Forgets a session whose window now shows another conversation."""
+        if self._sessions.pop(session_id, None) is not None:
+            self.resets += 1
+
+    def update(
+        self,
+        session_id: str,
+        state: ConversationState | None,
+        lines: list[str],
+        scoring: int,
+        reason: str,
+        title: str,
+        summary: str | None = None,
+        evaluated: bool = True,
+    ) -> ConversationState:
+        """Records a frame: its lines are now seen and the verdict is the conversation's."""
+        if state is None:
+            state = ConversationState()
+        for line in lines:
+            key = hash(normalize_line(line))
+            state.seen[key] = None
+            state.seen.move_to_end(key)
+        while len(state.seen) > self.max_lines:
+            state.seen.popitem(last=False)
+        state.scoring, state.reason, state.title = scoring, reason, title
+        if summary is not None:
+            state.summary = summary[:self.max_summary_chars]
+        state.frames += 1
+        state.evaluations += evaluated
+        state.last_seen = time.monotonic()
+
+        self._sessions[session_id] = state
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return state
+
+    def touch(self, session_id: str, state: ConversationState) -> None:
+        """Records a frame that brought nothing new."""
+        state.frames += 1
+        state.last_seen = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "frames": self.frames,
+            "frames_without_new_text": self.frames_without_new_text,
+            "new_line_ratio": round(self.lines_new / self.lines_total, 3) if self.lines_total else None,
+            "expired": self.expired,
+            "resets": self.resets,
+            "lock_waits": self.lock_waits,
+        }
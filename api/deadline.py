@@ -0,0 +1,209 @@
+import asyncio
+import contextvars
+import math
+import time
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request
+
+# Header a client uses to set its own request budget, in seconds
+DEADLINE_HEADER = "X-Request-Timeout"
+# A stage is not started with less time than this left (seconds)
+MIN_STAGE_BUDGET = 0.05
+# How often a running request checks whether its client is still connected
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request deadline passed before or during a pipeline stage."""
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready."""
+
+
+class Deadline:
+    """Absolute end time of one request (monotonic clock)."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class SharedDeadline(Deadline):
+    """
+    Deadline of work shared by several requests (single-flight runs, LLM
+    batches): the latest deadline among the requests that joined it, or none
+    if one of them has none. Each request still stops waiting at its own
+    deadline (DeadlinePolicy.run); the work is not cut short by the first
+    request's budget. Joined shared deadlines are followed as they extend.
+    """
+
+    def __init__(self):
+        self._members: list[Deadline] = []
+        self._unbounded = False
+
+    def join(self, deadline: Deadline | None) -> None:
+        if deadline is None:
+            self._unbounded = True
+        else:
+            self._members.append(deadline)
+
+    @property
+    def expires_at(self) -> float:
+        if self._unbounded:
+            return math.inf
+        return max((member.expires_at for member in self._members), default=-math.inf)
+
+    @property
+    def timeout(self) -> float:
+        if self._unbounded:
+            return math.inf
+        return max((member.timeout for member in self._members), default=0.0)
+
+
+_current_deadline: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    return _current_deadline.get()
+
+
+def shared_context(shared: SharedDeadline) -> contextvars.Context:
+    """Copy of the current context in which the request deadline is shared (run shared work in it)."""
+    context = contextvars.copy_context()
+    context.run(_current_deadline.set, shared)
+    return context
+
+
+def join_shared(shared: SharedDeadline) -> None:
+    """Extends shared work to the current request's deadline."""
+    shared.join(_current_deadline.get())
+
+
+def deadline_expired() -> bool:
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired
+
+
+def stage_timeout(cap: float, stage: str) -> float:
+    """
+    Timeout for the next stage of the current request: cap, or whatever is
+    left of the request deadline if that is less. Raises DeadlineExceeded
+    when too little is left to start the stage at all. Call it after
+    waiting for limiters, so the wait is charged to the request.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return cap
+    remaining = deadline.remaining()
+    if remaining < MIN_STAGE_BUDGET:
+        deadline_stats.record_expired(stage)
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+    return min(cap, remaining)
+
+
+def check_deadline(stage: str) -> None:
+    """Raises DeadlineExceeded if the current request is out of time (after a stage timed out)."""
+    if deadline_expired():
+        deadline_stats.record_expired(stage)
+        raise DeadlineExceeded(f"Deadline exceeded during {stage}")
+
+
+class DeadlineStats:
+    """Counters shared by the policy and the stages."""
+
+    def __init__(self):
+        self.requests = 0
+        self.client_deadlines = 0
+        self.completed = 0
+        self.expired = 0
+        self.disconnected = 0
+        self.expired_by_stage: dict[str, int] = {}
+
+    def record_expired(self, stage: str) -> None:
+        self.expired_by_stage[stage] = self.expired_by_stage.get(stage, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "client_deadlines": self.client_deadlines,
+            "completed": self.completed,
+            "expired": self.expired,
+            "client_disconnected": self.disconnected,
+            "expired_by_stage": dict(self.expired_by_stage),
+        }
+
+
+deadline_stats = DeadlineStats()
+
+
+class DeadlinePolicy:
+    """
+    One deadline per request: the client's DEADLINE_HEADER value (clamped
+    to maximum) or the server default. run() executes the request's work
+    under that deadline, so stage_timeout() in every stage sees the time
+    left, and cancels the work when the deadline passes or the client
+    disconnects.
+    """
+
+    def __init__(self, default: float, maximum: float):
+        self.default = default
+        self.maximum = maximum
+
+    def start(self, request: Request) -> Deadline:
+        """Deadline of a request, counted from now (call it before reading the upload)."""
+        deadline_stats.requests += 1
+        timeout = self.default
+        header = request.headers.get(DEADLINE_HEADER)
+        if header:
+            try:
+                requested = float(header)
+            except ValueError:
+                requested = 0
+            if requested > 0:
+                timeout = min(requested, self.maximum)
+                deadline_stats.client_deadlines += 1
+        return Deadline(timeout)
+
+    async def run(self, request: Request, deadline: Deadline, fn: Callable[[], Awaitable[Any]]) -> Any:
+        token = _current_deadline.set(deadline)
+        try:
+            # The task copies the current context, deadline included
+            task = asyncio.ensure_future(fn())
+        finally:
+            _current_deadline.reset(token)
+
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {task}, timeout=min(DISCONNECT_POLL_INTERVAL, deadline.remaining())
+                )
+                if done:
+                    result = task.result()
+                    deadline_stats.completed += 1
+                    return result
+                if deadline.expired:
+                    deadline_stats.expired += 1
+                    raise DeadlineExceeded(f"Request deadline of {deadline.timeout:g}s exceeded")
+                if await request.is_disconnected():
+                    deadline_stats.disconnected += 1
+                    raise ClientDisconnected()
+        except DeadlineExceeded:
+            if task.done():
+                # Raised by a stage that did not have time left to start
+                deadline_stats.expired += 1
+            raise
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {"default_s": self.default, "max_s": self.maximum, **deadline_stats.stats()}
@@ -1,4 +1,6 @@
-import requests
+import base64
+import time
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -11,13 +13,52 @@ RECIPIENT_EMAIL = "esteban@damascuss.io"  # Default recipient
 EMAIL_API_ENDPOINT = "https://api-notmeta.damascuss.io/notmeta/kora/email/"
 WHATSAPP_API_ENDPOINT = "https://api-notmeta.damascuss.io/notmeta/kora/notify/"
 
+EMAIL_SUBJECT = "⚠️ ALERTA: Ingeniería Social Detectada - Control Parental"
+DIGEST_EMAIL_SUBJECT = "⚠️ ALERTA: {count} alertas de Ingeniería Social - Control Parental"
+TEMPLATE_PATH = Path(__file__).parent / "email_template.html"
+LOGO_PATH = Path(__file__).parent / "logo.png"
+
+
+@lru_cache(maxsize=1)
+def load_logo_base64() -> Optional[str]:
+    """Logo codificado en base64 (una sola vez por proceso); None si no existe el archivo."""
+    try:
+        return base64.b64encode(LOGO_PATH.read_bytes()).decode("ascii")
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=1)
+def load_raw_email_template() -> str:
+    """Template HTML tal cual está en disco, leído una sola vez por proceso."""
+    return TEMPLATE_PATH.read_text(encoding="utf-8")
+
+
+def embed_logo(html_template: str, logo_base64: str) -> str:
+    # base64 no contiene llaves, así que el template sigue siendo válido para format()
+    return html_template.replace('src="cid:logo"', f'src="data:image/png;base64,{logo_base64}"')
+
+
+@lru_cache(maxsize=1)
+def load_email_template() -> str:
+    """
+    Template HTML con el logo ya embebido como data URI (si logo.png existe),
+    construido una sola vez por proceso.
+    """
+    html_template = load_raw_email_template()
+    logo_base64 = load_logo_base64()
+    if logo_base64:
+        html_template = embed_logo(html_template, logo_base64)
+    return html_template
+
+
 def get_email_template(data: dict, logo_base64: Optional[str] = None) -> str:
     """
     Genera el template HTML para el email de alerta de ingeniería social (control parental).
     
     Args:
         data: Diccionario con los datos de la alerta
-        logo_base64: Logo en base64 para embed en el HTML (opcional)
+        logo_base64: Logo en base64 para embed en el HTML (opcional; por defecto logo.png)
     """
     reason = data.get("reason", "")
     tipo = data.get("type", "")
@@ -34,128 +75,81 @@ def get_email_template(data: dict, logo_base64: Optional[str] = None) -> str:
     else:
         risk_color = "#10b981"  # Verde - Bajo riesgo
 
-    # Leer el template HTML desde el archivo externo
-    template_path = Path(__file__).parent / "email_template.html"
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
-
-    # Determinar la fuente de la imagen del logo
+    # Un logo explícito se embebe sobre el template en crudo (ya en memoria)
     if logo_base64:
-        logo_src = f"data:image/png;base64,{logo_base64}"
+        html_template = embed_logo(load_raw_email_template(), logo_base64)
     else:
-        # Fallback a cid si no hay logo base64 (para compatibilidad)
-        logo_src = "cid:logo"
+        html_template = load_email_template()
 
     # Reemplazar los placeholders con los valores dinámicos
-    html_content = html_template.format(
+    return html_template.format(
         risk_color=risk_color,
         risk_level=risk_level,
         tipo=tipo or 'desconocido',
         reason=reason if reason else 'No se proporcionó una razón específica'
     )
 
-    # Reemplazar cid:logo con el data URI si tenemos el logo
-    if logo_base64:
-        html_content = html_content.replace('src="cid:logo"', f'src="{logo_src}"')
-
-    return html_content
-
 
-def send_phishing_alert(data: dict, recipient_email: str):
+def phishing_alert_payload(data: dict, recipient_email: str) -> dict:
     """
-    Envía un email de alerta cuando se detecta ingeniería social usando tu endpoint.
+    Payload del endpoint de email para una alerta de ingeniería social.
     Args:
         data: Diccionario con los datos devueltos por el API (scoring, reason, type)
         recipient_email: Email del destinatario que recibirá la alerta
     """
-    try:
-        # Generar contenido HTML del email
-        html_content = get_email_template(data)
-
-        # Preparar el payload para tu endpoint
-        payload = {
-            "html": html_content,
-            "email": recipient_email,
-            "subject": "⚠️ ALERTA: Ingeniería Social Detectada - Control Parental"
-        }
-
-        # Enviar POST request a tu endpoint
-        response = requests.post(
-            EMAIL_API_ENDPOINT,
-            json=payload,
-            timeout=10  # 10 segundos de timeout
-        )
-
-        # Verificar si la respuesta fue exitosa
-        response.raise_for_status()
-
-        return {
-            "status": "success",
-            "message_id": response.json().get('id') if response.json() else None,
-            "message": f"Alert email sent successfully to {recipient_email}"
-        }
-    except requests.exceptions.Timeout:
-        return {
-            "status": "error",
-            "message": "Request timeout: El servidor tardó demasiado en responder"
-        }
-    except requests.exceptions.RequestException as e:
-        return {
-            "status": "error",
-            "message": f"Failed to send email via API: {str(e)}"
-        }
-
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Failed to send email: {str(e)}"
-        }
-
-
-def send_whatsapp_notification(to_number: str, reason: str):
+    return {
+        "html": get_email_template(data),
+        "email": recipient_email,
+        "subject": EMAIL_SUBJECT
+    }
+
+
+def whatsapp_notification_payload(to_number: str, reason: str) -> dict:
     """
-    Envía una notificación de WhatsApp cuando se detecta ingeniería social.
+    Payload del endpoint de WhatsApp para una alerta de ingeniería social.
     Args:
         to_number: Número de teléfono del destinatario (ej: "573001234567")
         reason: Razón de la alerta
     """
-    try:
-        # Preparar el payload para el endpoint de WhatsApp
-        payload = {
-            "to_number": to_number,
-            "reason": reason
-        }
-
-        # Enviar POST request al endpoint de WhatsApp
-        response = requests.post(
-            WHATSAPP_API_ENDPOINT,
-            json=payload,
-            headers={
-                "Content-Type": "application/json",
-            },
-            timeout=10  # 10 segundos de timeout
-        )
-
-        # Verificar si la respuesta fue exitosa
-        response.raise_for_status()
-
-        return {
-            "status": "success",
-            "message_id": response.json().get('id') if response.json() else None,
-            "message": f"WhatsApp notification sent successfully to {to_number}"
-        }
-    except requests.exceptions.Timeout:
-        return {
-            "status": "error",
-            "message": "Request timeout: El servidor tardó demasiado en responder"
-        }
-    except requests.exceptions.RequestException as e:
-        return {
-            "status": "error",
-            "message": f"Failed to send WhatsApp notification via API: {str(e)}"
-        }
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Failed to send WhatsApp notification: {str(e)}"
-        }
+    return {
+        "to_number": to_number,
+        "reason": reason
+    }
+
+
+def digest_reason(alerts: list[dict], total: int) -> str:
+    """
+    Texto de un resumen de alertas agrupadas: cuántas hubo, en qué intervalo
+    y las razones distintas (las alertas agrupadas tienen razones casi iguales).
+    """
+    first = time.strftime("%H:%M", time.localtime(alerts[0]["received_at"]))
+    last = time.strftime("%H:%M", time.localtime(alerts[-1]["received_at"]))
+    reasons = list(dict.fromkeys(alert.get("reason", "") for alert in alerts if alert.get("reason")))
+    summary = f"Se detectaron {total} alertas similares entre las {first} y las {last}."
+    if reasons:
+        summary += " " + " / ".join(reasons[-3:])
+    return summary
+
+
+def phishing_digest_payload(alerts: list[dict], total: int, recipient_email: str) -> dict:
+    """
+    Payload del endpoint de email para un resumen de alertas agrupadas,
+    con la puntuación más alta del grupo.
+    """
+    data = {
+        "scoring": max(alert.get("scoring", 5) for alert in alerts),
+        "type": alerts[-1].get("type", ""),
+        "reason": digest_reason(alerts, total),
+    }
+    return {
+        "html": get_email_template(data),
+        "email": recipient_email,
+        "subject": DIGEST_EMAIL_SUBJECT.format(count=total)
+    }
+
+
+def whatsapp_digest_payload(alerts: list[dict], total: int, to_number: str) -> dict:
+    """
+    Payload del endpoint de WhatsApp para un resumen de alertas agrupadas.
+    """
+    return whatsapp_notification_payload(to_number=to_number, reason=digest_reason(alerts, total))
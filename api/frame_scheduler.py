@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+# Header (or client_id query parameter) identifying a capture client/session
+CLIENT_ID_HEADER = "X-Client-Id"
+
+
+class FrameSuperseded(Exception):
+    """A newer frame from the same client arrived while this one was pending."""
+
+
+class LatestFrameScheduler:
+    """
+    Latest-frame-wins scheduling for clients that capture screenshots on an
+    interval: at most one frame per client is being evaluated. When a new
+    frame arrives, the client's previous frame is cancelled wherever it is
+    (waiting for a limiter slot, in OCR, waiting on Claude) and its caller
+    gets FrameSuperseded. Requests without a client id are not scheduled.
+
+    Cancelling a frame only stops work nobody else shares: a pipeline run
+    coalesced with another request (SingleFlight) keeps going for it.
+    """
+
+    def __init__(self):
+        self._latest: dict[str, asyncio.Task] = {}
+        self._superseded: set[asyncio.Task] = set()
+        self.scheduled = 0
+        self.superseded = 0
+
+    def supersede(self, client_id: str | None) -> None:
+        """Cancels the client's pending frame, if any (e.g. a newer frame was answered from cache)."""
+        if not client_id:
+            return
+        task = self._latest.pop(client_id, None)
+        if task is not None and not task.done():
+            self._superseded.add(task)
+            task.cancel()
+            self.superseded += 1
+
+    async def run(self, client_id: str | None, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not client_id:
+            return await fn()
+
+        self.supersede(client_id)
+        task = asyncio.ensure_future(fn())
+        self._latest[client_id] = task
+        self.scheduled += 1
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if task in self._superseded and not (current and current.cancelling()):
+                raise FrameSuperseded() from None
+            raise
+        finally:
+            self._superseded.discard(task)
+            if self._latest.get(client_id) is task:
+                del self._latest[client_id]
+
+    def stats(self) -> dict:
+        return {
+            "active_clients": len(self._latest),
+            "scheduled": self.scheduled,
+            "superseded": self.superseded,
+        }
@@ -9,6 +9,7 @@ from langchain.chat_models import init_chat_model
 from pydantic import BaseModel, Field
 
 from prompts import EMAIL_PHISHING_PROMPT, SOCIAL_ENGINEERING_PROMPT
+from model_registry import model_registry
 
 # API key configuration - read from environment (do NOT hardcode secrets)
 api_key = os.environ.get("OPENAI_API_KEY")
@@ -21,23 +22,55 @@ class GraphState(TypedDict):
     reason: str
 
 
+# Structured outputs of the graph nodes
+class ImageTypeResponse(BaseModel):
+    type: Literal["email", "whatsapp"] = Field(
+        description="The type of image: 'email' for email screenshots, 'whatsapp' for WhatsApp conversations"
+    )
+
+
+class PhishingResponse(BaseModel):
+    scoring: int = Field(
+        description="The phishing score from 1-10",
+        ge=1,
+        le=10
+    )
+    reason: str = Field(
+        description="Brief explanation of the phishing assessment in Spanish (max 15 words)"
+    )
+
+
+class SocialEngineeringResponse(BaseModel):
+    scoring: int = Field(
+        description="The social engineering risk score from 1-10",
+        ge=1,
+        le=10
+    )
+    reason: str = Field(
+        description="Brief explanation of the social engineering assessment in Spanish (max 15 words)"
+    )
+
+
+# Long-lived models shared by every graph run (see model_registry)
+model_registry.register(
+    "graph_router",
+    lambda: init_chat_model(model_provider="openai", model="gpt-5-mini-2025-08-07", api_key=api_key),
+    schemas=(ImageTypeResponse,),
+)
+model_registry.register(
+    "graph_analyzer",
+    lambda: init_chat_model(model_provider="openai", model="gpt-5.1-2025-11-13", api_key=api_key),
+    schemas=(PhishingResponse, SocialEngineeringResponse),
+)
+
+
 # Router Node: Classifies the image type
 async def router_node(state: GraphState) -> Command[Literal["email_analyzer", "whatsapp_analyzer"]]:
     """
     Classifies whether the image is an email or WhatsApp conversation.
     Routes to the appropriate analyzer node.
     """
-    class ImageTypeResponse(BaseModel):
-        type: Literal["email", "whatsapp"] = Field(
-            description="The type of image: 'email' for email screenshots, 'whatsapp' for WhatsApp conversations"
-        )
-
-    model = init_chat_model(
-        model_provider="openai",
-        model="gpt-5-mini-2025-08-07",
-        api_key=api_key
-    )
-    structured_model = model.with_structured_output(ImageTypeResponse)
+    structured_model = model_registry.structured("graph_router", ImageTypeResponse)
 
     message = HumanMessage(
         content=[
@@ -69,22 +102,7 @@ async def email_analyzer_node(state: GraphState) -> Command[Literal[END]]:
     Analyzes email screenshots for phishing indicators.
     Returns scoring and reason.
     """
-    class PhishingResponse(BaseModel):
-        scoring: int = Field(
-            description="The phishing score from 1-10",
-            ge=1,
-            le=10
-        )
-        reason: str = Field(
-            description="Brief explanation of the phishing assessment in Spanish (max 15 words)"
-        )
-
-    model = init_chat_model(
-        model_provider="openai",
-        model="gpt-5.1-2025-11-13",
-        api_key=api_key
-    )
-    structured_model = model.with_structured_output(PhishingResponse)
+    structured_model = model_registry.structured("graph_analyzer", PhishingResponse)
 
     message = HumanMessage(
         content=[
@@ -116,22 +134,7 @@ async def whatsapp_analyzer_node(state: GraphState) -> Command[Literal[END]]:
     Analyzes WhatsApp conversation screenshots for social engineering techniques.
     Returns scoring and reason.
     """
-    class SocialEngineeringResponse(BaseModel):
-        scoring: int = Field(
-            description="The social engineering risk score from 1-10",
-            ge=1,
-            le=10
-        )
-        reason: str = Field(
-            description="Brief explanation of the social engineering assessment in Spanish (max 15 words)"
-        )
-
-    model = init_chat_model(
-        model_provider="openai",
-        model="gpt-5.1-2025-11-13",
-        api_key=api_key
-    )
-    structured_model = model.with_structured_output(SocialEngineeringResponse)
+    structured_model = model_registry.structured("graph_analyzer", SocialEngineeringResponse)
 
     message = HumanMessage(
         content=[
@@ -0,0 +1,241 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from PIL import Image
+
+from content_crop import crop_to_content
+
+# Box-reduce by an integer factor before the Lanczos pass whenever the image
+# is at least twice the target size. At screenshot scales the box filter is
+# invisible to OCR and roughly halves resize time for 4K and Retina captures.
+RESIZE_REDUCING_GAP = 1.0
+
+# Estimated upload throughput to the OCR provider, used to trade encoder CPU
+# time against payload size (10 MB/s ~= 10,000 bytes per millisecond)
+UPLOAD_BYTES_PER_MS = 10_000
+
+# Re-measure every candidate encoder once every this many images
+ENCODER_PROBE_INTERVAL = 50
+
+
+@dataclass
+class PreprocessResult:
+    data: bytes
+    optimized: bool
+    encoder: str | None = None
+    width: int = 0
+    height: int = 0
+    pixels_in: int = 0
+    pixels_out: int = 0
+    elapsed_ms: float = 0.0
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _encode_jpeg_optimized(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _encode_png(image: Image.Image, quality: int) -> bytes:
+    # Flat grayscale text screens often compress better losslessly
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+# Formats accepted by Textract detect_document_text
+ENCODERS = {
+    "jpeg": _encode_jpeg,
+    "jpeg_optimized": _encode_jpeg_optimized,
+    "png": _encode_png,
+}
+
+
+class EncoderSelector:
+    """
+    Picks the output encoding by measured cost.
+
+    The cost of an encoder is its encode time plus the time its output takes
+    to upload (bytes / UPLOAD_BYTES_PER_MS). Every candidate is measured on
+    the first image and periodically afterwards; in between only the
+    cheapest one runs. State is per process, so each pool worker learns on
+    its own.
+    """
+
+    def __init__(self, encoders: dict = ENCODERS, probe_interval: int = ENCODER_PROBE_INTERVAL):
+        self.encoders = encoders
+        self.probe_interval = probe_interval
+        self.count = 0
+        self.best = next(iter(encoders))
+        # Exponentially weighted averages per encoder: name -> (ms, bytes)
+        self.averages: dict[str, tuple[float, float]] = {}
+
+    def _update(self, name: str, elapsed_ms: float, size: int) -> None:
+        previous = self.averages.get(name)
+        if previous is None:
+            self.averages[name] = (elapsed_ms, float(size))
+        else:
+            self.averages[name] = (previous[0] * 0.7 + elapsed_ms * 0.3, previous[1] * 0.7 + size * 0.3)
+
+    def _cost(self, name: str) -> float:
+        elapsed_ms, size = self.averages[name]
+        return elapsed_ms + size / UPLOAD_BYTES_PER_MS
+
+    def encode(self, image: Image.Image, quality: int) -> tuple[str, bytes]:
+        probe = self.count % self.probe_interval == 0
+        self.count += 1
+
+        if not probe:
+            start = time.perf_counter()
+            data = self.encoders[self.best](image, quality)
+            self._update(self.best, (time.perf_counter() - start) * 1000, len(data))
+            return self.best, data
+
+        outputs = {}
+        for name, encoder in self.encoders.items():
+            start = time.perf_counter()
+            outputs[name] = encoder(image, quality)
+            self._update(name, (time.perf_counter() - start) * 1000, len(outputs[name]))
+        self.best = min(self.averages, key=self._cost)
+        return self.best, outputs[self.best]
+
+
+_encoder_selector = EncoderSelector()
+
+
+def preprocess_image(
+    image_bytes: bytes,
+    max_width: int = 1500,
+    jpeg_quality: int = 85,
+    width_threshold: int = 1500,
+    crop: bool = True,
+    drop_chrome: bool = False,
+) -> PreprocessResult:
+    """
+    Decodes a screenshot once and prepares it for OCR:
+    - Reads dimensions from the header and skips images narrower than
+      width_threshold without decoding them
+    - Uses reduced-size decoding (JPEG draft mode straight to grayscale) and
+      an integer box reduce before the Lanczos resize for large downscales
+    - Converts to grayscale before resizing (one channel instead of three)
+    - Crops to the text-bearing area (see content_crop)
+    - Encodes with the cheapest measured encoder (see EncoderSelector)
+
+    Never raises: returns the original bytes if anything fails.
+    """
+    start = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original_width, original_height = image.size
+        if original_width <= width_threshold:
+            return PreprocessResult(data=image_bytes, optimized=False, width=original_width, height=original_height)
+
+        target_width = min(original_width, max_width)
+        target_height = max(1, int(target_width * original_height / original_width))
+
+        # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 scale directly into grayscale
+        if image.format == 'JPEG':
+            image.draft('L', (target_width, target_height))
+
+        if image.mode != 'L':
+            image = image.convert('L')
+
+        if image.width > target_width:
+            image = image.resize(
+                (target_width, target_height),
+                Image.Resampling.LANCZOS,
+                reducing_gap=RESIZE_REDUCING_GAP,
+            )
+
+        pixels_in = image.width * image.height
+        if crop:
+            image = crop_to_content(image, drop_chrome=drop_chrome)
+
+        encoder, data = _encoder_selector.encode(image, jpeg_quality)
+        return PreprocessResult(
+            data=data,
+            optimized=True,
+            encoder=encoder,
+            width=image.width,
+            height=image.height,
+            pixels_in=pixels_in,
+            pixels_out=image.width * image.height,
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+        )
+    except Exception:
+        return PreprocessResult(data=image_bytes, optimized=False)
+
+
+class PreprocessingPool:
+    """
+    Bounded executor for preprocess_image.
+
+    In "process" mode the CPU work runs on a spawn-based process pool so it
+    is not serialized by the GIL; "thread" mode keeps the previous
+    asyncio.to_thread behaviour. At most max_pending jobs are submitted at
+    once; further callers wait instead of growing an unbounded queue.
+    """
+
+    def __init__(self, mode: str = "process", workers: int | None = None, max_pending: int | None = None):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown preprocessing mode: {mode}")
+        self.mode = mode
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.max_pending = max_pending or self.workers * 2
+        self._executor: ProcessPoolExecutor | None = None
+        self._semaphore = asyncio.Semaphore(self.max_pending)
+
+    def start(self) -> None:
+        if self.mode == "process" and self._executor is None:
+            # spawn: never fork a process that already runs an event loop and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, image_bytes: bytes, **options) -> PreprocessResult:
+        async with self._semaphore:
+            if self.mode == "thread":
+                return await asyncio.to_thread(preprocess_image, image_bytes, **options)
+
+            self.start()
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(
+                    self._executor, _run_preprocess, image_bytes, options
+                )
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge image): recreate the pool
+                # on the next call and serve this one from a thread
+                self.shutdown()
+                return await asyncio.to_thread(preprocess_image, image_bytes, **options)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "available_slots": self._semaphore._value,
+        }
+
+
+def _run_preprocess(image_bytes: bytes, options: dict) -> PreprocessResult:
+    # Module-level so it can be pickled into pool workers
+    return preprocess_image(image_bytes, **options)
@@ -0,0 +1,401 @@
+"""
+Incremental OCR for a stream of screenshots from one client session.
+
+Consecutive captures of a window usually differ in a small area (a new chat
+bubble, a line scrolled in). Each session keeps its last frame at reduced
+resolution and the OCR layout (lines with positions) of that frame. A new
+frame is compared to it tile by tile with a vectorized diff, after trying
+to explain vertical movement as a scroll; cached lines on unchanged tiles
+are kept (moved by the scroll offset if needed), and only the changed
+regions are stacked into one small image and sent to OCR. Payload size and
+OCR time scale with what changed instead of with the screen size.
+
+A frame is OCRed in full when the session is new, the frame size changed,
+most of the frame changed, or every full_refresh_frames frames (so missed
+sub-threshold changes cannot persist).
+"""
+import asyncio
+import io
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import numpy as np
+from PIL import Image
+
+from ocr_engines import OCRLine, lines_to_text
+
+# Frames are diffed at 1/DIFF_SCALE of the OCR resolution, in tiles of
+# TILE_SIZE diff pixels (64 x 64 OCR pixels)
+DIFF_SCALE = 2
+TILE_SIZE = 32
+# A diff pixel changed when its gray level moved more than this (ignores
+# JPEG noise and anti-aliasing jitter); a tile changed with MIN_CHANGED_PIXELS
+PIXEL_THRESHOLD = 24
+MIN_CHANGED_PIXELS = 3
+# Scroll detection: rows compared as COLUMN_BINS column means; a row with a
+# gray level deviation below TEXTURE_STD (blank background) does not count,
+# and a shift must match MIN_SCROLL_ROWS more textured rows than no shift
+COLUMN_BINS = 16
+TEXTURE_STD = 3.0
+PROFILE_TOLERANCE = 1.5
+MIN_SCROLL_ROWS = 8
+# Current rows compared against all previous rows at once (bounds temporary memory)
+SCROLL_CHUNK_ROWS = 128
+# OCR pixels added around changed regions and between stacked regions
+REGION_PADDING = 8
+REGION_GAP = 24
+
+OCRCall = Callable[[bytes], Awaitable[list[OCRLine] | str]]
+
+
+def load_frame(image_bytes: bytes, max_width: int) -> np.ndarray:
+    """Grayscale frame at OCR resolution (at most max_width wide)."""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        image.draft('L', (max_width, max(1, max_width * image.height // image.width)))
+    if image.mode != 'L':
+        image = image.convert('L')
+    if image.width > max_width:
+        image = image.resize(
+            (max_width, max(1, max_width * image.height // image.width)),
+            Image.Resampling.LANCZOS,
+            reducing_gap=1.0,
+        )
+    return np.asarray(image)
+
+
+def reduce_frame(gray: np.ndarray) -> np.ndarray:
+    """Box-reduces the frame by DIFF_SCALE for diffing."""
+    height, width = (gray.shape[0] // DIFF_SCALE) * DIFF_SCALE, (gray.shape[1] // DIFF_SCALE) * DIFF_SCALE
+    total = np.zeros((height // DIFF_SCALE, width // DIFF_SCALE), dtype=np.uint16)
+    for dy in range(DIFF_SCALE):
+        for dx in range(DIFF_SCALE):
+            total += gray[dy:height:DIFF_SCALE, dx:width:DIFF_SCALE]
+    return (total // (DIFF_SCALE * DIFF_SCALE)).astype(np.uint8)
+
+
+def changed_tiles(current: np.ndarray, reference: np.ndarray, valid_rows: np.ndarray | None = None) -> np.ndarray:
+    """Boolean (tile rows, tile cols) map of the tiles that differ from the reference."""
+    changed = np.abs(current.astype(np.int16) - reference) > PIXEL_THRESHOLD
+    if valid_rows is not None:
+        changed[~valid_rows] = True
+    height, width = changed.shape
+    rows, cols = -(-height // TILE_SIZE), -(-width // TILE_SIZE)
+    padded = np.zeros((rows * TILE_SIZE, cols * TILE_SIZE), dtype=bool)
+    padded[:height, :width] = changed
+    counts = padded.reshape(rows, TILE_SIZE, cols, TILE_SIZE).sum(axis=(1, 3))
+    return counts >= MIN_CHANGED_PIXELS
+
+
+def shift_rows(frame: np.ndarray, shift: int) -> tuple[np.ndarray, np.ndarray]:
+    """The frame moved down by shift rows (up if negative) and the rows that have content."""
+    shifted = np.zeros_like(frame)
+    valid = np.zeros(frame.shape[0], dtype=bool)
+    if shift > 0:
+        shifted[shift:], valid[shift:] = frame[:-shift], True
+    elif shift < 0:
+        shifted[:shift], valid[:shift] = frame[-shift:], True
+    else:
+        shifted[:], valid[:] = frame, True
+    return shifted, valid
+
+
+def detect_scroll(previous: np.ndarray, current: np.ndarray) -> int:
+    """
+    Vertical offset (in diff pixels, positive = content moved down) that best
+    maps the previous frame onto the current one, or 0 when no shift explains
+    clearly more of the frame than no movement does.
+    """
+    height, width = current.shape
+    usable = (width // COLUMN_BINS) * COLUMN_BINS
+    if usable == 0 or height < 2 * TILE_SIZE:
+        return 0
+    # (COLUMN_BINS, height) mean gray level of each row in each column bin
+    previous_profile = previous[:, :usable].reshape(height, COLUMN_BINS, -1).mean(axis=2, dtype=np.float32).T.copy()
+    current_profile = current[:, :usable].reshape(height, COLUMN_BINS, -1).mean(axis=2, dtype=np.float32).T.copy()
+    textured = np.flatnonzero(current.std(axis=1) > TEXTURE_STD)
+
+    # Votes per shift (index shift + height) from every pair of matching rows
+    votes = np.zeros(2 * height, dtype=np.int64)
+    for start in range(0, len(textured), SCROLL_CHUNK_ROWS):
+        rows = textured[start:start + SCROLL_CHUNK_ROWS]
+        # Max over column bins, one bin at a time (contiguous (rows, height) planes)
+        deviation = np.abs(current_profile[0, rows, None] - previous_profile[0])
+        for column in range(1, COLUMN_BINS):
+            np.maximum(deviation, np.abs(current_profile[column, rows, None] - previous_profile[column]), out=deviation)
+        current_rows, previous_rows = np.nonzero(deviation < PROFILE_TOLERANCE)
+        votes += np.bincount(rows[current_rows] - previous_rows + height, minlength=2 * height)
+
+    baseline = votes[height]
+    votes[height] = 0
+    limit = height // 2
+    candidates = votes[height - limit:height + limit + 1]
+    best_shift = int(np.argmax(candidates)) - limit
+    return best_shift if candidates[best_shift + limit] >= baseline + MIN_SCROLL_ROWS else 0
+
+
+def _tile_box(line: OCRLine, tile_px: int, rows: int, cols: int) -> tuple[slice, slice] | None:
+    """Tiles covered by a line (in OCR pixels); None when it is off the frame."""
+    top, bottom = int(line.top // tile_px), int((line.top + max(line.height, 1) - 1) // tile_px)
+    left, right = int(line.left // tile_px), int((line.left + max(line.width, 1) - 1) // tile_px)
+    if bottom < 0 or top >= rows:
+        return None
+    return slice(max(top, 0), min(bottom, rows - 1) + 1), slice(max(left, 0), min(right, cols - 1) + 1)
+
+
+def plan_update(
+    previous: np.ndarray, current: np.ndarray, lines: list[OCRLine]
+) -> tuple[list[OCRLine], np.ndarray]:
+    """
+    Cached lines still valid in the current frame (moved by the scroll
+    offset if any) and the tiles that must be OCRed again.
+    """
+    tile_px = TILE_SIZE * DIFF_SCALE
+    static_changed = changed_tiles(current, previous)
+    if not static_changed.any():
+        return list(lines), static_changed
+
+    shift = detect_scroll(previous, current)
+    if shift:
+        shifted, valid = shift_rows(previous, shift)
+        scroll_changed = changed_tiles(current, shifted, valid)
+        dirty = static_changed & scroll_changed
+    else:
+        scroll_changed = static_changed
+        dirty = static_changed.copy()
+    rows, cols = dirty.shape
+
+    kept: list[OCRLine] = []
+    for line in lines:
+        box = _tile_box(line, tile_px, rows, cols)
+        if box is not None and not static_changed[box].any():
+            kept.append(line)
+            continue
+        moved_box = None
+        if shift:
+            moved = OCRLine(line.text, line.left, line.top + shift * DIFF_SCALE, line.width, line.height)
+            moved_box = _tile_box(moved, tile_px, rows, cols)
+            if moved_box is not None and moved.top >= 0 and not scroll_changed[moved_box].any():
+                kept.append(moved)
+                continue
+        # Changed line: read it again as a whole wherever part of it may still be
+        if box is not None and not static_changed[box].all():
+            dirty[box] = True
+        if moved_box is not None and not scroll_changed[moved_box].all():
+            dirty[moved_box] = True
+
+    # Kept lines touching a region that is OCRed again are replaced by the new reading
+    while True:
+        overlapping = [line for line in kept if dirty[_tile_box(line, tile_px, rows, cols)].any()]
+        if not overlapping:
+            return kept, dirty
+        for line in overlapping:
+            dirty[_tile_box(line, tile_px, rows, cols)] = True
+        kept = [line for line in kept if line not in overlapping]
+
+
+def dirty_regions(dirty: np.ndarray, frame_shape: tuple[int, int]) -> list[tuple[int, int, int, int]]:
+    """
+    Changed tiles as OCR-pixel rectangles (left, top, right, bottom): one per
+    run of consecutive tile rows, spanning the changed columns, padded.
+    """
+    tile_px = TILE_SIZE * DIFF_SCALE
+    height, width = frame_shape
+    regions = []
+    row_changed = dirty.any(axis=1)
+    row = 0
+    while row < len(row_changed):
+        if not row_changed[row]:
+            row += 1
+            continue
+        end = row
+        while end + 1 < len(row_changed) and row_changed[end + 1]:
+            end += 1
+        cols = np.flatnonzero(dirty[row:end + 1].any(axis=0))
+        regions.append((
+            max(0, int(cols[0]) * tile_px - REGION_PADDING),
+            max(0, row * tile_px - REGION_PADDING),
+            min(width, (int(cols[-1]) + 1) * tile_px + REGION_PADDING),
+            min(height, (end + 1) * tile_px + REGION_PADDING),
+        ))
+        row = end + 1
+    return regions
+
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def stack_regions(gray: np.ndarray, regions: list[tuple[int, int, int, int]]) -> tuple[bytes, list[int]]:
+    """One image with the regions stacked top to bottom; returns it and each region's offset."""
+    width = max(right - left for left, _, right, _ in regions)
+    height = sum(bottom - top for _, top, _, bottom in regions) + REGION_GAP * (len(regions) - 1)
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+    offsets = []
+    y = 0
+    for left, top, right, bottom in regions:
+        canvas[y:y + bottom - top, :right - left] = gray[top:bottom, left:right]
+        offsets.append(y)
+        y += bottom - top + REGION_GAP
+    return encode_png(canvas), offsets
+
+
+def to_frame_lines(
+    lines: list[OCRLine],
+    image_size: tuple[int, int],
+    regions: list[tuple[int, int, int, int]],
+    offsets: list[int],
+    dirty: np.ndarray,
+) -> list[OCRLine]:
+    """
+    Maps lines read on the stacked image (fractions) back to OCR pixels of
+    the frame. Lines centered outside the changed tiles (read in the region
+    padding) are dropped: the cached layout already has them.
+    """
+    width, height = image_size
+    tile_px = TILE_SIZE * DIFF_SCALE
+    rows, cols = dirty.shape
+    mapped = []
+    for line in lines:
+        left, top = line.left * width, line.top * height
+        center = top + line.height * height / 2
+        for (region_left, region_top, _, region_bottom), offset in zip(regions, offsets):
+            if offset <= center < offset + region_bottom - region_top:
+                line = OCRLine(
+                    line.text, left + region_left, top - offset + region_top, line.width * width, line.height * height
+                )
+                row = min(int((line.top + line.height / 2) // tile_px), rows - 1)
+                col = min(int((line.left + line.width / 2) // tile_px), cols - 1)
+                if dirty[row, col]:
+                    mapped.append(line)
+                break
+    return mapped
+
+
+def layout_text(lines: list[OCRLine]) -> str:
+    return lines_to_text(sorted(lines, key=lambda line: (line.top, line.left)))
+
+
+class _Session:
+    __slots__ = ("frame", "lines", "frames_since_full", "last_seen")
+
+    def __init__(self, frame: np.ndarray, lines: list[OCRLine]):
+        self.frame = frame
+        self.lines = lines
+        self.frames_since_full = 0
+        self.last_seen = time.monotonic()
+
+
+class IncrementalOCR:
+    """
+    Per-session incremental OCR (see the module docstring). Sessions are
+    kept in LRU order, at most max_sessions of them (about 0.4 MB each for a
+    1500 px wide frame) and for session_ttl seconds after their last frame.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 128,
+        session_ttl: float = 300,
+        max_width: int = 1500,
+        full_frame_ratio: float = 0.5,
+        full_refresh_frames: int = 30,
+    ):
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.max_width = max_width
+        self.full_frame_ratio = full_frame_ratio
+        self.full_refresh_frames = full_refresh_frames
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self.frames = {"full": 0, "partial": 0, "unchanged": 0}
+        self.errors = 0
+        self.pixels_total = 0
+        self.pixels_ocr = 0
+
+    def _session(self, session_id: str) -> _Session | None:
+        session = self._sessions.get(session_id)
+        if session is not None and time.monotonic() - session.last_seen > self.session_ttl:
+            del self._sessions[session_id]
+            return None
+        return session
+
+    def _store(self, session_id: str, session: _Session) -> None:
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _plan(self, session: _Session | None, image_bytes: bytes):
+        """
+        CPU part of a frame: decode and diff. Returns (mode, OCR-resolution
+        frame, diff frame, kept lines, (regions, dirty tiles, stacked image, offsets)).
+        """
+        gray = load_frame(image_bytes, self.max_width)
+        frame = reduce_frame(gray)
+        if (
+            session is None
+            or session.frame.shape != frame.shape
+            or session.frames_since_full + 1 >= self.full_refresh_frames
+        ):
+            return "full", gray, frame, [], None
+        kept, dirty = plan_update(session.frame, frame, session.lines)
+        if not dirty.any():
+            return "unchanged", gray, frame, kept, None
+        if dirty.mean() > self.full_frame_ratio:
+            return "full", gray, frame, [], None
+        regions = dirty_regions(dirty, gray.shape)
+        return "partial", gray, frame, kept, (regions, dirty, *stack_regions(gray, regions))
+
+    async def extract_text(self, session_id: str, image_bytes: bytes, ocr: OCRCall) -> str:
+        """
+        Text of the frame, in the extract_text contract (lines joined by
+        newlines, NO_TEXT_RESULT or an engine error string). ocr reads the
+        lines of an image with their positions (OCREngine.extract_lines).
+        """
+        session = self._session(session_id)
+        mode, gray, frame, kept, update = await asyncio.to_thread(self._plan, session, image_bytes)
+        height, width = gray.shape
+        self.pixels_total += height * width
+
+        if mode == "unchanged":
+            # Nothing changed: the cached layout is the answer
+            result = kept
+        elif mode == "partial":
+            regions, dirty, image, offsets = update
+            stacked_size = (max(right - left for left, _, right, _ in regions), offsets[-1] + regions[-1][3] - regions[-1][1])
+            self.pixels_ocr += stacked_size[0] * stacked_size[1]
+            result = await ocr(image)
+            if not isinstance(result, str):
+                result = kept + to_frame_lines(result, stacked_size, regions, offsets, dirty)
+        else:
+            self.pixels_ocr += height * width
+            result = await ocr(await asyncio.to_thread(encode_png, gray))
+            if not isinstance(result, str):
+                result = [
+                    OCRLine(line.text, line.left * width, line.top * height, line.width * width, line.height * height)
+                    for line in result
+                ]
+
+        if isinstance(result, str):
+            # Engine error: start over with a full frame next time
+            self.errors += 1
+            self._sessions.pop(session_id, None)
+            return result
+
+        self.frames[mode] += 1
+        updated = _Session(frame, result)
+        if mode != "full":
+            updated.frames_since_full = session.frames_since_full + 1
+        self._store(session_id, updated)
+        return layout_text(result)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "frames": dict(self.frames),
+            "errors": self.errors,
+            "ocr_pixel_ratio": round(self.pixels_ocr / self.pixels_total, 3) if self.pixels_total else None,
+        }
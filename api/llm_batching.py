@@ -0,0 +1,147 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from deadline import SharedDeadline, join_shared, shared_context
+
+
+class MicroBatcher:
+    """
+    Groups LLM evaluations that arrive within a short window into one call.
+
+    Callers submit a single text and await its verdict. The first text of a
+    batch starts a timer of window seconds; the batch is sent when the timer
+    fires or when max_size texts / max_chars characters have accumulated.
+    - run_batch(texts) returns one verdict per text, or None for texts the
+      model left out (partial batch); those are retried one by one with
+      run_single.
+    - A failed batch call fails every caller in it, like a failed single call.
+    - Callers that were cancelled before the batch is sent are dropped from it.
+    - The batch call runs under the latest request deadline among its callers
+      (see deadline.SharedDeadline); each caller stops at its own.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list[str]], Awaitable[list[Any | None]]],
+        run_single: Callable[[str], Awaitable[Any]],
+        window: float,
+        max_size: int = 8,
+        max_chars: int = 24000,
+    ):
+        self.run_batch = run_batch
+        self.run_single = run_single
+        self.window = window
+        self.max_size = max_size
+        self.max_chars = max_chars
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._pending_chars = 0
+        self._pending_deadline = SharedDeadline()
+        self._timer: asyncio.TimerHandle | None = None
+        self._dispatches: set[asyncio.Task] = set()
+        self.batches = 0
+        self.batched_items = 0
+        self.single_calls = 0
+        self.partial_batches = 0
+        self.retried_items = 0
+
+    async def submit(self, text: str) -> Any:
+        if self.window <= 0 or self.max_size <= 1:
+            self.single_calls += 1
+            return await self.run_single(text)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        join_shared(self._pending_deadline)
+        self._pending.append((text, future))
+        self._pending_chars += len(text)
+
+        if len(self._pending) >= self.max_size or self._pending_chars >= self.max_chars:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        deadline, self._pending_deadline = self._pending_deadline, SharedDeadline()
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch), context=shared_context(deadline))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+
+        if len(batch) == 1:
+            self.single_calls += 1
+            await self._resolve(batch[0][1], self.run_single(batch[0][0]))
+            return
+
+        self.batches += 1
+        self.batched_items += len(batch)
+        try:
+            verdicts = await self.run_batch([text for text, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                self._fail(future, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        missing = []
+        for (text, future), verdict in zip(batch, verdicts):
+            if future.done():
+                continue
+            if verdict is None:
+                missing.append((text, future))
+            else:
+                future.set_result(verdict)
+        # The model may return fewer verdicts than texts
+        missing.extend((text, future) for text, future in batch[len(verdicts):] if not future.done())
+
+        if missing:
+            self.partial_batches += 1
+            self.retried_items += len(missing)
+            self.single_calls += len(missing)
+            await asyncio.gather(*(self._resolve(future, self.run_single(text)) for text, future in missing))
+
+    @staticmethod
+    def _fail(future: asyncio.Future, error: BaseException) -> None:
+        if future.done():
+            return
+        if isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            future.cancel()
+
+    @classmethod
+    async def _resolve(cls, future: asyncio.Future, call: Awaitable[Any]) -> None:
+        try:
+            result = await call
+        except BaseException as e:
+            cls._fail(future, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": int(self.window * 1000),
+            "max_size": self.max_size,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "single_calls": self.single_calls,
+            "partial_batches": self.partial_batches,
+            "retried_items": self.retried_items,
+        }
@@ -2,22 +2,66 @@ import base64
 import time
 import os
 import asyncio
-import io
 import hashlib
+import hmac
+import re
+import secrets
 from contextlib import AsyncExitStack
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from functools import partial
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage, SystemMessage
-from PIL import Image
 import aioboto3
 from botocore.config import Config
-from cachetools import TTLCache
 
 from pydantic import BaseModel, Field
 
-from prompts import EMAIL_PHISHING_PROMPT, SOCIAL_ENGINEERING_PROMPT, UNIFIED_EVALUATION_PROMPT
-from email_service import send_phishing_alert, send_whatsapp_notification
+from prompts import (
+    CONVERSATION_INSTRUCTIONS,
+    EMAIL_PHISHING_PROMPT,
+    SOCIAL_ENGINEERING_PROMPT,
+    UNIFIED_BATCH_INSTRUCTIONS,
+    UNIFIED_EVALUATION_PROMPT,
+)
+from email_service import (
+    EMAIL_API_ENDPOINT,
+    WHATSAPP_API_ENDPOINT,
+    phishing_alert_payload,
+    phishing_digest_payload,
+    whatsapp_digest_payload,
+    whatsapp_notification_payload,
+)
+from alert_coalescer import AlertCoalescer
+from notification_dispatcher import NotificationDispatcher, NotificationQueueFull
+from perceptual_cache import PerceptualCacheIndex, compute_dhash
+from text_cache import SimHashCache
+from singleflight import SingleFlight
+from adaptive_limiter import AdaptiveLimiter, is_overload_error
+from llm_batching import MicroBatcher
+from model_registry import model_registry
+from model_resilience import CircuitBreaker, HedgedModelChain
+from frame_scheduler import CLIENT_ID_HEADER, FrameSuperseded, LatestFrameScheduler
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from tracing import REQUEST_ID_HEADER, SamplingProfiler, Tracer, span
+from deadline import ClientDisconnected, DeadlineExceeded, DeadlinePolicy, check_deadline, stage_timeout
+from url_analysis import BrandIndex, BrandMatch, extract_domains, format_hints
+from benign_gate import BenignGate, VerdictLog
+from message_builder import build_image_messages, build_messages, invoke_structured, token_usage
+from cache_backend import create_cache_backend
+from content_crop import crop_stats
+from image_preprocessing import PreprocessingPool, PreprocessResult, preprocess_image
+from upload_stream import StreamedUpload, read_image_upload, read_image_uploads
+from incremental_ocr import IncrementalOCR
+from conversation_state import (
+    CLIENT_APP_HEADER,
+    CLIENT_WINDOW_HEADER,
+    DEFAULT_CHAT_APPS,
+    ConversationState,
+    ConversationStore,
+    conversation_key,
+)
+from ocr_engines import OCREngine, OCRLine, OCREngineRegistry, TesseractEngine, TextractEngine, lines_to_text
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -30,10 +74,101 @@ app = FastAPI()
 # Request tracking for monitoring (in-memory metrics)
 active_requests = {"count": 0}
 
+# Prometheus metrics served on /metrics (see metrics.py). Component stats
+# (limiters, caches, model chain...) are added at scrape time by
+# collect_component_metrics.
+request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Total request time", ("method", "route", "status")
+)
+requests_in_flight = metrics.gauge("http_requests_in_flight", "Requests being processed")
+stage_duration = metrics.histogram(
+    "pipeline_stage_duration_seconds", "Time per pipeline stage", ("stage",)
+)
+ocr_duration = metrics.histogram(
+    "ocr_duration_seconds", "OCR time per engine, fallback included", ("engine", "outcome")
+)
+claude_call_duration = metrics.histogram(
+    "claude_call_duration_seconds",
+    "Time per Claude call per model (hedged and fallback calls included)",
+    ("model", "endpoint", "outcome"),
+)
+cache_lookup_duration = metrics.histogram(
+    "cache_lookup_duration_seconds", "Response cache lookup time", ("prefix",)
+)
+cache_lookups = metrics.counter(
+    "cache_lookups_total", "Response cache lookups by key prefix", ("prefix", "result")
+)
+limiter_wait = metrics.histogram(
+    "limiter_wait_seconds", "Time waiting for a concurrency limiter slot", ("limiter",)
+)
+upstream_errors = metrics.counter(
+    "upstream_errors_total", "Failed upstream calls by error class", ("upstream", "error")
+)
+rejected_llm_batches = metrics.counter(
+    "llm_batches_rejected_total", "LLM batches whose verdict indexes did not match their texts"
+)
+
+# Per-request tracing (see tracing.py): every response carries X-Request-Id
+# (the client's, if it sent one) and requests slower than TRACE_SLOW_MS keep
+# their spans in a ring buffer of TRACE_BUFFER_SIZE traces. The /admin
+# endpoints (slow traces, sampling profiler) require the X-Admin-Token
+# header to match ADMIN_TOKEN and are disabled when it is not set.
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '2000'))
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '200'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+PROFILE_MAX_SECONDS = 60
+tracer = Tracer(slow_threshold_ms=TRACE_SLOW_MS, capacity=TRACE_BUFFER_SIZE)
+profiler = SamplingProfiler()
+
+# Alert notifications (email, WhatsApp) are queued and sent by background
+# workers through one pooled HTTP client, retrying gateway errors with
+# backoff; the endpoints answer with a delivery ID at once.
+NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', '4'))
+NOTIFICATION_QUEUE_SIZE = int(os.getenv('NOTIFICATION_QUEUE_SIZE', '1000'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '4'))
+NOTIFICATION_TIMEOUT = float(os.getenv('NOTIFICATION_TIMEOUT', '10'))
+# Seconds shutdown waits for queued notifications before dropping them
+NOTIFICATION_DRAIN_TIMEOUT = 5
+notifications = NotificationDispatcher(
+    workers=NOTIFICATION_WORKERS,
+    queue_size=NOTIFICATION_QUEUE_SIZE,
+    max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+    timeout=NOTIFICATION_TIMEOUT,
+    pool_size=NOTIFICATION_WORKERS,
+)
+
+# Repeated alerts for the same recipient, type and reason are coalesced: the
+# first one is sent at once, repeats within ALERT_COALESCE_WINDOW seconds
+# (of each other, at most ALERT_COALESCE_MAX_DELAY after the first) go out
+# as one digest, unless they raise the scoring (sent at once).
+# ALERT_COALESCE_WINDOW=0 sends every alert.
+ALERT_COALESCE_WINDOW = float(os.getenv('ALERT_COALESCE_WINDOW', '60'))
+ALERT_COALESCE_MAX_DELAY = float(os.getenv('ALERT_COALESCE_MAX_DELAY', '300'))
+
+def dispatch_alert(channel: str, recipient: str, alerts: list[dict], total: int) -> dict:
+    """Queues one alert, or a digest of total coalesced alerts, for delivery."""
+    if channel == "email":
+        if total == 1:
+            payload = phishing_alert_payload(data=alerts[0], recipient_email=recipient)
+        else:
+            payload = phishing_digest_payload(alerts, total, recipient_email=recipient)
+        return notifications.submit("email", EMAIL_API_ENDPOINT, payload, recipient=recipient)
+    if total == 1:
+        payload = whatsapp_notification_payload(to_number=recipient, reason=alerts[0]["reason"])
+    else:
+        payload = whatsapp_digest_payload(alerts, total, to_number=recipient)
+    return notifications.submit("whatsapp", WHATSAPP_API_ENDPOINT, payload, recipient=recipient)
+
+alert_coalescer = AlertCoalescer(dispatch_alert, window=ALERT_COALESCE_WINDOW, max_delay=ALERT_COALESCE_MAX_DELAY)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize reusable clients on startup"""
     await get_textract_client()
+    preprocessing_pool.start()
+    await model_registry.warm_up()
+    await load_benign_gate()
+    notifications.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -45,19 +180,43 @@ async def shutdown_event():
         except Exception:
             pass
         textract_client = None
+    response_cache.close()
+    verdict_log.close()
+    preprocessing_pool.shutdown()
+    await model_registry.aclose()
+    await alert_coalescer.flush_all()
+    await notifications.close(drain_timeout=NOTIFICATION_DRAIN_TIMEOUT)
 
 @app.middleware("http")
 async def track_requests(request, call_next):
-    """Middleware to track concurrent requests"""
+    """Middleware to track concurrent requests and trace each one"""
     active_requests["count"] += 1
+    requests_in_flight.inc()
     start_time = time.time()
-    try:
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
-    finally:
-        active_requests["count"] -= 1
+    status = 500
+    request_id = tracer.request_id(request.headers.get(REQUEST_ID_HEADER))
+    with tracer.trace(request_id, f"{request.method} {request.url.path}") as trace:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            process_time = time.time() - start_time
+            response.headers["X-Process-Time"] = str(process_time)
+            response.headers[REQUEST_ID_HEADER] = request_id
+            return response
+        finally:
+            active_requests["count"] -= 1
+            requests_in_flight.dec()
+            # Route template, not the raw path, so unknown URLs do not create series
+            route = request.scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            trace.name = f"{request.method} {route_path}"
+            trace.root.set(status=status)
+            request_duration.observe(
+                time.time() - start_time,
+                method=request.method,
+                route=route_path,
+                status=status,
+            )
 
 # Configurar CORS para permitir peticiones desde cualquier origen
 app.add_middleware(
@@ -75,137 +234,301 @@ api_key = os.getenv('ANTHROPIC_API_KEY') or os.getenv('API_KEY')
 aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
 aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
 aws_region = os.getenv('AWS_REGION', 'us-east-1')
+# Alternative Textract endpoint (VPC endpoint, or the local stand-in of benchmarks/)
+textract_endpoint_url = os.getenv('TEXTRACT_ENDPOINT_URL') or None
 
 # Create async boto3 session (reused across requests for connection pooling)
 boto3_session = aioboto3.Session()
 
-# Botocore config with aligned connection pool
-textract_config = Config(max_pool_connections=15)
+# Adaptive concurrency limits for the upstream APIs (see adaptive_limiter):
+# each limit starts at *_CONCURRENCY, grows while latency stays flat and
+# shrinks on throttling errors and timeouts, within [*_MIN, *_MAX].
+CLAUDE_CONCURRENCY = int(os.getenv('CLAUDE_CONCURRENCY', '10'))
+CLAUDE_CONCURRENCY_MIN = int(os.getenv('CLAUDE_CONCURRENCY_MIN', '2'))
+CLAUDE_CONCURRENCY_MAX = int(os.getenv('CLAUDE_CONCURRENCY_MAX', '40'))
+TEXTRACT_CONCURRENCY = int(os.getenv('TEXTRACT_CONCURRENCY', '15'))
+TEXTRACT_CONCURRENCY_MIN = int(os.getenv('TEXTRACT_CONCURRENCY_MIN', '2'))
+TEXTRACT_CONCURRENCY_MAX = int(os.getenv('TEXTRACT_CONCURRENCY_MAX', '50'))
+
+# Botocore config with connection pool aligned to the Textract limit ceiling
+textract_config = Config(max_pool_connections=TEXTRACT_CONCURRENCY_MAX)
 
 # Global Textract client (reused across requests)
 textract_client = None
 textract_client_lock = asyncio.Lock()
 
-# Semaphores to limit concurrent external API calls and prevent overload
-# Limit concurrent Claude API calls to prevent rate limiting
-claude_semaphore = asyncio.Semaphore(10)
-# Limit concurrent Textract calls to prevent AWS throttling (aligned with pool)
-textract_semaphore = asyncio.Semaphore(15)
+# Limiters for concurrent external API calls, to prevent overload.
+# Claude latency varies with output length, so it tolerates a wider swing;
+# its single, batch and hedged calls are separate latency classes.
+claude_limiter = AdaptiveLimiter(
+    "claude", CLAUDE_CONCURRENCY, CLAUDE_CONCURRENCY_MIN, CLAUDE_CONCURRENCY_MAX, tolerance=3.0
+)
+textract_limiter = AdaptiveLimiter(
+    "textract", TEXTRACT_CONCURRENCY, TEXTRACT_CONCURRENCY_MIN, TEXTRACT_CONCURRENCY_MAX
+)
 
-# Response cache (TTL: 1 hour, max 1000 entries)
-response_cache = TTLCache(maxsize=1000, ttl=3600)
+# Response cache shared by all endpoints (TTL: 1 hour, bounded by bytes).
+# CACHE_BACKEND=memory keeps it per process; CACHE_BACKEND=sqlite stores it in
+# CACHE_PATH so every worker on the host shares it and it survives restarts.
+# Cached values are pickled: CACHE_PATH must only be writable by this service.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_PATH = os.getenv('CACHE_PATH', str(Path(__file__).resolve().parent / ".cache" / "responses.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))
+response_cache = create_cache_backend(CACHE_BACKEND, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, path=CACHE_PATH)
+
+# Near-duplicate screenshot lookup: maximum dHash Hamming distance (out of 256
+# bits) for a screenshot to reuse the OCR text of one already read (domain
+# analysis, the text cache and Claude still run on it). Screens with the same
+# layout but different words hash alike, so it is off (-1) by default.
+PERCEPTUAL_HASH_MAX_DISTANCE = int(os.getenv('PERCEPTUAL_HASH_MAX_DISTANCE', '-1'))
+
+# Perceptual indexes per endpoint, pointing at OCR texts in response_cache
+unified_similarity_index = PerceptualCacheIndex(PERCEPTUAL_HASH_MAX_DISTANCE, maxsize=1000, ttl=CACHE_TTL)
+phishing_similarity_index = PerceptualCacheIndex(PERCEPTUAL_HASH_MAX_DISTANCE, maxsize=1000, ttl=CACHE_TTL)
+
+# OCR-text verdict cache (sits between OCR and Claude): maximum SimHash
+# Hamming distance (out of 64 bits) for two texts to share a verdict.
+# -1 disables the lookup.
+TEXT_SIMHASH_MAX_DISTANCE = int(os.getenv('TEXT_SIMHASH_MAX_DISTANCE', '3'))
+unified_text_cache = SimHashCache(TEXT_SIMHASH_MAX_DISTANCE, maxsize=5000, ttl=CACHE_TTL)
+phishing_text_cache = SimHashCache(TEXT_SIMHASH_MAX_DISTANCE, maxsize=5000, ttl=CACHE_TTL)
+
+# Single-flight layer: concurrent requests for the same cache key
+# (unified_<hash>, phishing_<hash>, ocr_<hash>) await one shared pipeline run
+inflight_requests = SingleFlight()
+
+# Micro-batching of /evaluate Claude calls: texts that reach the LLM stage
+# within LLM_BATCH_WINDOW_MS of each other share one request (0 disables it).
+# A batch is sent early once it holds LLM_BATCH_MAX_SIZE texts or
+# LLM_BATCH_MAX_CHARS characters.
+LLM_BATCH_WINDOW_MS = int(os.getenv('LLM_BATCH_WINDOW_MS', '20'))
+LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', '8'))
+LLM_BATCH_MAX_CHARS = int(os.getenv('LLM_BATCH_MAX_CHARS', '24000'))
+# Markdown header markers at line starts and runs of angle brackets are
+# defused in batched texts (see batch_text_block)
+BATCH_HEADER_RE = re.compile(r"^[ \t]*#+[ \t]*", re.MULTILINE)
+BATCH_DELIMITER_RE = re.compile(r"<{3,}|>{3,}")
+
+# Domain analysis of the OCR text for /evaluate: URLs, emails and domains are
+# checked against protected brands (see url_analysis) and every match is
+# passed to Claude as a hint. With URL_SHORT_CIRCUIT on, strong lookalikes
+# (Unicode homoglyphs, punycode, official domain as prefix) get an immediate
+# high-risk verdict; off until it is validated on a false-positive test set.
+# PROTECTED_BRANDS_PATH adds brands from a JSON file ({"Brand": ["brand.cl"]}).
+URL_ANALYSIS = os.getenv('URL_ANALYSIS', 'true').lower() == 'true'
+URL_SHORT_CIRCUIT = os.getenv('URL_SHORT_CIRCUIT', 'false').lower() == 'true'
+PROTECTED_BRANDS_PATH = os.getenv('PROTECTED_BRANDS_PATH')
+brand_index = BrandIndex.from_file(PROTECTED_BRANDS_PATH)
+
+# Benign-screen gate for /evaluate (see benign_gate): a local classifier that
+# answers clearly safe screens without Claude when its benign probability
+# reaches BENIGN_GATE_THRESHOLD. It never runs on texts with domain findings.
+# Trained offline from the verdict log (VERDICT_LOG_PATH, opt-in).
+BENIGN_GATE_MODEL_PATH = os.getenv('BENIGN_GATE_MODEL_PATH', str(Path(__file__).resolve().parent / ".cache" / "benign_gate.npz"))
+BENIGN_GATE_THRESHOLD = float(os.getenv('BENIGN_GATE_THRESHOLD', '0.97'))
+VERDICT_LOG_PATH = os.getenv('VERDICT_LOG_PATH')
+benign_gate = BenignGate(threshold=BENIGN_GATE_THRESHOLD)
+verdict_log = VerdictLog(VERDICT_LOG_PATH)
 
 # Timeout configurations (in seconds)
 CLAUDE_TIMEOUT = 30  # 30 seconds for Claude API calls
 TEXTRACT_TIMEOUT = 20  # 20 seconds for Textract calls
 IMAGE_OPTIMIZATION_TIMEOUT = 10  # 10 seconds for image optimization
 
+# One deadline per request, shared by all its stages: each stage gets at most
+# its own timeout above and never more than what is left of the request.
+# Clients may set a shorter or longer budget (up to REQUEST_DEADLINE_MAX)
+# with the X-Request-Timeout header, in seconds. Work is cancelled when the
+# deadline passes or the client disconnects.
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '30'))
+REQUEST_DEADLINE_MAX = float(os.getenv('REQUEST_DEADLINE_MAX', '60'))
+request_deadlines = DeadlinePolicy(default=REQUEST_DEADLINE, maximum=REQUEST_DEADLINE_MAX)
+
+# Latest frame wins: clients that identify themselves (client_id query
+# parameter or X-Client-Id header) have at most one /evaluate frame in
+# flight; an older pending frame is cancelled and answered with 409.
+# Per worker process: only enable it with a single worker or a load balancer
+# that routes each client to the same worker (see Dockerfile).
+FRAME_SCHEDULING = os.getenv('FRAME_SCHEDULING', 'false').lower() == 'true'
+frame_scheduler = LatestFrameScheduler()
+
+# Incremental OCR: for /evaluate frames of an identified client, only the
+# regions that changed since the client's previous frame are OCRed and
+# merged into its cached text layout (see incremental_ocr). Needs an OCR
+# engine that reports line positions. Per worker process: only enable it
+# with a single worker or sticky routing by client (see Dockerfile).
+INCREMENTAL_OCR = os.getenv('INCREMENTAL_OCR', 'false').lower() == 'true'
+INCREMENTAL_OCR_SESSIONS = int(os.getenv('INCREMENTAL_OCR_SESSIONS', '128'))
+INCREMENTAL_OCR_SESSION_TTL = float(os.getenv('INCREMENTAL_OCR_SESSION_TTL', '300'))
+incremental_ocr = IncrementalOCR(max_sessions=INCREMENTAL_OCR_SESSIONS, session_ttl=INCREMENTAL_OCR_SESSION_TTL)
+
+# Conversation state: /evaluate frames of an identified client that come
+# from a chat app (app / window query parameters or X-Client-App /
+# X-Client-Window headers, app in CONVERSATION_APPS) are scored as one
+# conversation per client, app and window. Only lines not seen in earlier
+# frames go to Claude, with the conversation's current score and rolling
+# summary; the verdict covers the whole conversation. Such frames skip the
+# shared per-frame caches and the benign gate; every other frame keeps the
+# cached pipeline.
+# Per worker process: only enable it with a single worker or sticky routing
+# by client (see Dockerfile).
+CONVERSATION_STATE = os.getenv('CONVERSATION_STATE', 'false').lower() == 'true'
+CONVERSATION_APPS = tuple(
+    name.strip().lower()
+    for name in os.getenv('CONVERSATION_APPS', ','.join(DEFAULT_CHAT_APPS)).split(',')
+    if name.strip()
+)
+CONVERSATION_SESSIONS = int(os.getenv('CONVERSATION_SESSIONS', '1000'))
+CONVERSATION_TTL = float(os.getenv('CONVERSATION_TTL', '1800'))
+conversations = ConversationStore(max_sessions=CONVERSATION_SESSIONS, ttl=CONVERSATION_TTL)
+
+# Tail-latency protection for the Haiku -> Sonnet chain (see model_resilience):
+# Sonnet is started in parallel once Haiku is slower than its own
+# CLAUDE_HEDGE_PERCENTILE latency (clamped to [MIN, MAX] ms), for at most
+# CLAUDE_HEDGE_BUDGET of the calls. A model with CLAUDE_BREAKER_FAILURE_RATIO
+# errors or slow calls among its recent ones is skipped for
+# CLAUDE_BREAKER_COOLDOWN seconds.
+CLAUDE_HEDGE_PERCENTILE = float(os.getenv('CLAUDE_HEDGE_PERCENTILE', '0.95'))
+CLAUDE_HEDGE_MIN_MS = float(os.getenv('CLAUDE_HEDGE_MIN_MS', '500'))
+CLAUDE_HEDGE_MAX_MS = float(os.getenv('CLAUDE_HEDGE_MAX_MS', '10000'))
+CLAUDE_HEDGE_BUDGET = float(os.getenv('CLAUDE_HEDGE_BUDGET', '0.1'))
+CLAUDE_BREAKER_FAILURE_RATIO = float(os.getenv('CLAUDE_BREAKER_FAILURE_RATIO', '0.5'))
+CLAUDE_BREAKER_COOLDOWN = float(os.getenv('CLAUDE_BREAKER_COOLDOWN', '30'))
+claude_chain = HedgedModelChain(
+    ["haiku", "sonnet"],
+    hedge_percentile=CLAUDE_HEDGE_PERCENTILE,
+    min_hedge_ms=CLAUDE_HEDGE_MIN_MS,
+    max_hedge_ms=CLAUDE_HEDGE_MAX_MS,
+    hedge_budget=CLAUDE_HEDGE_BUDGET,
+    slow_call_ms=CLAUDE_TIMEOUT * 1000 / 2,
+    breaker_factory=partial(
+        CircuitBreaker, failure_ratio=CLAUDE_BREAKER_FAILURE_RATIO, cooldown=CLAUDE_BREAKER_COOLDOWN
+    ),
+)
+
+# Upload limits, enforced while the body is streamed in (before it is fully read)
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '20')) * 1024 * 1024
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(40_000_000)))  # ~8K x 5K
+
+# /evaluate-batch: maximum images per request, and how many of them move
+# through the pipeline at once (so one batch cannot take every Claude slot)
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '20'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
 # Thresholds for smart optimization
 IMAGE_SIZE_THRESHOLD_KB = 500  # Skip optimization for images < 500KB
 IMAGE_WIDTH_THRESHOLD = 1500  # Skip optimization if width < 1500px
 
-def get_model():
+# Content-aware cropping before OCR: trims empty margins and uniform bands.
+# Browser chrome removal is opt-in because the address bar carries the URL,
+# which is one of the strongest phishing signals.
+CROP_TO_CONTENT = os.getenv('CROP_TO_CONTENT', 'true').lower() == 'true'
+CROP_BROWSER_CHROME = os.getenv('CROP_BROWSER_CHROME', 'false').lower() == 'true'
+
+# Image preprocessing pool: "process" (default, bypasses the GIL) or "thread".
+# PREPROCESS_WORKERS defaults to half the CPU cores of the instance.
+PREPROCESS_MODE = os.getenv('PREPROCESS_MODE', 'process')
+PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', '0')) or None
+preprocessing_pool = PreprocessingPool(mode=PREPROCESS_MODE, workers=PREPROCESS_WORKERS)
+# Output encoder chosen per optimized image
+preprocessing_encoders: dict[str, int] = {}
+
+# Claude model chain, in order of preference (see claude_chain)
+CLAUDE_MODELS = {
+    "haiku": "claude-haiku-4-5-20251001",
+    "sonnet": "claude-sonnet-4-5-20250929",
+}
+
+def build_claude_model(model: str, max_tokens: int = 1024):
     """
-    Factory function to create a LangChain Anthropic async model instance.
-    Uses native async client to avoid threadpool fallback.
+    Builds one LangChain Anthropic async model. Uses native async client to
+    avoid threadpool fallback. Built once per process by model_registry;
+    all Claude models share langchain-anthropic's cached HTTP client.
     """
-    model_b = ChatAnthropic(
-        model="claude-sonnet-4-5-20250929",
-        anthropic_api_key=api_key,
-        max_tokens=1024,
-        timeout=CLAUDE_TIMEOUT,
-    )
-
     return ChatAnthropic(
-        model="claude-haiku-4-5-20251001",
+        model=CLAUDE_MODELS[model],
         anthropic_api_key=api_key,
-        max_tokens=1024,
+        max_tokens=max_tokens,
         timeout=CLAUDE_TIMEOUT
-    ).with_fallbacks([model_b])
+    )
+
+def preprocessing_options() -> dict:
+    """Options passed to preprocess_image for every upload."""
+    return {
+        "max_width": 1500,
+        "jpeg_quality": 85,
+        "width_threshold": IMAGE_WIDTH_THRESHOLD,
+        "crop": CROP_TO_CONTENT,
+        "drop_chrome": CROP_BROWSER_CHROME,
+    }
 
 def optimize_image_for_textract(image_bytes: bytes, max_width: int = 1500, jpeg_quality: int = 85) -> bytes:
     """
-    Optimizes PNG images for Textract processing:
-    - Resizes to max_width (maintains aspect ratio)
+    Optimizes screenshots for Textract processing (synchronous entry point):
+    - Resizes to max_width (maintains aspect ratio); narrower images keep their size
     - Converts to grayscale
-    - Converts to JPEG format
-    - Uses high-quality Lanczos resampling
+    - Crops to the text-bearing content area (see content_crop)
+    - Encodes with the cheapest measured encoder (JPEG or PNG)
+    
+    See image_preprocessing.preprocess_image for details.
     
     Args:
-        image_bytes: Original image bytes (PNG format)
+        image_bytes: Original image bytes
         max_width: Maximum width in pixels (default 1500)
         jpeg_quality: JPEG quality 1-100 (default 85)
     
     Returns:
-        Optimized image bytes in JPEG format
+        Optimized image bytes, or the original bytes if optimization fails
     """
-    try:
-        # Open image from bytes
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Get original dimensions
-        original_width, original_height = image.size
-        
-        # Resize if needed (maintain aspect ratio)
-        if original_width > max_width:
-            # Calculate new height maintaining aspect ratio
-            aspect_ratio = original_height / original_width
-            new_width = max_width
-            new_height = int(max_width * aspect_ratio)
-            
-            # Resize with high-quality Lanczos resampling
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Convert to grayscale (Textract works well with grayscale)
-        if image.mode != 'L':
-            image = image.convert('L')
-        
-        # Convert to JPEG and save to bytes
-        output_buffer = io.BytesIO()
-        image.save(output_buffer, format='JPEG', quality=jpeg_quality, optimize=True)
-        output_buffer.seek(0)
-        
-        return output_buffer.getvalue()
-        
-    except Exception:
-        # If optimization fails, return original image bytes
-        return image_bytes
+    options = preprocessing_options()
+    # Images at or below max_width skip only the resize: still grayscale and re-encoded
+    options.update(max_width=max_width, jpeg_quality=jpeg_quality, width_threshold=0)
+    return preprocess_image(image_bytes, **options).data
 
 def should_optimize_image(image_bytes: bytes) -> bool:
     """
     Determine if image optimization is worthwhile.
-    Skip optimization for small images or images that are already appropriately sized.
+    Skip optimization for small images; the width check happens on the single
+    decode inside preprocess_image, which returns narrow images untouched.
     """
-    try:
-        size_kb = len(image_bytes) / 1024
-        if size_kb < IMAGE_SIZE_THRESHOLD_KB:
-            return False
-        
-        # Quick dimension check without full decode
-        image = Image.open(io.BytesIO(image_bytes))
-        width, _ = image.size
-        return width > IMAGE_WIDTH_THRESHOLD
-    except Exception:
-        # If check fails, optimize to be safe
-        return True
+    size_kb = len(image_bytes) / 1024
+    return size_kb >= IMAGE_SIZE_THRESHOLD_KB
+
+def record_preprocessing(image_bytes: bytes, result: PreprocessResult) -> None:
+    if result.optimized:
+        crop_stats.record_crop(result.pixels_in, result.pixels_out)
+        crop_stats.record_bytes(len(image_bytes), len(result.data))
+        preprocessing_encoders[result.encoder] = preprocessing_encoders.get(result.encoder, 0) + 1
 
 async def optimize_image_async(image_bytes: bytes) -> bytes:
     """
     Async wrapper for image optimization with timeout.
-    Uses asyncio.to_thread for elastic threadpool management.
+    Runs on the bounded preprocessing pool (process pool by default, so the
+    CPU work is not serialized by the GIL).
     Skips optimization for small/appropriately-sized images.
     """
     # Skip optimization if not needed
     if not should_optimize_image(image_bytes):
         return image_bytes
     
-    try:
-        return await asyncio.wait_for(
-            asyncio.to_thread(optimize_image_for_textract, image_bytes),
-            timeout=IMAGE_OPTIMIZATION_TIMEOUT
-        )
-    except asyncio.TimeoutError:
-        return image_bytes
+    timeout = stage_timeout(IMAGE_OPTIMIZATION_TIMEOUT, "preprocessing")
+    with span("optimize_image", bytes_in=len(image_bytes)) as current:
+        try:
+            with stage_duration.time(stage="preprocessing"):
+                result = await asyncio.wait_for(
+                    preprocessing_pool.run(image_bytes, **preprocessing_options()),
+                    timeout=timeout
+                )
+        except asyncio.TimeoutError:
+            # Out of request time: stop here. Otherwise OCR the original image.
+            check_deadline("preprocessing")
+            return image_bytes
+
+        if current is not None:
+            current.set(bytes_out=len(result.data), encoder=result.encoder)
+    record_preprocessing(image_bytes, result)
+    return result.data
 
 async def get_textract_client():
     """
@@ -222,40 +545,119 @@ async def get_textract_client():
                     aws_access_key_id=aws_access_key_id,
                     aws_secret_access_key=aws_secret_access_key,
                     region_name=aws_region,
+                    endpoint_url=textract_endpoint_url,
                     config=textract_config
                 ).__aenter__()
     
     return textract_client
 
 async def extract_text_with_textract(image_bytes: bytes) -> str:
+    """Async text extraction using AWS Textract (lines joined by newlines)."""
+    lines = await extract_lines_with_textract(image_bytes)
+    return lines if isinstance(lines, str) else lines_to_text(lines)
+
+async def extract_lines_with_textract(image_bytes: bytes) -> list[OCRLine] | str:
     """
-    Async text extraction using AWS Textract with reusable client.
-    Uses semaphore to limit concurrent calls and prevent AWS throttling.
+    Async line detection using AWS Textract with reusable client: the LINE
+    blocks with their bounding boxes, or an error string.
+    Uses the adaptive limiter to bound concurrent calls and back off when
+    AWS throttles.
     """
-    async with textract_semaphore:  # Limit concurrent Textract calls
-        try:
-            client = await get_textract_client()
+    with span("textract", bytes=len(image_bytes)) as current:
+        async with textract_limiter.acquire() as permit:  # Limit concurrent Textract calls
+            limiter_wait.observe(permit.wait_ms / 1000, limiter="textract")
+            if current is not None:
+                current.set(wait_ms=round(permit.wait_ms, 2))
+            # Time spent waiting for the limiter is charged to the request
+            timeout = stage_timeout(TEXTRACT_TIMEOUT, "ocr")
+            try:
+                client = await get_textract_client()
             
-            # Add timeout to prevent hanging
-            response = await asyncio.wait_for(
-                client.detect_document_text(
-                    Document={'Bytes': image_bytes}
-                ),
-                timeout=TEXTRACT_TIMEOUT
-            )
+                # Add timeout to prevent hanging
+                response = await asyncio.wait_for(
+                    client.detect_document_text(
+                        Document={'Bytes': image_bytes}
+                    ),
+                    timeout=timeout
+                )
             
-            # Extraer todo el texto detectado
-            text_lines = []
-            for block in response.get('Blocks', []):
-                if block['BlockType'] == 'LINE':
-                    text_lines.append(block['Text'])
+                # Extraer todas las líneas detectadas con su posición
+                text_lines = []
+                for block in response.get('Blocks', []):
+                    if block['BlockType'] == 'LINE':
+                        box = block.get('Geometry', {}).get('BoundingBox', {})
+                        text_lines.append(OCRLine(
+                            block['Text'],
+                            box.get('Left', 0.0),
+                            box.get('Top', 0.0),
+                            box.get('Width', 0.0),
+                            box.get('Height', 0.0),
+                        ))
             
-            return '\n'.join(text_lines) if text_lines else "No se pudo extraer texto"
+                return text_lines
             
-        except asyncio.TimeoutError:
-            return f"Error en Textract: Timeout después de {TEXTRACT_TIMEOUT}s"
-        except Exception as e:
-            return f"Error en Textract: {str(e)}"
+            except asyncio.TimeoutError:
+                if timeout < TEXTRACT_TIMEOUT:
+                    # Cut short by the request deadline, not a sign of overload
+                    permit.ignore()
+                    check_deadline("ocr")
+                else:
+                    permit.dropped()
+                upstream_errors.inc(upstream="textract", error="TimeoutError")
+                return f"Error en Textract: Timeout después de {timeout:g}s"
+            except Exception as e:
+                upstream_errors.inc(upstream="textract", error=type(e).__name__)
+                if is_overload_error(e):
+                    permit.dropped()
+                else:
+                    permit.ignore()
+                return f"Error en Textract: {str(e)}"
+
+# OCR engines: OCR_ENGINE picks the deployment default ("textract" or
+# "tesseract"), clients may override it per request with ?ocr_engine=...,
+# and OCR_FALLBACK_ENGINE is retried when the selected engine fails.
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'textract')
+OCR_FALLBACK_ENGINE = os.getenv('OCR_FALLBACK_ENGINE') or None
+available_ocr_engines: list[OCREngine] = [TextractEngine(extract_text_with_textract, extract_lines_with_textract)]
+if TesseractEngine.available():
+    available_ocr_engines.append(TesseractEngine(languages=os.getenv('TESSERACT_LANGUAGES', 'spa+eng')))
+ocr_engines = OCREngineRegistry(available_ocr_engines, default=OCR_ENGINE, fallback=OCR_FALLBACK_ENGINE)
+
+def get_ocr_engine(name: str | None) -> OCREngine:
+    """Resolve the OCR engine requested by the client (or the default one)."""
+    engine = ocr_engines.get(name)
+    if engine is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"OCR engine '{name}' no disponible. Opciones: {', '.join(ocr_engines.engines)}"
+        )
+    return engine
+
+async def run_ocr(image_bytes: bytes, engine: OCREngine) -> str:
+    """OCR with the selected engine (and fallback), timed per engine."""
+    start = time.perf_counter()
+    with span("ocr", engine=engine.name):
+        text = await ocr_engines.extract_text(image_bytes, engine)
+    ocr_duration.observe(
+        time.perf_counter() - start,
+        engine=engine.name,
+        outcome="error" if ocr_engines.is_error(text) else "success",
+    )
+    return text
+
+async def run_incremental_ocr(session_id: str, image_bytes: bytes, engine: OCREngine) -> str:
+    """OCR of a session frame that only reads what changed since the session's previous frame."""
+    start = time.perf_counter()
+    with span("ocr", engine=engine.name, incremental=True):
+        text = await incremental_ocr.extract_text(
+            session_id, image_bytes, lambda image: ocr_engines.extract_lines(image, engine)
+        )
+    ocr_duration.observe(
+        time.perf_counter() - start,
+        engine=engine.name,
+        outcome="error" if ocr_engines.is_error(text) else "success",
+    )
+    return text
 
 class PhishingEvaluation(BaseModel):
     scoring: int = Field(description="The scoring of the phishing email from 1 - 10")
@@ -276,6 +678,92 @@ class UnifiedEvaluation(BaseModel):
     reason: str = Field(description="Razón de la evaluación en español (máximo 5 palabras)", examples=["Probable phishing bancario"])
     title: str = Field(description="Phishing, grooming, etc")
 
+class ConversationEvaluation(UnifiedEvaluation):
+    """Evaluación de una conversación completa a partir de su resumen y las líneas nuevas"""
+    summary: str = Field(description="Resumen actualizado de la conversación y sus señales de riesgo (máximo 60 palabras)")
+
+class BatchItemVerdict(BaseModel):
+    """Veredicto de un texto dentro de una evaluación por lotes"""
+    index: int = Field(description="Número N del delimitador '<<<TEXTO N CLAVE>>>' del texto evaluado")
+    scoring: int = Field(description="Puntuación de riesgo de 1-10", ge=1, le=10)
+    reason: str = Field(description="Razón de la evaluación en español (máximo 5 palabras)")
+    title: str = Field(description="Phishing, grooming, etc")
+
+class BatchVerdicts(BaseModel):
+    """Veredictos de una evaluación por lotes, uno por texto"""
+    verdicts: list[BatchItemVerdict] = Field(description="Un veredicto por cada texto recibido")
+
+# Long-lived Claude clients and their structured-output runnables, shared by
+# every request (see model_registry)
+for claude_model in CLAUDE_MODELS:
+    model_registry.register(
+        f"claude_{claude_model}",
+        partial(build_claude_model, claude_model, max_tokens=1024),
+        schemas=(PhishingEvaluation, SocialEngineeringEvaluation, UnifiedEvaluation, ConversationEvaluation),
+        include_raw=True,
+    )
+    model_registry.register(
+        f"claude_{claude_model}_batch",
+        partial(build_claude_model, claude_model, max_tokens=2048),
+        schemas=(BatchVerdicts,),
+        include_raw=True,
+    )
+
+async def invoke_claude(schema: type, messages: list, endpoint: str, batch: bool = False):
+    """
+    Structured Claude call through the hedged Haiku -> Sonnet chain, within
+    the Claude limiter and the request deadline. Hedged calls share the
+    caller's limiter slot (they are capped by CLAUDE_HEDGE_BUDGET).
+    """
+    suffix = "_batch" if batch else ""
+    models_called = 0
+
+    async def call(model: str):
+        nonlocal models_called
+        models_called += 1
+        structured_model = model_registry.structured(f"claude_{model}{suffix}", schema, include_raw=True)
+        start = time.perf_counter()
+        outcome = "success"
+        try:
+            with span("claude_call", model=model, endpoint=endpoint):
+                return await invoke_structured(structured_model, messages, endpoint=endpoint)
+        except asyncio.CancelledError:
+            # Lost a hedge race or the request was cancelled
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "error"
+            upstream_errors.inc(upstream="claude", error=type(e).__name__)
+            raise
+        finally:
+            claude_call_duration.observe(
+                time.perf_counter() - start, model=model, endpoint=endpoint, outcome=outcome
+            )
+
+    # Use the adaptive limiter to bound concurrent Claude API calls; batch
+    # calls are slower than single ones, so each kind has its own latency baseline
+    async with claude_limiter.acquire("batch" if batch else "single") as permit:
+        limiter_wait.observe(permit.wait_ms / 1000, limiter="claude")
+        # Time spent waiting for the limiter is charged to the request
+        timeout = stage_timeout(CLAUDE_TIMEOUT, "claude")
+        try:
+            with (
+                stage_duration.time(stage="claude"),
+                span("claude", endpoint=endpoint, wait_ms=round(permit.wait_ms, 2)),
+            ):
+                return await asyncio.wait_for(claude_chain.run(call, kind=endpoint), timeout=timeout)
+        except asyncio.TimeoutError:
+            upstream_errors.inc(upstream="claude", error="TimeoutError")
+            if timeout < CLAUDE_TIMEOUT:
+                # Cut short by the request deadline, not a sign of overload
+                permit.ignore()
+                check_deadline("claude")
+            raise
+        finally:
+            if models_called > 1:
+                # Hedged or fell back: the slot's latency spans several model calls
+                permit.classify("hedge")
+
 class OCRResponse(BaseModel):
     parsed_text: str = Field(description="Texto extraído de la imagen")
     is_error_response: bool = Field(description="Si hubo error en el procesamiento")
@@ -289,23 +777,397 @@ class EmailAlertRequest(BaseModel):
     recipient_email: str = Field(description="Email del destinatario donde se enviará la alerta")
 
 class EmailAlertResponse(BaseModel):
-    status: str = Field(description="Estado del envío: success o error")
+    status: str = Field(description="Estado del envío: queued, coalesced o error")
     message: str = Field(description="Mensaje descriptivo del resultado")
     message_id: str | None = Field(default=None, description="ID del mensaje enviado (si es exitoso)")
+    delivery_id: str | None = Field(default=None, description="ID para consultar el estado en /notifications/{delivery_id}")
 
 class WhatsAppNotificationRequest(BaseModel):
     to_number: str = Field(description="Número de teléfono del destinatario (ej: 573001234567)")
     reason: str = Field(description="Razón de la alerta")
 
 class WhatsAppNotificationResponse(BaseModel):
-    status: str = Field(description="Estado del envío: success o error")
+    status: str = Field(description="Estado del envío: queued, coalesced o error")
     message: str = Field(description="Mensaje descriptivo del resultado")
     message_id: str | None = Field(default=None, description="ID del mensaje enviado (si es exitoso)")
+    delivery_id: str | None = Field(default=None, description="ID para consultar el estado en /notifications/{delivery_id}")
+
+class BatchItemResult(BaseModel):
+    index: int = Field(description="Posición de la imagen en la solicitud")
+    filename: str | None = Field(default=None, description="Nombre del archivo subido")
+    image_hash: str = Field(description="MD5 de la imagen")
+    evaluation: UnifiedEvaluation | None = Field(default=None, description="Evaluación de la imagen (si no hubo error)")
+    cached: bool = Field(description="Si la evaluación vino de la caché")
+    duplicate_of: int | None = Field(default=None, description="Índice de la imagen idéntica ya evaluada en este lote")
+    processing_time_ms: int = Field(description="Tiempo de procesamiento de la imagen")
+    error: str | None = Field(default=None, description="Mensaje de error si lo hay")
+
+class BatchEvaluationResponse(BaseModel):
+    results: list[BatchItemResult] = Field(description="Resultados en el mismo orden de las imágenes")
+    unique_images: int = Field(description="Imágenes distintas evaluadas tras deduplicar por hash")
+    total_time_ms: int = Field(description="Tiempo total de la solicitud")
+
+def cache_lookup(cache_key: str):
+    """Response cache lookup, timed and counted per key prefix (unified, phishing, ocr)."""
+    prefix = cache_key.split("_", 1)[0]
+    with cache_lookup_duration.time(prefix=prefix), span("cache_lookup", prefix=prefix) as current:
+        value = response_cache.get(cache_key)
+        if current is not None:
+            current.set(hit=value is not None)
+    cache_lookups.inc(prefix=prefix, result="miss" if value is None else "hit")
+    return value
+
+# Image formats accepted by Claude vision, as sniffed by upload_stream
+CLAUDE_IMAGE_FORMATS = ("PNG", "JPEG", "GIF", "WEBP")
 
 def get_image_hash(image_bytes: bytes) -> str:
     """Generate a hash for caching purposes."""
     return hashlib.md5(image_bytes).hexdigest()
 
+# Image endpoints read the body themselves (see upload_stream), so the
+# multipart schema FastAPI would infer from an UploadFile is declared here
+IMAGE_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            },
+            "image/*": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"],
+                }
+            }
+        },
+    }
+}
+
+async def read_screenshot(request: Request) -> StreamedUpload:
+    """
+    Stream the uploaded screenshot ('file' form field or raw image body),
+    hashing it and validating size, format and dimensions as it arrives.
+    """
+    return await read_image_upload(
+        request, field_name="file", max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS
+    )
+
+async def get_perceptual_hash(image_bytes: bytes) -> int | None:
+    """
+    Compute the dHash fingerprint used for near-duplicate cache lookups.
+    Decoding is CPU bound, so it runs in the threadpool.
+    """
+    if PERCEPTUAL_HASH_MAX_DISTANCE < 0:
+        return None
+    return await asyncio.to_thread(compute_dhash, image_bytes)
+
+def near_duplicate_text(index: PerceptualCacheIndex, fingerprint: int | None) -> str | None:
+    """OCR text of a near-identical screenshot already read, if any."""
+    near_match = index.lookup(fingerprint, response_cache.get)
+    return near_match[1] if near_match is not None else None
+
+def remember_frame_text(index: PerceptualCacheIndex, fingerprint: int | None, cache_key: str, extracted_text: str) -> None:
+    """Indexes a screenshot's OCR text for near_duplicate_text (never OCR errors)."""
+    if fingerprint is None or ocr_engines.is_error(extracted_text):
+        return
+    text_key = f"{cache_key}_text"
+    response_cache[text_key] = extracted_text
+    index.add(fingerprint, text_key)
+
+def get_text_fingerprint(
+    text_cache: SimHashCache, extracted_text: str, domain_matches: list[BrandMatch]
+) -> tuple[int | None, str]:
+    """
+    (SimHash, scope) of the OCR output for the text-level verdict cache.
+
+    The scope is a digest of the domains in the text, so a page that only
+    swaps its domain for a lookalike never reuses the genuine page's
+    verdict. OCR errors and texts with a strong lookalike domain are never
+    fingerprinted, so they cannot poison the cache or be served from it.
+    """
+    if ocr_engines.is_error(extracted_text) or any(match.strong for match in domain_matches):
+        return None, ""
+    domains = "\n".join(sorted(extract_domains(extracted_text)))
+    scope = hashlib.blake2b(domains.encode("utf-8"), digest_size=8).hexdigest() if domains else ""
+    return text_cache.fingerprint(extracted_text), scope
+
+def analyze_domains(extracted_text: str) -> list[BrandMatch]:
+    """Brand lookalike matches in the OCR text (strong matches first)."""
+    if not URL_ANALYSIS or ocr_engines.is_error(extracted_text):
+        return []
+    return brand_index.analyze(extracted_text)
+
+def domain_verdict(match: BrandMatch) -> UnifiedEvaluation:
+    """High-risk verdict for a strong lookalike domain, without calling Claude."""
+    return UnifiedEvaluation(scoring=9, reason=f"Suplantación de {match.brand}", title="Phishing")
+
+async def load_benign_gate() -> None:
+    """Load the trained benign-screen model, if one exists (the gate stays off otherwise)."""
+    if not Path(BENIGN_GATE_MODEL_PATH).exists():
+        return
+    try:
+        await asyncio.to_thread(benign_gate.load, BENIGN_GATE_MODEL_PATH)
+    except Exception as e:
+        benign_gate.metadata = {"error": f"No se pudo cargar el modelo: {e}"}
+
+def is_clearly_benign(extracted_text: str, domain_matches: list[BrandMatch]) -> bool:
+    """True if the benign gate can answer this text without Claude."""
+    if domain_matches or ocr_engines.is_error(extracted_text):
+        return False
+    return benign_gate.should_skip(extracted_text) is not None
+
+async def run_phishing_pipeline(image_data: bytes, cache_key: str, engine: OCREngine) -> PhishingEvaluation:
+    """
+    Uncached /evaluate-phishing pipeline: image optimization and OCR (or the
+    text of a near-identical screenshot), text cache and Claude. Caches the
+    verdict under cache_key.
+    """
+    # A near-identical screenshot (cursor blink, clock tick...) was already read: reuse its text
+    fingerprint = await get_perceptual_hash(image_data)
+    extracted_text = near_duplicate_text(phishing_similarity_index, fingerprint)
+    if extracted_text is None:
+        # Optimize image before processing (resize, grayscale, JPEG conversion)
+        optimized_image_data = await optimize_image_async(image_data)
+
+        # Extract text asynchronously with the selected OCR engine
+        extracted_text = await run_ocr(optimized_image_data, engine)
+        remember_frame_text(phishing_similarity_index, fingerprint, cache_key, extracted_text)
+
+    # Same text with the same domains already scored (other theme, window
+    # size, scroll offset): skip Claude
+    domain_matches = analyze_domains(extracted_text)
+    text_fingerprint, text_scope = get_text_fingerprint(phishing_text_cache, extracted_text, domain_matches)
+    cached_verdict = phishing_text_cache.get(text_fingerprint, text_scope)
+    if cached_verdict is not None:
+        response_cache[cache_key] = cached_verdict
+        return cached_verdict
+
+    # Static prompt as a cached system prefix, OCR text last (text-only model is cheaper than vision)
+    messages = build_messages(EMAIL_PHISHING_PROMPT, f"Texto extraído de la imagen:\n{extracted_text}")
+
+    response = await invoke_claude(PhishingEvaluation, messages, endpoint="evaluate_phishing")
+
+    # Cache the response
+    response_cache[cache_key] = response
+    phishing_text_cache.set(text_fingerprint, response, text_scope)
+    
+    return response
+
+async def evaluate_unified_text(extracted_text: str) -> UnifiedEvaluation:
+    """Single-text Claude evaluation for /evaluate."""
+    # Static prompt as a cached system prefix, OCR text last (text-only model is cheaper than vision)
+    messages = build_messages(UNIFIED_EVALUATION_PROMPT, f"Texto extraído de la imagen:\n{extracted_text}")
+
+    return await invoke_claude(UnifiedEvaluation, messages, endpoint="evaluate")
+
+def batch_text_block(text: str, index: int, nonce: str) -> str:
+    """
+    One OCR text of an LLM batch between nonce-tagged delimiter lines.
+    Header-like lines and delimiter-like sequences in the text are defused
+    so a screen cannot fake the boundary of another request's text.
+    """
+    text = BATCH_HEADER_RE.sub("", text)
+    text = BATCH_DELIMITER_RE.sub(lambda match: match.group(0)[:2], text)
+    return f"<<<TEXTO {index} {nonce}>>>\n{text}\n<<<FIN TEXTO {index} {nonce}>>>"
+
+async def evaluate_unified_texts(texts: list[str]) -> list[UnifiedEvaluation | None]:
+    """
+    Evaluates several texts in one Claude call (one limiter slot).
+    Returns one verdict per text; if the model does not return exactly one
+    verdict per index, the whole batch is rejected (all None) and every
+    text is evaluated on its own.
+    """
+    # Fresh key per batch, only in the variable part of the prompt
+    nonce = secrets.token_hex(8)
+    messages = build_messages(
+        UNIFIED_EVALUATION_PROMPT + UNIFIED_BATCH_INSTRUCTIONS,
+        f"Clave del lote: {nonce}\n\n"
+        + "\n\n".join(batch_text_block(text, i, nonce) for i, text in enumerate(texts, start=1)),
+    )
+
+    response = await invoke_claude(BatchVerdicts, messages, endpoint="evaluate_llm_batch", batch=True)
+
+    indexes = sorted(verdict.index for verdict in response.verdicts)
+    if indexes != list(range(1, len(texts) + 1)):
+        # Duplicated, missing or unknown indexes: no verdict of this batch can be trusted
+        rejected_llm_batches.inc()
+        return [None] * len(texts)
+    results: list[UnifiedEvaluation | None] = [None] * len(texts)
+    for verdict in response.verdicts:
+        results[verdict.index - 1] = UnifiedEvaluation(
+            scoring=verdict.scoring, reason=verdict.reason, title=verdict.title
+        )
+    return results
+
+unified_batcher = MicroBatcher(
+    evaluate_unified_texts,
+    evaluate_unified_text,
+    window=LLM_BATCH_WINDOW_MS / 1000,
+    max_size=LLM_BATCH_MAX_SIZE,
+    max_chars=LLM_BATCH_MAX_CHARS,
+)
+
+async def run_frame_ocr(image_data: bytes, engine: OCREngine, session_id: str | None) -> str:
+    """OCR of an /evaluate frame, incremental for frames of a client session when enabled."""
+    if session_id and INCREMENTAL_OCR and engine.supports_layout:
+        # Only the regions changed since the session's previous frame
+        return await run_incremental_ocr(session_id, image_data, engine)
+
+    # Optimize image before processing (resize, grayscale, JPEG conversion)
+    optimized_image_data = await optimize_image_async(image_data)
+
+    # Extract text asynchronously with the selected OCR engine
+    return await run_ocr(optimized_image_data, engine)
+
+async def evaluate_conversation_text(state: ConversationState | None, new_text: str) -> ConversationEvaluation:
+    """Claude verdict for a whole conversation from its state and the new lines of a frame."""
+    if state is None:
+        context = "Estado de la conversación: primera captura, sin contexto previo."
+    else:
+        context = (
+            "Estado de la conversación (capturas anteriores):\n"
+            f"Puntuación actual: {state.scoring}\n"
+            f"Resumen: {state.summary or 'Sin señales relevantes'}"
+        )
+    # Static prompt as a cached system prefix, conversation state and new lines last
+    messages = build_messages(
+        UNIFIED_EVALUATION_PROMPT + CONVERSATION_INSTRUCTIONS,
+        f"{context}\n\nLíneas nuevas extraídas de la captura:\n{new_text}",
+    )
+    return await invoke_claude(ConversationEvaluation, messages, endpoint="evaluate_conversation")
+
+async def run_conversation_pipeline(
+    image_data: bytes, engine: OCREngine, session_id: str, conversation_id: str
+) -> UnifiedEvaluation:
+    """
+    /evaluate pipeline for chat frames of a client session: OCR, then only
+    the lines not seen in the conversation's earlier frames are evaluated,
+    together with the conversation state, into a verdict for the whole
+    conversation.
+    """
+    extracted_text = await run_frame_ocr(image_data, engine, session_id)
+    # One frame of the conversation at a time from here to the update
+    async with conversations.lock(conversation_id):
+        return await evaluate_conversation_frame(extracted_text, conversation_id)
+
+async def evaluate_conversation_frame(extracted_text: str, conversation_id: str) -> UnifiedEvaluation:
+    """Verdict for a frame's text given its conversation's state (under the conversation's lock)."""
+    state = conversations.get(conversation_id)
+    if ocr_engines.is_error(extracted_text):
+        # Nothing new is known about the conversation
+        if state is not None:
+            return UnifiedEvaluation(scoring=state.scoring, reason=state.reason, title=state.title)
+        return await unified_batcher.submit(extracted_text)
+
+    lines, unseen, shared = conversations.new_lines(state, extracted_text)
+    if state is not None and lines and not shared:
+        # Nothing in common with the conversation so far: another chat is
+        # on screen, whose risk must not inherit the previous one's
+        conversations.reset(conversation_id)
+        state = None
+    if not lines and state is not None:
+        # Same conversation, nothing new: its verdict stands
+        conversations.touch(conversation_id, state)
+        return UnifiedEvaluation(scoring=state.scoring, reason=state.reason, title=state.title)
+
+    new_text = "\n".join(lines)
+    # No benign gate here: lines are marked seen once scored, so gated lines
+    # would never reach the model as context for later frames
+    domain_matches = analyze_domains(new_text)
+    if URL_SHORT_CIRCUIT and domain_matches and domain_matches[0].strong:
+        response = domain_verdict(domain_matches[0])
+        # The model never sees these lines: keep the finding in the summary
+        summary = " ".join(filter(None, (response.reason, state.summary if state is not None else "")))
+        evaluated = False
+        if state is not None and state.scoring > response.scoring:
+            response = UnifiedEvaluation(scoring=state.scoring, reason=state.reason, title=state.title)
+    else:
+        result = await evaluate_conversation_text(state, new_text + format_hints(domain_matches))
+        response = UnifiedEvaluation(scoring=result.scoring, reason=result.reason, title=result.title)
+        summary = result.summary
+        evaluated = True
+
+    conversations.update(
+        conversation_id, state, unseen, response.scoring, response.reason, response.title,
+        summary=summary, evaluated=evaluated,
+    )
+    return response
+
+async def run_unified_pipeline(
+    image_data: bytes, cache_key: str, engine: OCREngine, session_id: str | None = None
+) -> UnifiedEvaluation:
+    """
+    Uncached /evaluate pipeline: image optimization and OCR (or the text of
+    a near-identical screenshot), domain analysis, text cache and Claude.
+    Caches the verdict under cache_key. Frames of a client session are OCRed
+    incrementally when enabled.
+    """
+    # A near-identical screenshot (cursor blink, clock tick...) was already read: reuse its text
+    fingerprint = await get_perceptual_hash(image_data)
+    extracted_text = near_duplicate_text(unified_similarity_index, fingerprint)
+    if extracted_text is None:
+        extracted_text = await run_frame_ocr(image_data, engine, session_id)
+        remember_frame_text(unified_similarity_index, fingerprint, cache_key, extracted_text)
+
+    # Lookalike domains of protected brands: obvious phishing skips Claude,
+    # any other match goes to Claude as a hint
+    domain_matches = analyze_domains(extracted_text)
+
+    # Same text with the same domains already scored (other theme, window
+    # size, scroll offset): skip Claude
+    text_fingerprint, text_scope = get_text_fingerprint(unified_text_cache, extracted_text, domain_matches)
+    cached_verdict = unified_text_cache.get(text_fingerprint, text_scope)
+    if cached_verdict is not None:
+        response_cache[cache_key] = cached_verdict
+        return cached_verdict
+
+    if URL_SHORT_CIRCUIT and domain_matches and domain_matches[0].strong:
+        response = domain_verdict(domain_matches[0])
+    elif is_clearly_benign(extracted_text, domain_matches):
+        # Ordinary browsing the local classifier is confident about
+        response = UnifiedEvaluation(scoring=1, reason="", title="")
+    else:
+        # Claude call, shared with other requests arriving at the same moment
+        response = await unified_batcher.submit(extracted_text + format_hints(domain_matches))
+        verdict_log.append(extracted_text, response)
+
+    # Cache the response
+    response_cache[cache_key] = response
+    unified_text_cache.set(text_fingerprint, response, text_scope)
+
+    return response
+
+async def run_ocr_pipeline(image_data: bytes, cache_key: str, engine: OCREngine) -> str:
+    """
+    Uncached /extract-text pipeline: image optimization and OCR.
+    Caches successful extractions under cache_key.
+    """
+    # Optimize image before processing (resize, grayscale, JPEG conversion)
+    optimized_image_data = await optimize_image_async(image_data)
+    
+    # Extraer texto con el motor OCR seleccionado usando la imagen optimizada
+    extracted_text = await run_ocr(optimized_image_data, engine)
+
+    # Cache successful results
+    if not ocr_engines.is_error(extracted_text):
+        response_cache[cache_key] = extracted_text
+
+    return extracted_text
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint to monitor API status"""
@@ -313,10 +1175,188 @@ async def health_check():
         "status": "healthy",
         "active_requests": active_requests["count"],
         "cache_size": len(response_cache),
-        "claude_semaphore_available": claude_semaphore._value,
-        "textract_semaphore_available": textract_semaphore._value,
-        "textract_client_initialized": textract_client is not None
+        "cache": response_cache.stats(),
+        "perceptual_cache": {
+            "unified": unified_similarity_index.stats(),
+            "phishing": phishing_similarity_index.stats(),
+        },
+        "text_cache": {
+            "unified": unified_text_cache.stats(),
+            "phishing": phishing_text_cache.stats(),
+        },
+        "inflight_requests": inflight_requests.stats(),
+        "llm_batching": unified_batcher.stats(),
+        "llm_usage": token_usage.stats(),
+        "models": model_registry.stats(),
+        "deadlines": request_deadlines.stats(),
+        "frame_scheduler": frame_scheduler.stats(),
+        "incremental_ocr": incremental_ocr.stats(),
+        "conversations": conversations.stats(),
+        "tracing": {**tracer.stats(), "profiler": profiler.stats()},
+        "notifications": {**notifications.stats(), "coalescing": alert_coalescer.stats()},
+        "model_resilience": claude_chain.stats(),
+        "url_analysis": brand_index.stats(),
+        "benign_gate": benign_gate.stats(),
+        "claude_semaphore_available": claude_limiter.available,
+        "textract_semaphore_available": textract_limiter.available,
+        "concurrency": {
+            "claude": claude_limiter.stats(),
+            "textract": textract_limiter.stats(),
+        },
+        "textract_client_initialized": textract_client is not None,
+        "ocr": ocr_engines.stats(),
+        "preprocessing": {
+            **crop_stats.stats(),
+            "encoders": preprocessing_encoders,
+            "pool": preprocessing_pool.stats(),
+        }
+    }
+
+@metrics.collector
+def collect_component_metrics():
+    """Scrape-time samples from the stats() of the pipeline components."""
+    limiters = {"claude": claude_limiter.stats(), "textract": textract_limiter.stats()}
+    yield "limiter_limit", "gauge", "Current adaptive concurrency limit", [
+        ({"limiter": name}, stats["limit"]) for name, stats in limiters.items()
+    ]
+    yield "limiter_inflight", "gauge", "Calls holding a limiter slot", [
+        ({"limiter": name}, stats["inflight"]) for name, stats in limiters.items()
+    ]
+    yield "limiter_queue_depth", "gauge", "Calls waiting for a limiter slot", [
+        ({"limiter": name}, stats["queue_depth"]) for name, stats in limiters.items()
+    ]
+    yield "limiter_drops_total", "counter", "Throttled or timed-out calls seen by the limiter", [
+        ({"limiter": name}, stats["drops"]) for name, stats in limiters.items()
+    ]
+
+    near_duplicate = {
+        ("perceptual", "unified"): unified_similarity_index.stats(),
+        ("perceptual", "phishing"): phishing_similarity_index.stats(),
+        ("text", "unified"): unified_text_cache.stats(),
+        ("text", "phishing"): phishing_text_cache.stats(),
     }
+    yield "near_duplicate_lookups_total", "counter", "Near-duplicate cache lookups", [
+        ({"cache": cache, "pipeline": pipeline, "result": result}, stats[field])
+        for (cache, pipeline), stats in near_duplicate.items()
+        for result, field in (("hit", "hits"), ("miss", "misses"))
+    ]
+    cache = response_cache.stats()
+    yield "response_cache_entries", "gauge", "Entries in the response cache", [({}, cache["entries"])]
+    yield "response_cache_evictions_total", "counter", "Response cache evictions", [({}, cache["evictions"])]
+
+    chain = claude_chain.stats()
+    yield "claude_hedges_total", "counter", "Hedged second requests started", [({}, chain["hedges"])]
+    yield "claude_hedge_wins_total", "counter", "Hedged requests that answered first", [({}, chain["hedge_wins"])]
+    yield "claude_fallbacks_total", "counter", "Calls retried on the next model after an error", [({}, chain["fallbacks"])]
+    yield "claude_breaker_open", "gauge", "1 while the model's circuit breaker is not closed", [
+        ({"model": model}, int(breaker["state"] != "closed")) for model, breaker in chain["breakers"].items()
+    ]
+
+    usage = token_usage.stats()["endpoints"]
+    yield "llm_tokens_total", "counter", "Claude tokens by endpoint and kind", [
+        ({"endpoint": endpoint, "kind": kind.removesuffix("_tokens")}, totals[kind])
+        for endpoint, totals in usage.items()
+        for kind in ("input_tokens", "cache_write_tokens", "cache_read_tokens", "output_tokens")
+    ]
+    yield "llm_cost_usd_total", "counter", "Estimated Claude cost in USD", [
+        ({"endpoint": endpoint}, totals["cost_usd"]) for endpoint, totals in usage.items()
+    ]
+    batching = unified_batcher.stats()
+    yield "llm_batches_total", "counter", "Micro-batched Claude calls", [({}, batching["batches"])]
+    yield "llm_batched_items_total", "counter", "Texts sent in micro-batches", [({}, batching["batched_items"])]
+    yield "benign_gate_skipped_total", "counter", "Texts answered by the benign gate", [
+        ({}, benign_gate.stats()["skipped"])
+    ]
+
+    deadlines = request_deadlines.stats()
+    yield "request_deadline_exceeded_total", "counter", "Requests that ran out of time", [({}, deadlines["expired"])]
+    yield "request_deadline_stage_total", "counter", "Stages stopped by the request deadline", [
+        ({"stage": stage}, count) for stage, count in deadlines["expired_by_stage"].items()
+    ]
+    yield "client_disconnected_total", "counter", "Requests cancelled by a client disconnect", [
+        ({}, deadlines["client_disconnected"])
+    ]
+    yield "frames_superseded_total", "counter", "Frames cancelled by a newer frame of the same client", [
+        ({}, frame_scheduler.stats()["superseded"])
+    ]
+    incremental = incremental_ocr.stats()
+    yield "incremental_ocr_frames_total", "counter", "Session frames by incremental OCR mode", [
+        ({"mode": mode}, count) for mode, count in incremental["frames"].items()
+    ]
+    yield "incremental_ocr_pixel_ratio", "gauge", "Share of session frame pixels sent to OCR", [
+        ({}, incremental["ocr_pixel_ratio"])
+    ]
+    conversation = conversations.stats()
+    yield "conversation_sessions", "gauge", "Conversations with state in this worker", [({}, conversation["sessions"])]
+    yield "conversation_frames_total", "counter", "Session frames evaluated as part of a conversation", [
+        ({"new_text": "yes"}, conversation["frames"] - conversation["frames_without_new_text"]),
+        ({"new_text": "no"}, conversation["frames_without_new_text"]),
+    ]
+    yield "conversation_resets_total", "counter", "Conversations started over because another chat was on screen", [
+        ({}, conversation["resets"])
+    ]
+    yield "conversation_lock_waits_total", "counter", "Frames that waited for an earlier frame of their conversation", [
+        ({}, conversation["lock_waits"])
+    ]
+    dispatcher = notifications.stats()
+    yield "notification_queue_depth", "gauge", "Notifications waiting to be sent or retried", [({}, dispatcher["pending"])]
+    yield "notifications_total", "counter", "Finished notification deliveries", [
+        ({"channel": channel, "status": status}, count)
+        for status in ("sent", "failed")
+        for channel, count in dispatcher[status].items()
+    ]
+    yield "notification_retries_total", "counter", "Notification send attempts retried", [({}, dispatcher["retries"])]
+    coalescing = alert_coalescer.stats()
+    yield "alerts_coalesced_total", "counter", "Alerts absorbed into a digest", [({}, coalescing["coalesced"])]
+    yield "alert_digests_total", "counter", "Digests sent for coalesced alerts", [({}, coalescing["digests"])]
+    yield "alerts_escalated_total", "counter", "Repeated alerts sent at once for a higher scoring", [
+        ({}, coalescing["escalated"])
+    ]
+    yield "notifications_rejected_total", "counter", "Notifications refused with a full queue", [
+        ({}, dispatcher["rejected"])
+    ]
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus metrics of this worker process (text exposition format)"""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+def require_admin(request: Request) -> None:
+    """Admin endpoints are only served with ADMIN_TOKEN set and a matching X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/admin/traces", include_in_schema=False)
+async def slow_traces(request: Request, limit: int = 50, min_ms: float = 0):
+    """Recent slow-request traces of this worker, most recent first"""
+    require_admin(request)
+    return {"tracing": tracer.stats(), "traces": tracer.slow_traces(limit=limit, min_ms=min_ms)}
+
+@app.get("/admin/traces/{request_id}", include_in_schema=False)
+async def slow_trace(request: Request, request_id: str):
+    """One buffered slow trace by request ID"""
+    require_admin(request)
+    trace = tracer.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (only slow requests are kept)")
+    return trace
+
+@app.post("/admin/profile", include_in_schema=False)
+async def profile_worker(request: Request, seconds: float = 10, mode: str = "cpu"):
+    """
+    Samples this worker for the given seconds and returns collapsed stacks
+    (flamegraph.pl / speedscope input): mode=cpu for the event loop thread,
+    mode=async for the await chains of pending tasks.
+    """
+    require_admin(request)
+    if mode not in ("cpu", "async"):
+        raise HTTPException(status_code=400, detail="mode must be 'cpu' or 'async'")
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    return PlainTextResponse(await profiler.profile(seconds, mode))
 
 @app.get("/")
 async def root():
@@ -326,169 +1366,222 @@ async def root():
         "status": "running",
         "endpoints": [
             "/health",
+            "/metrics",
             "/evaluate",
+            "/evaluate-batch",
             "/evaluate-phishing",
             "/evaluate-social-engineering",
             "/extract-text",
             "/send-alert-email",
-            "/send-whatsapp-notification"
+            "/send-whatsapp-notification",
+            "/notifications/{delivery_id}"
         ]
     }
 
-@app.post("/evaluate-phishing")
-async def evaluate_phishing(file: UploadFile) -> PhishingEvaluation:
+@app.post("/evaluate-phishing", openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def evaluate_phishing(request: Request, ocr_engine: str | None = None) -> PhishingEvaluation:
+    engine = get_ocr_engine(ocr_engine)
+    deadline = request_deadlines.start(request)
+    upload = await read_screenshot(request)
     try:
-        image_data = await file.read()
-        
-        # Check cache first
-        image_hash = get_image_hash(image_data)
-        cache_key = f"phishing_{image_hash}"
-        if cache_key in response_cache:
-            return response_cache[cache_key]
-
-        # Optimize image before processing (resize, grayscale, JPEG conversion)
-        optimized_image_data = await optimize_image_async(image_data)
-
-        # Extract text asynchronously using AWS Textract
-        extracted_text = await extract_text_with_textract(optimized_image_data)
-
-        # Create message with extracted text (text-only model is cheaper than vision)
-        message = HumanMessage(
-            content=f"{EMAIL_PHISHING_PROMPT}\n\nTexto extraído de la imagen:\n{extracted_text}"
-        )
-
-        # Use semaphore to limit concurrent Claude API calls
-        async with claude_semaphore:
-            # Create a new model instance per request to avoid shared state issues
-            model = get_model()
-            structured_model = model.with_structured_output(PhishingEvaluation)
-            
-            # Add timeout to Claude API call
-            response = await asyncio.wait_for(
-                structured_model.ainvoke([message]),
-                timeout=CLAUDE_TIMEOUT
-            )
-        
-        # Cache the response
-        response_cache[cache_key] = response
-        
-        return response
+        image_data = upload.data
+
+        # Check cache first (digest computed while streaming the upload)
+        cache_key = f"phishing_{upload.digest}"
+        cached_response = cache_lookup(cache_key)
+        if cached_response is not None:
+            return cached_response
+
+        # Concurrent uploads of the same screenshot share one pipeline run,
+        # bounded by the request deadline
+        return await request_deadlines.run(request, deadline, lambda: inflight_requests.do(
+            cache_key, lambda: run_phishing_pipeline(image_data, cache_key, engine)
+        ))
     
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail=f"Request timed out after {CLAUDE_TIMEOUT}s")
+        raise HTTPException(status_code=504, detail=f"Request timed out after {deadline.timeout:g}s")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
-@app.post("/evaluate-social-engineering")
-async def evaluate_social_engineering(file: UploadFile) -> SocialEngineeringEvaluation:
+@app.post("/evaluate-social-engineering", openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def evaluate_social_engineering(request: Request) -> SocialEngineeringEvaluation:
+    deadline = request_deadlines.start(request)
+    upload = await read_screenshot(request)
+    # Media type from the sniffed header; Claude only reads these formats
+    if upload.header.format not in CLAUDE_IMAGE_FORMATS:
+        raise HTTPException(status_code=415, detail="Formato de imagen no soportado: usa PNG, JPEG, GIF o WEBP")
     try:
-        image_data = await file.read()
+        image_base64 = base64.b64encode(upload.data).decode('utf-8')
+        image_url = f"data:image/{upload.header.format.lower()};base64,{image_base64}"
 
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        # Static prompt as a cached system prefix, image last
+        messages = build_image_messages(SOCIAL_ENGINEERING_PROMPT, image_url)
 
-        # Determine image format from content type or filename
-        if file.content_type and '/' in file.content_type:
-            image_format = file.content_type.split('/')[1]
-        else:
-            # Fallback: try to determine from filename
-            image_format = file.filename.split('.')[-1] if file.filename and '.' in file.filename else 'png'
-
-        image_url = f"data:image/{image_format};base64,{image_base64}"
-
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "text",
-                    "text": SOCIAL_ENGINEERING_PROMPT,
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {"url": image_url}
-                }
-            ]
-        )
-
-        # Use semaphore to limit concurrent Claude API calls
-        async with claude_semaphore:
-            # Create a new model instance per request to avoid shared state issues
-            model = get_model()
-            structured_model = model.with_structured_output(SocialEngineeringEvaluation)
-            
-            # Add timeout to Claude API call
-            response = await asyncio.wait_for(
-                structured_model.ainvoke([message]),
-                timeout=CLAUDE_TIMEOUT
-            )
-
-        return response
+        return await request_deadlines.run(request, deadline, lambda: invoke_claude(
+            SocialEngineeringEvaluation, messages, endpoint="evaluate_social_engineering"
+        ))
     
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail=f"Request timed out after {CLAUDE_TIMEOUT}s")
+        raise HTTPException(status_code=504, detail=f"Request timed out after {deadline.timeout:g}s")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
-@app.post("/evaluate")
-async def evaluate_unified(file: UploadFile) -> UnifiedEvaluation:
+@app.post("/evaluate", openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def evaluate_unified(
+    request: Request,
+    ocr_engine: str | None = None,
+    client_id: str | None = None,
+    app: str | None = None,
+    window: str | None = None,
+) -> UnifiedEvaluation:
+    engine = get_ocr_engine(ocr_engine)
+    deadline = request_deadlines.start(request)
+    upload = await read_screenshot(request)
+    session_id = client_id or request.headers.get(CLIENT_ID_HEADER)
+    client_id = session_id if FRAME_SCHEDULING else None
+    conversation_id = conversation_key(
+        session_id,
+        app or request.headers.get(CLIENT_APP_HEADER),
+        window or request.headers.get(CLIENT_WINDOW_HEADER),
+        CONVERSATION_APPS,
+    ) if CONVERSATION_STATE else None
     try:
-        image_data = await file.read()
-
-        # Check cache first
-        image_hash = get_image_hash(image_data)
-        cache_key = f"unified_{image_hash}"
-        if cache_key in response_cache:
-            return response_cache[cache_key]
-
-        # Optimize image before processing (resize, grayscale, JPEG conversion)
-        optimized_image_data = await optimize_image_async(image_data)
+        image_data = upload.data
+        cache_key = f"unified_{upload.digest}"
+
+        if conversation_id:
+            # Chat frame scored in the context of its conversation: no shared
+            # per-frame cache, and only the same conversation's uploads coalesce
+            flight_key = f"{cache_key}_{conversation_id}"
+            pipeline = lambda: run_conversation_pipeline(image_data, engine, session_id, conversation_id)
+        else:
+            # Check cache first (digest computed while streaming the upload)
+            cached_response = cache_lookup(cache_key)
+            if cached_response is not None:
+                # This frame is the client's newest: older pending ones are stale
+                frame_scheduler.supersede(client_id)
+                return cached_response
+            flight_key = cache_key
+            pipeline = lambda: run_unified_pipeline(image_data, cache_key, engine, session_id)
+
+        # Concurrent uploads of the same screenshot share one pipeline run,
+        # bounded by the request deadline; a newer frame from the same
+        # client cancels this one
+        return await frame_scheduler.run(client_id, lambda: request_deadlines.run(
+            request, deadline, lambda: inflight_requests.do(flight_key, pipeline)
+        ))
+    
+    except FrameSuperseded:
+        raise HTTPException(status_code=409, detail="Superseded by a newer frame")
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Request timed out after {deadline.timeout:g}s")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
-        # Extract text asynchronously using AWS Textract
-        extracted_text = await extract_text_with_textract(optimized_image_data)
+@app.post("/evaluate-batch", openapi_extra=BATCH_UPLOAD_OPENAPI)
+async def evaluate_batch(request: Request, ocr_engine: str | None = None) -> BatchEvaluationResponse:
+    """
+    Evalúa varias capturas en una sola solicitud (campo 'files').
 
-        # Create message with extracted text (text-only model is cheaper than vision)
-        system_message = SystemMessage(
-            content=UNIFIED_EVALUATION_PROMPT
-        )
-        message = HumanMessage(
-            content=f"Texto extraído de la imagen:\n{extracted_text}"
-        )
+    Las imágenes se deduplican por hash y las distintas avanzan en paralelo
+    por el pipeline (optimización, OCR y Claude se solapan entre imágenes),
+    dentro de los mismos límites de concurrencia que /evaluate. Los
+    resultados se devuelven en el orden de subida.
+    """
+    start_time = time.time()
+    engine = get_ocr_engine(ocr_engine)
+    deadline = request_deadlines.start(request)
+    uploads = await read_image_uploads(
+        request,
+        field_name="files",
+        max_bytes=MAX_UPLOAD_BYTES,
+        max_pixels=MAX_IMAGE_PIXELS,
+        max_files=MAX_BATCH_SIZE,
+    )
 
-        # Use semaphore to limit concurrent Claude API calls
-        async with claude_semaphore:
-            # Create a new model instance per request to avoid shared state issues
-            model = get_model()
-            structured_model = model.with_structured_output(UnifiedEvaluation)
-            
-            # Add timeout to Claude API call
-            response = await asyncio.wait_for(
-                structured_model.ainvoke([system_message, message]),
-                timeout=CLAUDE_TIMEOUT
-            )
+    # Deduplicate by hash: identical images are evaluated once
+    first_index: dict[str, int] = {}
+    for index, upload in enumerate(uploads):
+        first_index.setdefault(upload.digest, index)
 
-        # Cache the response
-        response_cache[cache_key] = response
+    batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
 
-        return response
-    
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail=f"Request timed out after {CLAUDE_TIMEOUT}s")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+    async def evaluate_item(index: int) -> BatchItemResult:
+        upload = uploads[index]
+        item_start = time.time()
+        result = BatchItemResult(index=index, filename=upload.filename, image_hash=upload.digest,
+                                 cached=False, processing_time_ms=0)
+        cache_key = f"unified_{upload.digest}"
+        try:
+            cached_response = cache_lookup(cache_key)
+            if cached_response is not None:
+                result.evaluation = cached_response
+                result.cached = True
+            else:
+                async def run_item():
+                    # Waiting for a batch slot is charged to the request deadline
+                    async with batch_slots:
+                        return await inflight_requests.do(
+                            cache_key, lambda: run_unified_pipeline(upload.data, cache_key, engine)
+                        )
+
+                result.evaluation = await request_deadlines.run(request, deadline, run_item)
+        except ClientDisconnected:
+            result.error = "Client disconnected"
+        except asyncio.TimeoutError:
+            result.error = f"Request timed out after {deadline.timeout:g}s"
+        except Exception as e:
+            result.error = f"Internal error: {str(e)}"
+        result.processing_time_ms = int((time.time() - item_start) * 1000)
+        return result
+
+    unique_results = dict(zip(
+        first_index.values(),
+        await asyncio.gather(*(evaluate_item(index) for index in first_index.values())),
+    ))
+
+    results = []
+    for index, upload in enumerate(uploads):
+        original = first_index[upload.digest]
+        if original == index:
+            results.append(unique_results[index])
+        else:
+            results.append(unique_results[original].model_copy(update={
+                "index": index,
+                "filename": upload.filename,
+                "duplicate_of": original,
+                "processing_time_ms": 0,
+            }))
+
+    return BatchEvaluationResponse(
+        results=results,
+        unique_images=len(first_index),
+        total_time_ms=int((time.time() - start_time) * 1000),
+    )
 
-@app.post("/extract-text")
-async def extract_text(file: UploadFile) -> OCRResponse:
+@app.post("/extract-text", openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def extract_text(request: Request, ocr_engine: str | None = None) -> OCRResponse:
     """
-    Extrae texto de una imagen usando AWS Textract
+    Extrae texto de una imagen usando el motor OCR configurado (AWS Textract por defecto)
     """
+    engine = get_ocr_engine(ocr_engine)
+    start_time = time.time()
+    deadline = request_deadlines.start(request)
+    # Leer imagen en streaming (hash y validación mientras llega)
+    upload = await read_screenshot(request)
     try:
-        start_time = time.time()
-        # Leer imagen
-        image_data = await file.read()
+        image_data = upload.data
         
         # Check cache first
-        image_hash = get_image_hash(image_data)
-        cache_key = f"ocr_{image_hash}"
-        if cache_key in response_cache:
-            cached_result = response_cache[cache_key]
+        cache_key = f"ocr_{engine.name}_{upload.digest}"
+        cached_result = cache_lookup(cache_key)
+        if cached_result is not None:
             processing_time_ms = int((time.time() - start_time) * 1000)
             return OCRResponse(
                 parsed_text=cached_result,
@@ -497,24 +1590,20 @@ async def extract_text(file: UploadFile) -> OCRResponse:
                 processing_time=str(processing_time_ms)
             )
         
-        # Optimize image before processing (resize, grayscale, JPEG conversion)
-        optimized_image_data = await optimize_image_async(image_data)
-        
-        # Extraer texto usando AWS Textract con imagen optimizada (native async)
-        extracted_text = await extract_text_with_textract(optimized_image_data)
+        # Concurrent uploads of the same screenshot share one OCR run,
+        # bounded by the request deadline
+        extracted_text = await request_deadlines.run(request, deadline, lambda: inflight_requests.do(
+            cache_key, lambda: run_ocr_pipeline(image_data, cache_key, engine)
+        ))
         
         end_time = time.time()
         processing_time_ms = int((end_time - start_time) * 1000)
         
         # Verificar si hubo error
-        is_error = extracted_text.startswith("Error en Textract:")
+        is_error = ocr_engines.is_error(extracted_text)
         error_message = extracted_text if is_error else None
         parsed_text = extracted_text if not is_error else ""
         
-        # Cache successful results
-        if not is_error:
-            response_cache[cache_key] = parsed_text
-        
         return OCRResponse(
             parsed_text=parsed_text,
             is_error_response=is_error,
@@ -522,11 +1611,13 @@ async def extract_text(file: UploadFile) -> OCRResponse:
             processing_time=str(processing_time_ms)
         )
     
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except asyncio.TimeoutError:
         return OCRResponse(
             parsed_text="",
             is_error_response=True,
-            error_message=f"Timeout: La extracción de texto excedió {TEXTRACT_TIMEOUT}s",
+            error_message=f"Timeout: La extracción de texto excedió {deadline.timeout:g}s",
             processing_time=None
         )
     except Exception as e:
@@ -550,7 +1641,8 @@ async def send_alert_email(request: EmailAlertRequest) -> EmailAlertResponse:
 >>>>>>> Stashed changes
 
     Returns:
-        EmailAlertResponse con el estado del envío
+        EmailAlertResponse con el estado del envío. El email se envía en segundo
+        plano: el resultado se consulta en /notifications/{delivery_id}
     """
     try:
         # Preparar los datos para el servicio de email
@@ -560,15 +1652,25 @@ async def send_alert_email(request: EmailAlertRequest) -> EmailAlertResponse:
             "type": request.type
         }
 
-        # Enviar el email usando el servicio
-        result = send_phishing_alert(data=email_data, recipient_email=request.recipient_email)
+        # Encolar el email (o agruparlo con uno reciente); se envía en segundo plano
+        with span("send_email"):
+            delivery = alert_coalescer.submit("email", request.recipient_email, email_data)
 
+        if delivery["status"] == "coalesced":
+            message = f"Alert email coalesced into a digest for {request.recipient_email}"
+        else:
+            message = f"Alert email queued for {request.recipient_email}"
         return EmailAlertResponse(
-            status=result["status"],
-            message=result["message"],
-            message_id=result.get("message_id")
+            status=delivery["status"],
+            message=message,
+            delivery_id=delivery["delivery_id"]
         )
 
+    except NotificationQueueFull:
+        return EmailAlertResponse(
+            status="error",
+            message="Cola de notificaciones llena, intenta de nuevo más tarde"
+        )
     except Exception as e:
         return EmailAlertResponse(
             status="error",
@@ -584,20 +1686,42 @@ async def send_whatsapp_notification_endpoint(request: WhatsAppNotificationReque
         request: Datos de la notificación (to_number, reason)
 
     Returns:
-        WhatsAppNotificationResponse con el estado del envío
+        WhatsAppNotificationResponse con el estado del envío. La notificación se
+        envía en segundo plano: el resultado se consulta en /notifications/{delivery_id}
     """
     try:
-        # Enviar la notificación usando el servicio
-        result = send_whatsapp_notification(to_number=request.to_number, reason=request.reason)
+        # Encolar la notificación (o agruparla con una reciente); se envía en segundo plano
+        with span("send_whatsapp"):
+            delivery = alert_coalescer.submit("whatsapp", request.to_number, {"reason": request.reason})
 
+        if delivery["status"] == "coalesced":
+            message = f"WhatsApp notification coalesced into a digest for {request.to_number}"
+        else:
+            message = f"WhatsApp notification queued for {request.to_number}"
         return WhatsAppNotificationResponse(
-            status=result["status"],
-            message=result["message"],
-            message_id=result.get("message_id")
+            status=delivery["status"],
+            message=message,
+            delivery_id=delivery["delivery_id"]
         )
 
+    except NotificationQueueFull:
+        return WhatsAppNotificationResponse(
+            status="error",
+            message="Cola de notificaciones llena, intenta de nuevo más tarde"
+        )
     except Exception as e:
         return WhatsAppNotificationResponse(
             status="error",
             message=f"Error al enviar notificación de WhatsApp: {str(e)}"
         )
+
+@app.get("/notifications/{delivery_id}")
+async def notification_status(delivery_id: str):
+    """
+    Estado de una notificación encolada: queued, sending, retrying, sent o failed,
+    con el número de intentos, el último error y el message_id del gateway.
+    """
+    delivery = notifications.status(delivery_id)
+    if delivery is None:
+        raise HTTPException(status_code=404, detail="Notificación no encontrada")
+    return delivery
@@ -0,0 +1,126 @@
+import threading
+from typing import Any
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+# Prefix caching: blocks marked with this cache_control are stored by the
+# provider and re-read at a fraction of the input price on later calls whose
+# prompt starts with the same bytes (tool schemas + system prompt)
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# USD per million tokens: (input, cache write, cache read, output)
+MODEL_PRICING = {
+    "claude-haiku-4-5": (1.00, 1.25, 0.10, 5.00),
+    "claude-sonnet-4-5": (3.00, 3.75, 0.30, 15.00),
+}
+
+
+def cached_system_message(prompt: str) -> SystemMessage:
+    """System message whose content is marked as a cacheable prefix."""
+    return SystemMessage(content=[{"type": "text", "text": prompt, "cache_control": CACHE_CONTROL}])
+
+
+def build_messages(system_prompt: str, variable_text: str) -> list[BaseMessage]:
+    """
+    Messages for a text-only evaluation: the static system prompt first
+    (cacheable) and the per-request text last, so every call shares the
+    longest possible prefix.
+    """
+    return [cached_system_message(system_prompt), HumanMessage(content=variable_text)]
+
+
+def build_image_messages(system_prompt: str, image_url: str) -> list[BaseMessage]:
+    """Same layout as build_messages for vision calls: cached prompt, then the image."""
+    return [
+        cached_system_message(system_prompt),
+        HumanMessage(content=[{"type": "image_url", "image_url": {"url": image_url}}]),
+    ]
+
+
+def _pricing(model_name: str | None) -> tuple[float, float, float, float] | None:
+    for prefix, pricing in MODEL_PRICING.items():
+        if model_name and model_name.startswith(prefix):
+            return pricing
+    return None
+
+
+class TokenUsage:
+    """
+    Token and cost accounting per endpoint, fed from the usage_metadata of
+    each model response.
+    - input_tokens: uncached input tokens
+    - cache_write_tokens / cache_read_tokens: prefix tokens stored / reused
+    - output_tokens: generated tokens
+    """
+
+    FIELDS = ("calls", "input_tokens", "cache_write_tokens", "cache_read_tokens", "output_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: dict[str, dict[str, float]] = {}
+
+    def record(self, endpoint: str, message: Any) -> dict:
+        """Records the usage of one model response and returns it."""
+        usage = getattr(message, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        cache_read = details.get("cache_read") or 0
+        cache_write = (
+            (details.get("cache_creation") or 0)
+            + (details.get("ephemeral_5m_input_tokens") or 0)
+            + (details.get("ephemeral_1h_input_tokens") or 0)
+        )
+        call = {
+            "calls": 1,
+            # usage_metadata input_tokens already includes the cached tokens
+            "input_tokens": max((usage.get("input_tokens") or 0) - cache_read - cache_write, 0),
+            "cache_write_tokens": cache_write,
+            "cache_read_tokens": cache_read,
+            "output_tokens": usage.get("output_tokens") or 0,
+        }
+        model_name = (getattr(message, "response_metadata", None) or {}).get("model_name")
+        pricing = _pricing(model_name)
+        call["cost_usd"] = sum(
+            call[field] * price / 1_000_000
+            for field, price in zip(self.FIELDS[1:], pricing)
+        ) if pricing else 0.0
+
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, dict.fromkeys(self.FIELDS + ("cost_usd",), 0))
+            for field, value in call.items():
+                totals[field] += value
+        return call
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for endpoint, totals in self._endpoints.items():
+                prompt_tokens = totals["input_tokens"] + totals["cache_write_tokens"] + totals["cache_read_tokens"]
+                endpoints[endpoint] = {
+                    **{field: int(totals[field]) for field in self.FIELDS},
+                    "cache_hit_ratio": round(totals["cache_read_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+                    "cost_usd": round(totals["cost_usd"], 6),
+                }
+            return {
+                "endpoints": endpoints,
+                "total_cost_usd": round(sum(e["cost_usd"] for e in endpoints.values()), 6),
+            }
+
+
+token_usage = TokenUsage()
+
+
+async def invoke_structured(structured_model: Any, messages: list[BaseMessage], endpoint: str) -> Any:
+    """
+    Runs a structured-output runnable built with include_raw=True and records
+    its token usage under endpoint.
+
+    Raises:
+        The parsing error if the model output does not match the schema
+    """
+    result = await structured_model.ainvoke(messages)
+    token_usage.record(endpoint, result["raw"])
+    if result.get("parsing_error") is not None:
+        raise result["parsing_error"]
+    if result.get("parsed") is None:
+        raise ValueError("Model returned no structured output")
+    return result["parsed"]
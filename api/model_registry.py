@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of long-lived chat model clients.
+
+    Models are registered by name with a factory and built once (at warm-up
+    or on first use); their structured-output runnables are cached per
+    schema. Connection reuse comes from langchain-anthropic itself: every
+    ChatAnthropic with the same API host, timeout and proxy shares its
+    process-wide cached httpx client, so TLS sessions are reused across
+    requests and across models (e.g. a model and its fallback).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories: dict[str, Callable[[], Any]] = {}
+        self._schemas: dict[str, tuple[tuple[type, ...], bool]] = {}
+        self._models: dict[str, Any] = {}
+        self._structured: dict[tuple[str, type, bool], Any] = {}
+        self._errors: dict[str, str] = {}
+        self.build_ms: dict[str, float] = {}
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        schemas: tuple[type, ...] = (),
+        include_raw: bool = False,
+    ) -> None:
+        """
+        Registers a model factory. schemas lists the structured-output
+        runnables (with include_raw) to prepare at warm-up.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._schemas[name] = (schemas, include_raw)
+            self._models.pop(name, None)
+            self._structured = {key: value for key, value in self._structured.items() if key[0] != name}
+
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown model: {name}")
+                start = time.perf_counter()
+                model = self._factories[name]()
+                self.build_ms[name] = round((time.perf_counter() - start) * 1000, 2)
+                self._models[name] = model
+            return model
+
+    def structured(self, name: str, schema: type, include_raw: bool = False) -> Any:
+        """Cached model.with_structured_output(schema) runnable."""
+        key = (name, schema, include_raw)
+        runnable = self._structured.get(key)
+        if runnable is None:
+            runnable = self.get(name).with_structured_output(schema, include_raw=include_raw)
+            self._structured[key] = runnable
+        return runnable
+
+    async def warm_up(self) -> None:
+        """
+        Builds every registered model and its declared structured runnables.
+        Failures are recorded in stats() and the model is retried on first use.
+        """
+        for name in list(self._factories):
+            try:
+                await asyncio.to_thread(self.get, name)
+                schemas, include_raw = self._schemas.get(name, ((), False))
+                for schema in schemas:
+                    self.structured(name, schema, include_raw=include_raw)
+                self._errors.pop(name, None)
+            except Exception as e:
+                self._errors[name] = str(e)
+
+    async def aclose(self) -> None:
+        self._models.clear()
+        self._structured.clear()
+
+    def stats(self) -> dict:
+        return {
+            "registered": sorted(self._factories),
+            "built": sorted(self._models),
+            "structured_runnables": len(self._structured),
+            "build_ms": dict(self.build_ms),
+            "errors": dict(self._errors),
+        }
+
+
+model_registry = ModelRegistry()
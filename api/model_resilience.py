@@ -0,0 +1,295 @@
+import asyncio
+import bisect
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+# Histogram bucket upper bounds in ms: 10ms to ~2min, 20% apart
+LATENCY_BUCKETS_MS = [10 * 1.2 ** i for i in range(52)]
+# Counts are halved every this many samples, so percentiles follow the
+# upstream's current behaviour instead of its whole history
+HISTOGRAM_DECAY_EVERY = 500
+# Samples needed before a model's own percentiles replace the configured defaults
+MIN_SAMPLES = 20
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with exponential decay."""
+
+    def __init__(self):
+        self.counts = [0.0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.samples = 0
+
+    def record(self, latency_ms: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.total += 1
+        self.samples += 1
+        if self.samples % HISTOGRAM_DECAY_EVERY == 0:
+            self.counts = [count / 2 for count in self.counts]
+            self.total /= 2
+
+    def percentile(self, p: float) -> float | None:
+        """Upper bound (ms) of the bucket holding the p-quantile, None without data."""
+        if self.total == 0:
+            return None
+        target = p * self.total
+        cumulative = 0.0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target and count:
+                return LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)]
+        return LATENCY_BUCKETS_MS[-1]
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "p50_ms": self._rounded(0.50),
+            "p95_ms": self._rounded(0.95),
+            "p99_ms": self._rounded(0.99),
+        }
+
+    def _rounded(self, p: float) -> float | None:
+        value = self.percentile(p)
+        return round(value, 1) if value is not None else None
+
+
+class CircuitBreaker:
+    """
+    Per-model breaker: closed -> open when the recent calls of a model are
+    mostly failures (errors or calls slower than slow_call_ms), open ->
+    half-open after cooldown seconds, where a single probe call decides
+    whether it closes again or re-opens.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_ratio: float = 0.5,
+        consecutive_failures: int = 5,
+        cooldown: float = 30.0,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.consecutive_failures = consecutive_failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._results: deque[bool] = deque(maxlen=window)
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """True if a call may be sent to this model now."""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record(self, success: bool) -> None:
+        if self.state == "half_open":
+            if success:
+                self.state = "closed"
+                self._results.clear()
+                self._consecutive = 0
+            else:
+                self._open()
+            return
+
+        self._results.append(success)
+        self._consecutive = 0 if success else self._consecutive + 1
+        failures = self._results.count(False)
+        if self._consecutive >= self.consecutive_failures or (
+            len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_ratio
+        ):
+            self._open()
+
+    def release(self) -> None:
+        """The call was abandoned without an outcome (e.g. it lost a hedge race)."""
+        self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.opened += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "opened": self.opened,
+            "recent_failure_ratio": round(self._results.count(False) / len(self._results), 3) if self._results else 0.0,
+        }
+
+
+class HedgedModelChain:
+    """
+    Runs a call against an ordered chain of models (e.g. Haiku -> Sonnet)
+    with tail-latency protection:
+    - The first model whose breaker allows it is called. If it has not
+      answered after its own hedge_percentile latency (clamped to
+      [min_hedge_ms, max_hedge_ms]), the next model is started in parallel
+      and the first answer wins; the loser is cancelled.
+    - A model that fails is replaced by the next one immediately.
+    - Each model has a CircuitBreaker fed with its errors and its slow calls
+      (slower than slow_factor x its median), so a degraded model is skipped
+      for the breaker cooldown instead of being waited on.
+    - Hedges are capped at hedge_budget of all calls so a slow upstream
+      cannot double the traffic.
+    - If every breaker is open the chain is tried anyway (fail open).
+    """
+
+    def __init__(
+        self,
+        models: list[str],
+        hedge_percentile: float = 0.95,
+        min_hedge_ms: float = 500,
+        max_hedge_ms: float = 10_000,
+        hedge_budget: float = 0.1,
+        slow_call_ms: float = 15_000,
+        slow_factor: float = 4.0,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+    ):
+        self.models = models
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_ms = min_hedge_ms
+        self.max_hedge_ms = max_hedge_ms
+        self.hedge_budget = hedge_budget
+        self.slow_call_ms = slow_call_ms
+        self.slow_factor = slow_factor
+        self.breakers = {model: breaker_factory() for model in models}
+        # Latency per (model, kind): batch calls are slower than single ones
+        self.histograms: dict[tuple[str, str], LatencyHistogram] = {}
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.wins: dict[str, int] = {model: 0 for model in models}
+        self.skipped: dict[str, int] = {model: 0 for model in models}
+
+    def _histogram(self, model: str, kind: str) -> LatencyHistogram:
+        key = (model, kind)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        return self.histograms[key]
+
+    def hedge_delay(self, model: str, kind: str) -> float:
+        """Seconds to wait for model before hedging."""
+        histogram = self._histogram(model, kind)
+        latency = histogram.percentile(self.hedge_percentile) if histogram.samples >= MIN_SAMPLES else None
+        if latency is None:
+            latency = self.max_hedge_ms
+        return min(max(latency, self.min_hedge_ms), self.max_hedge_ms) / 1000
+
+    def slow_threshold_ms(self, model: str, kind: str) -> float:
+        """
+        Latency above which a successful call still counts against the
+        breaker: slow_factor x the model's median once it is known, capped
+        at slow_call_ms.
+        """
+        histogram = self._histogram(model, kind)
+        median = histogram.percentile(0.5) if histogram.samples >= MIN_SAMPLES else None
+        if median is None:
+            return self.slow_call_ms
+        return min(max(median * self.slow_factor, self.min_hedge_ms), self.slow_call_ms)
+
+    def _next_model(self, remaining: list[str], force: bool) -> str | None:
+        """Pops the next model whose breaker lets it through (the first one if force)."""
+        while remaining:
+            model = remaining.pop(0)
+            if self.breakers[model].allow():
+                return model
+            self.skipped[model] += 1
+            if force and not remaining:
+                return model
+        return None
+
+    async def run(self, call: Callable[[str], Awaitable[Any]], kind: str = "default") -> Any:
+        """Returns the first successful call(model) result; raises the last error if all fail."""
+        self.calls += 1
+        remaining = list(self.models)
+        pending: dict[asyncio.Task, tuple[str, float]] = {}
+        last_error: BaseException | None = None
+        hedged = False
+        hedge_models: set[str] = set()
+
+        def start(model: str) -> None:
+            pending[asyncio.ensure_future(call(model))] = (model, time.perf_counter())
+
+        # Fail open: with every breaker open the last model is still tried
+        start(self._next_model(remaining, force=True))
+        try:
+            while pending:
+                timeout = None
+                if remaining and not hedged:
+                    first_model, started = next(iter(pending.values()))
+                    elapsed = time.perf_counter() - started
+                    timeout = max(self.hedge_delay(first_model, kind) - elapsed, 0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Hedge delay passed with no answer: start the next model too
+                    hedged = True
+                    if self.hedges < self.hedge_budget * self.calls:
+                        model = self._next_model(remaining, force=False)
+                        if model is not None:
+                            self.hedges += 1
+                            hedge_models.add(model)
+                            start(model)
+                    continue
+
+                for task in done:
+                    model, started = pending.pop(task)
+                    latency_ms = (time.perf_counter() - started) * 1000
+                    error = task.exception()
+                    slow = latency_ms > self.slow_threshold_ms(model, kind)
+                    self._histogram(model, kind).record(latency_ms)
+                    self.breakers[model].record(error is None and not slow)
+                    if error is None:
+                        self.wins[model] += 1
+                        self.hedge_wins += model in hedge_models
+                        return task.result()
+                    last_error = error
+
+                # Every running call failed: fall back to the next model now
+                if not pending:
+                    model = self._next_model(remaining, force=False)
+                    if model is not None:
+                        self.fallbacks += 1
+                        start(model)
+            raise last_error
+        finally:
+            for task, (model, started) in pending.items():
+                task.cancel()
+                # A call that lost the race is censored: it took at least this long
+                latency_ms = (time.perf_counter() - started) * 1000
+                if latency_ms > self.slow_threshold_ms(model, kind):
+                    self.breakers[model].record(False)
+                else:
+                    self.breakers[model].release()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "wins": dict(self.wins),
+            "skipped_open_breaker": dict(self.skipped),
+            "breakers": {model: breaker.stats() for model, breaker in self.breakers.items()},
+            "latency": {
+                f"{model}:{kind}": histogram.stats() for (model, kind), histogram in self.histograms.items()
+            },
+            "hedge_delay_ms": {
+                f"{model}:{kind}": round(self.hedge_delay(model, kind) * 1000, 1)
+                for (model, kind) in self.histograms
+            },
+        }
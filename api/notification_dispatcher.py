@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import random
+import time
+import uuid
+from collections import OrderedDict
+
+import httpx
+
+# Delivery states: queued -> sending -> (retrying -> sending)* -> sent | failed
+TERMINAL_STATES = ("sent", "failed")
+
+
+class NotificationQueueFull(Exception):
+    """The dispatcher already holds queue_size undelivered notifications."""
+
+
+class NotificationDispatcher:
+    """
+    Sends alert notifications (email, WhatsApp) off the request path.
+
+    submit() stores the delivery and returns at once; a few worker tasks
+    POST the payloads through one pooled httpx client. Timeouts, connection
+    errors, 429 and 5xx answers are retried with exponential backoff and full
+    jitter (Retry-After wins when the gateway sends it); other 4xx answers
+    fail at once. Waiting retries count against queue_size, so a dead
+    gateway bounds memory instead of growing the backlog.
+
+    Delivery status is kept for the last status_capacity deliveries and can
+    be looked up by ID.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        queue_size: int = 1000,
+        max_attempts: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 10.0,
+        pool_size: int = 10,
+        status_capacity: int = 10000,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.status_capacity = status_capacity
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._deliveries: OrderedDict[str, dict] = OrderedDict()
+        self._requests: dict[str, tuple[str, dict]] = {}
+        self._workers: list[asyncio.Task] = []
+        self._retry_tasks: set[asyncio.Task] = set()
+        self._client: httpx.AsyncClient | None = None
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.retries = 0
+        self.counts = {"sent": {}, "failed": {}}
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+        # Fresh context: workers must not inherit the request (trace, deadline) that started them
+        context = contextvars.Context()
+        self._workers = [
+            asyncio.get_running_loop().create_task(self._worker(), name=f"notification-worker-{i}", context=context)
+            for i in range(self.workers)
+        ]
+
+    async def close(self, drain_timeout: float = 5.0) -> None:
+        """Waits up to drain_timeout for queued sends, then stops the workers and the client."""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+        tasks = [*self._workers, *self._retry_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def submit(self, channel: str, url: str, payload: dict, recipient: str) -> dict:
+        """Queues a delivery and returns its status record. Raises NotificationQueueFull."""
+        self.start()
+        if self.pending >= self.queue_size:
+            self.rejected += 1
+            raise NotificationQueueFull()
+
+        delivery_id = uuid.uuid4().hex
+        now = time.time()
+        delivery = {
+            "id": delivery_id,
+            "channel": channel,
+            "recipient": recipient,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "message_id": None,
+            "error": None,
+            "next_attempt_at": None,
+        }
+        self._deliveries[delivery_id] = delivery
+        self._requests[delivery_id] = (url, payload)
+        self._evict()
+        self.pending += 1
+        self.submitted += 1
+        self._queue.put_nowait(delivery_id)
+        return dict(delivery)
+
+    def status(self, delivery_id: str) -> dict | None:
+        delivery = self._deliveries.get(delivery_id)
+        return dict(delivery) if delivery is not None else None
+
+    def _evict(self) -> None:
+        """Forgets the oldest finished deliveries beyond status_capacity."""
+        excess = len(self._deliveries) - self.status_capacity
+        if excess <= 0:
+            return
+        for delivery_id in [d for d, delivery in self._deliveries.items() if delivery["status"] in TERMINAL_STATES][:excess]:
+            del self._deliveries[delivery_id]
+
+    def _update(self, delivery: dict, **fields) -> None:
+        delivery.update(fields, updated_at=time.time())
+
+    def _finish(self, delivery: dict, status: str, **fields) -> None:
+        self._update(delivery, status=status, **fields)
+        self._requests.pop(delivery["id"], None)
+        self.pending -= 1
+        channel_counts = self.counts[status]
+        channel_counts[delivery["channel"]] = channel_counts.get(delivery["channel"], 0) + 1
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def _retry_later(self, delivery_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(delivery_id)
+
+    async def _worker(self) -> None:
+        while True:
+            delivery_id = await self._queue.get()
+            try:
+                await self._send(delivery_id)
+            except Exception as e:
+                # Never lose a worker to an unexpected error
+                delivery = self._deliveries[delivery_id]
+                if delivery["status"] not in TERMINAL_STATES:
+                    self._finish(delivery, "failed", error=f"{type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, delivery_id: str) -> None:
+        # Only finished deliveries are evicted, so a queued one is always there
+        delivery = self._deliveries[delivery_id]
+        url, payload = self._requests[delivery_id]
+        attempt = delivery["attempts"] + 1
+        self._update(delivery, status="sending", attempts=attempt, next_attempt_at=None)
+        retry_after = None
+        try:
+            response = await self._client.post(url, json=payload)
+        except httpx.TimeoutException:
+            error = "Request timeout: El servidor tardó demasiado en responder"
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+        else:
+            if response.is_success:
+                try:
+                    message_id = (response.json() or {}).get("id")
+                except (ValueError, AttributeError):
+                    message_id = None
+                self._finish(delivery, "sent", message_id=message_id, error=None)
+                return
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            if response.status_code != 429 and response.status_code < 500:
+                self._finish(delivery, "failed", error=error)
+                return
+            retry_after = response.headers.get("Retry-After")
+
+        if attempt >= self.max_attempts:
+            self._finish(delivery, "failed", error=error)
+            return
+        self.retries += 1
+        delay = self._backoff(attempt, retry_after)
+        self._update(delivery, status="retrying", error=error, next_attempt_at=time.time() + delay)
+        task = asyncio.create_task(self._retry_later(delivery_id, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self._queue.qsize(),
+            "pending": self.pending,
+            "waiting_retry": len(self._retry_tasks),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "sent": self.counts["sent"],
+            "failed": self.counts["failed"],
+        }
@@ -0,0 +1,249 @@
+import asyncio
+import io
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from deadline import DeadlineExceeded, stage_timeout
+
+try:
+    import pytesseract
+except ImportError:  # Optional dependency: only needed for the local engine
+    pytesseract = None
+
+NO_TEXT_RESULT = "No se pudo extraer texto"
+
+# Number of recent calls kept per engine for latency percentiles
+LATENCY_WINDOW = 512
+
+
+@dataclass
+class OCRLine:
+    """A line of text and its bounding box, as fractions of the image size."""
+    text: str
+    left: float
+    top: float
+    width: float
+    height: float
+
+
+def lines_to_text(lines: list[OCRLine]) -> str:
+    """The extract_text result for a list of lines."""
+    text_lines = [line.text for line in lines if line.text]
+    return '\n'.join(text_lines) if text_lines else NO_TEXT_RESULT
+
+
+class OCREngine:
+    """
+    Base class for OCR engines.
+
+    Engines follow the contract of the original Textract helper: they never
+    raise, they return the extracted lines joined by newlines, NO_TEXT_RESULT
+    when nothing was found, or a string starting with error_prefix on failure.
+    Engines with supports_layout also return the lines with their positions
+    (extract_lines), or the same error string.
+    """
+
+    name = "base"
+    label = "OCR"
+    supports_layout = False
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self._latencies_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def error_prefix(self) -> str:
+        return f"Error en {self.label}:"
+
+    def is_error(self, text: str) -> bool:
+        return text.startswith(self.error_prefix)
+
+    async def extract_text(self, image_bytes: bytes) -> str:
+        return await self._timed(self._extract_text, image_bytes)
+
+    async def extract_lines(self, image_bytes: bytes) -> list[OCRLine] | str:
+        return await self._timed(self._extract_lines, image_bytes)
+
+    async def _timed(self, extract: Callable[[bytes], Awaitable], image_bytes: bytes):
+        start = time.perf_counter()
+        try:
+            result = await extract(image_bytes)
+        except DeadlineExceeded:
+            # Out of request time: not an engine error, nothing to fall back to
+            raise
+        except Exception as e:
+            result = f"{self.error_prefix} {str(e)}"
+        self._latencies_ms.append((time.perf_counter() - start) * 1000)
+        self.calls += 1
+        if isinstance(result, str) and self.is_error(result):
+            self.errors += 1
+        return result
+
+    async def _extract_text(self, image_bytes: bytes) -> str:
+        raise NotImplementedError
+
+    async def _extract_lines(self, image_bytes: bytes) -> list[OCRLine] | str:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_avg": round(sum(latencies) / len(latencies), 1) if latencies else None,
+        }
+
+
+class TextractEngine(OCREngine):
+    """AWS Textract detect_document_text (network round trip, throttled upstream)."""
+
+    name = "textract"
+    label = "Textract"
+
+    def __init__(
+        self,
+        extract_fn: Callable[[bytes], Awaitable[str]],
+        lines_fn: Callable[[bytes], Awaitable[list[OCRLine] | str]] | None = None,
+    ):
+        super().__init__()
+        self._extract_fn = extract_fn
+        self._lines_fn = lines_fn
+        self.supports_layout = lines_fn is not None
+
+    async def _extract_text(self, image_bytes: bytes) -> str:
+        return await self._extract_fn(image_bytes)
+
+    async def _extract_lines(self, image_bytes: bytes) -> list[OCRLine] | str:
+        return await self._lines_fn(image_bytes)
+
+
+class TesseractEngine(OCREngine):
+    """
+    Local CPU OCR with Tesseract (no WAN latency, no upstream throttling).
+    Requires the pytesseract package and the tesseract binary.
+    """
+
+    name = "tesseract"
+    label = "Tesseract"
+    supports_layout = True
+
+    def __init__(self, languages: str = "spa+eng", max_concurrency: int | None = None, timeout: float = 20):
+        super().__init__()
+        self.languages = languages
+        self.timeout = timeout
+        # Tesseract is CPU bound: do not run more jobs than cores at once
+        self._semaphore = asyncio.Semaphore(max_concurrency or os.cpu_count() or 1)
+
+    @staticmethod
+    def available() -> bool:
+        if pytesseract is None:
+            return False
+        try:
+            pytesseract.get_tesseract_version()
+            return True
+        except Exception:
+            return False
+
+    def _run(self, image_bytes: bytes, timeout: float) -> str:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(image_bytes))
+        raw_text = pytesseract.image_to_string(image, lang=self.languages, timeout=timeout)
+        text_lines = [line.strip() for line in raw_text.splitlines() if line.strip()]
+        return '\n'.join(text_lines) if text_lines else NO_TEXT_RESULT
+
+    def _run_lines(self, image_bytes: bytes, timeout: float) -> list[OCRLine]:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+        data = pytesseract.image_to_data(
+            image, lang=self.languages, timeout=timeout, output_type=pytesseract.Output.DICT
+        )
+        # Words grouped into lines: (left, top, right, bottom, words)
+        lines: dict[tuple, list] = {}
+        for i, word in enumerate(data["text"]):
+            if not word.strip():
+                continue
+            left, top = data["left"][i], data["top"][i]
+            right, bottom = left + data["width"][i], top + data["height"][i]
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            line = lines.setdefault(key, [left, top, right, bottom, []])
+            line[0], line[1] = min(line[0], left), min(line[1], top)
+            line[2], line[3] = max(line[2], right), max(line[3], bottom)
+            line[4].append(word.strip())
+        return [
+            OCRLine(" ".join(words), left / width, top / height, (right - left) / width, (bottom - top) / height)
+            for left, top, right, bottom, words in lines.values()
+        ]
+
+    async def _in_thread(self, fn: Callable, image_bytes: bytes):
+        async with self._semaphore:
+            # Bounded by what is left of the request deadline, if any
+            timeout = stage_timeout(self.timeout, "ocr")
+            try:
+                return await asyncio.to_thread(fn, image_bytes, timeout)
+            except RuntimeError as e:
+                # pytesseract signals its own timeout with a RuntimeError
+                return f"{self.error_prefix} {str(e)}"
+
+    async def _extract_text(self, image_bytes: bytes) -> str:
+        return await self._in_thread(self._run, image_bytes)
+
+    async def _extract_lines(self, image_bytes: bytes) -> list[OCRLine] | str:
+        return await self._in_thread(self._run_lines, image_bytes)
+
+
+class OCREngineRegistry:
+    """Engines available in this deployment plus the default and fallback choice."""
+
+    def __init__(self, engines: list[OCREngine], default: str, fallback: str | None = None):
+        self.engines = {engine.name: engine for engine in engines}
+        if default not in self.engines:
+            raise ValueError(f"Default OCR engine '{default}' is not available")
+        self.default = default
+        self.fallback = fallback if fallback in self.engines and fallback != default else None
+
+    def get(self, name: str | None = None) -> OCREngine | None:
+        return self.engines.get(name or self.default)
+
+    def is_error(self, text: str) -> bool:
+        return any(engine.is_error(text) for engine in self.engines.values())
+
+    async def extract_text(self, image_bytes: bytes, engine: OCREngine) -> str:
+        """Runs OCR with the given engine, retrying once on the fallback engine on error."""
+        text = await engine.extract_text(image_bytes)
+        if engine.is_error(text) and self.fallback and engine.name != self.fallback:
+            fallback_text = await self.engines[self.fallback].extract_text(image_bytes)
+            if not self.is_error(fallback_text):
+                return fallback_text
+        return text
+
+    async def extract_lines(self, image_bytes: bytes, engine: OCREngine) -> list[OCRLine] | str:
+        """Like extract_text, with line positions (the engine must support layout)."""
+        result = await engine.extract_lines(image_bytes)
+        fallback = self.engines.get(self.fallback) if self.fallback and engine.name != self.fallback else None
+        if isinstance(result, str) and fallback is not None and fallback.supports_layout:
+            fallback_result = await fallback.extract_lines(image_bytes)
+            if not isinstance(fallback_result, str):
+                return fallback_result
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "default": self.default,
+            "fallback": self.fallback,
+            "engines": {name: engine.stats() for name, engine in self.engines.items()},
+        }
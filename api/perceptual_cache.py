@@ -0,0 +1,195 @@
+import io
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from PIL import Image
+
+# dHash grid size: a 16x16 grid gives a 256-bit fingerprint, fine enough that
+# two different chat screens do not collapse onto the same hash but coarse
+# enough that a blinking cursor or clock tick only flips a handful of bits.
+DHASH_SIZE = 16
+
+
+def compute_dhash(image_bytes: bytes, hash_size: int = DHASH_SIZE) -> int | None:
+    """
+    Computes a difference hash (dHash) of an image.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale grid and
+    each bit records whether a cell is brighter than its right neighbour.
+
+    Returns:
+        The fingerprint as an int of hash_size * hash_size bits, or None if
+        the image could not be decoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Let the JPEG decoder downscale while decoding (no-op for PNG)
+        image.draft('L', ((hash_size + 1) * 8, hash_size * 8))
+        image = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+        pixels = image.tobytes()
+    except Exception:
+        return None
+
+    fingerprint = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            fingerprint = (fingerprint << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _BKNode:
+    __slots__ = ("fingerprint", "keys", "children")
+
+    def __init__(self, fingerprint: int, key: str):
+        self.fingerprint = fingerprint
+        self.keys = [key]
+        self.children: dict[int, "_BKNode"] = {}
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer fingerprints using Hamming distance.
+    Supports insertion and radius queries; removal is handled by the owner
+    rebuilding the tree from its live entries.
+    """
+
+    def __init__(self):
+        self.root: _BKNode | None = None
+
+    def add(self, fingerprint: int, key: str) -> None:
+        if self.root is None:
+            self.root = _BKNode(fingerprint, key)
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(fingerprint, node.fingerprint)
+            if distance == 0:
+                node.keys.append(key)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _BKNode(fingerprint, key)
+                return
+            node = child
+
+    def search(self, fingerprint: int, max_distance: int) -> list[tuple[int, str]]:
+        """Returns (distance, key) pairs within max_distance, closest first."""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(fingerprint, node.fingerprint)
+            if distance <= max_distance:
+                results.extend((distance, key) for key in node.keys)
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_distance, child in node.children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class PerceptualCacheIndex:
+    """
+    Maps perceptual fingerprints to response cache keys so near-identical
+    screenshots can reuse a cached value (the OCR text of a screenshot
+    already read).
+
+    The index only stores keys; the values themselves stay in the response
+    cache, so entries that expire there are skipped (and eventually pruned)
+    here as well.
+    """
+
+    def __init__(self, max_distance: int, maxsize: int = 1000, ttl: float = 3600):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._tree = BKTree()
+        self._stale = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, fingerprint: int | None, key: str) -> None:
+        if fingerprint is None or self.max_distance < 0:
+            return
+
+        if key in self._entries:
+            self._entries.pop(key)
+            self._stale += 1
+        self._entries[key] = (fingerprint, time.monotonic())
+        self._tree.add(fingerprint, key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stale += 1
+        self._maybe_rebuild()
+
+    def lookup(self, fingerprint: int | None, resolve: Callable[[str], Any]) -> tuple[str, Any] | None:
+        """
+        Finds the closest indexed screenshot within max_distance whose cached
+        value is still available.
+
+        Args:
+            fingerprint: dHash of the incoming screenshot
+            resolve: Callable returning the cached value for a key, or None
+
+        Returns:
+            (key, value) of the nearest match, or None on a miss
+        """
+        if fingerprint is None or self.max_distance < 0:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        for _, key in self._tree.search(fingerprint, self.max_distance):
+            entry = self._entries.get(key)
+            # Skip keys that were evicted or re-added with another fingerprint
+            if entry is None or now - entry[1] > self.ttl:
+                continue
+            if hamming_distance(fingerprint, entry[0]) > self.max_distance:
+                continue
+            value = resolve(key)
+            if value is not None:
+                self.hits += 1
+                return key, value
+
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _maybe_rebuild(self) -> None:
+        # BK-trees do not support deletion; rebuild once dead nodes dominate
+        if self._stale <= max(len(self._entries), 64):
+            return
+
+        now = time.monotonic()
+        live = OrderedDict(
+            (key, entry) for key, entry in self._entries.items() if now - entry[1] <= self.ttl
+        )
+        tree = BKTree()
+        for key, (fingerprint, _) in live.items():
+            tree.add(fingerprint, key)
+        self._entries = live
+        self._tree = tree
+        self._stale = 0
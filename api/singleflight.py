@@ -0,0 +1,73 @@
+import asyncio
+from typing import Callable, Coroutine, TypeVar
+
+from deadline import SharedDeadline, join_shared, shared_context
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "deadline", "waiters")
+
+    def __init__(self, task: asyncio.Task, deadline: SharedDeadline):
+        self.task = task
+        self.deadline = deadline
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running await the same task instead of repeating it.
+    - Errors propagate to every waiter and are not cached: the next call
+      after a failure runs the work again.
+    - A waiter being cancelled (client disconnect) does not cancel the work
+      for the others; the work is only cancelled once every waiter is gone.
+    - The work runs under the latest request deadline among its waiters
+      (see deadline.SharedDeadline); each waiter stops at its own.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Coroutine[object, object, T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            deadline = SharedDeadline()
+            join_shared(deadline)
+            task = asyncio.get_running_loop().create_task(fn(), context=shared_context(deadline))
+            call = _Call(task, deadline)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.executed += 1
+        else:
+            join_shared(call.deadline)
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is waiting for the result anymore
+                self._forget(key, call)
+                call.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
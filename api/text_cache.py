@@ -0,0 +1,159 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any
+
+SIMHASH_BITS = 64
+
+# Texts shorter than this carry too little signal for a SimHash match
+MIN_TOKENS = 8
+
+_TOKEN_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> list[str]:
+    """
+    Normalizes OCR output into comparable tokens:
+    - Case folding and accent stripping (OCR often drops or adds accents)
+    - Digit runs collapsed so clocks, counters and timestamps do not matter
+    - Punctuation and whitespace differences removed
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _DIGITS_RE.sub("0", text)
+    return _TOKEN_RE.findall(text)
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def compute_simhash(tokens: list[str], shingle_size: int = 3) -> int:
+    """Computes a 64-bit SimHash over word shingles."""
+    if len(tokens) < shingle_size:
+        features = [" ".join(tokens)]
+    else:
+        features = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+
+    # Count set bits per position in C: lay the hashes out as one bit string
+    # and count every SIMHASH_BITS-th character for each position
+    bits = "".join(format(_feature_hash(feature), "064b") for feature in features)
+    threshold = len(features) / 2
+
+    simhash = 0
+    for position in range(SIMHASH_BITS):
+        if bits[position::SIMHASH_BITS].count("1") > threshold:
+            simhash |= 1 << (SIMHASH_BITS - 1 - position)
+    return simhash
+
+
+class SimHashCache:
+    """
+    Near-duplicate cache keyed on OCR text.
+
+    Lookups use locality-sensitive banding: the 64-bit SimHash is split into
+    max_distance + 1 bands, so by the pigeonhole principle any stored hash
+    within max_distance bits shares at least one band with the query and is
+    found without scanning the whole cache.
+
+    Entries only match within their scope: texts whose near-identical wording
+    can hide a decisive difference (a lookalike domain) get different scopes.
+    """
+
+    def __init__(self, max_distance: int = 3, maxsize: int = 5000, ttl: float = 3600):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._entries: OrderedDict[tuple[str, int], tuple[Any, float]] = OrderedDict()
+        self._buckets: dict[tuple[str, int, int], set[int]] = {}
+        self._bands = self._band_masks(max(max_distance, 0) + 1)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _band_masks(num_bands: int) -> list[tuple[int, int]]:
+        num_bands = min(num_bands, SIMHASH_BITS)
+        masks = []
+        start = 0
+        for band in range(num_bands):
+            width = SIMHASH_BITS // num_bands + (1 if band < SIMHASH_BITS % num_bands else 0)
+            masks.append((start, (1 << width) - 1))
+            start += width
+        return masks
+
+    def fingerprint(self, text: str) -> int | None:
+        """Returns the SimHash of a text, or None if it is too short to compare."""
+        if self.max_distance < 0:
+            return None
+        tokens = normalize_text(text)
+        if len(tokens) < MIN_TOKENS:
+            return None
+        return compute_simhash(tokens)
+
+    def get(self, simhash: int | None, scope: str = "") -> Any | None:
+        if simhash is None:
+            self.skipped += 1
+            return None
+
+        now = time.monotonic()
+        best = None
+        best_distance = self.max_distance + 1
+        for band, (shift, mask) in enumerate(self._bands):
+            bucket = self._buckets.get((scope, band, (simhash >> shift) & mask))
+            if not bucket:
+                continue
+            for candidate in list(bucket):
+                entry = self._entries.get((scope, candidate))
+                if entry is None or now - entry[1] > self.ttl:
+                    # Lazily drop expired or evicted hashes from the bucket
+                    bucket.discard(candidate)
+                    continue
+                distance = (candidate ^ simhash).bit_count()
+                if distance < best_distance:
+                    best, best_distance = entry[0], distance
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def set(self, simhash: int | None, value: Any, scope: str = "") -> None:
+        if simhash is None:
+            return
+
+        self._entries.pop((scope, simhash), None)
+        self._entries[(scope, simhash)] = (value, time.monotonic())
+        for band, (shift, mask) in enumerate(self._bands):
+            self._buckets.setdefault((scope, band, (simhash >> shift) & mask), set()).add(simhash)
+
+        while len(self._entries) > self.maxsize:
+            (evicted_scope, evicted), _ = self._entries.popitem(last=False)
+            self._remove_from_buckets(evicted_scope, evicted)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped_short_text": self.skipped,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _remove_from_buckets(self, scope: str, simhash: int) -> None:
+        for band, (shift, mask) in enumerate(self._bands):
+            key = (scope, band, (simhash >> shift) & mask)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(simhash)
+                if not bucket:
+                    del self._buckets[key]
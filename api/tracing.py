@@ -0,0 +1,253 @@
+"""
+Lightweight request tracing and an on-demand sampling profiler.
+
+Tracing: every request gets a Trace (request ID, root span) held in a
+contextvar, so span() calls anywhere in the pipeline, including tasks
+started by the request, attach to it. Finished traces slower than
+slow_threshold_ms are kept in a ring buffer for the admin endpoints.
+
+Profiling: SamplingProfiler samples the event loop thread's Python stack
+(cpu mode) or the await chain of every pending asyncio task (async mode)
+from a background thread, and returns collapsed stacks ("a;b;c count"),
+the input format of flamegraph.pl and speedscope.
+"""
+import asyncio
+import itertools
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+REQUEST_ID_HEADER = "X-Request-Id"
+# Incoming request IDs longer than this are replaced (they end up in logs and headers)
+MAX_REQUEST_ID_LENGTH = 128
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, span_id: int, parent_id: int | None, name: str, attributes: dict):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attributes = attributes
+        self.error: str | None = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.name = name
+        self.started_at = time.time()
+        self.spans: list[Span] = []
+        self._ids = itertools.count(1)
+        self.root = self.new_span(name, None, {})
+
+    def new_span(self, name: str, parent_id: int | None, attributes: dict) -> Span:
+        span = Span(next(self._ids), parent_id, name, attributes)
+        self.spans.append(span)
+        return span
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.root.end if self.root.end is not None else time.perf_counter()
+        return (end - self.root.start) * 1000
+
+    def to_dict(self) -> dict:
+        origin = self.root.start
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2),
+            "attributes": self.root.attributes,
+            "spans": [
+                {
+                    "id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "start_ms": round((span.start - origin) * 1000, 2),
+                    "duration_ms": round((span.end - span.start) * 1000, 2) if span.end is not None else None,
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }
+                for span in self.spans[1:]
+            ],
+        }
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+def current_request_id() -> str | None:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    """
+    Times the with block as a child of the current span. Outside a traced
+    request it does nothing (yields None).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = trace.new_span(name, parent.span_id if parent is not None else trace.root.span_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+class Tracer:
+    """Starts request traces and keeps the slow ones in a ring buffer."""
+
+    def __init__(self, slow_threshold_ms: float = 2000, capacity: int = 200):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._slow: deque[Trace] = deque(maxlen=capacity)
+        self.traced = 0
+        self.kept = 0
+
+    @staticmethod
+    def request_id(incoming: str | None) -> str:
+        """The client's request ID if usable, a new one otherwise."""
+        if incoming and len(incoming) <= MAX_REQUEST_ID_LENGTH and incoming.isprintable():
+            return incoming
+        return uuid.uuid4().hex
+
+    @contextmanager
+    def trace(self, request_id: str, name: str) -> Iterator[Trace]:
+        trace = Trace(request_id, name)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.root.error = type(e).__name__
+            raise
+        finally:
+            trace.root.end = time.perf_counter()
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            self.traced += 1
+            if trace.duration_ms >= self.slow_threshold_ms:
+                self._slow.append(trace)
+                self.kept += 1
+
+    def slow_traces(self, limit: int = 50, min_ms: float = 0) -> list[dict]:
+        """Buffered slow traces, most recent first."""
+        traces = [trace for trace in reversed(self._slow) if trace.duration_ms >= min_ms]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def get(self, request_id: str) -> dict | None:
+        for trace in reversed(self._slow):
+            if trace.request_id == request_id:
+                return trace.to_dict()
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "traced": self.traced,
+            "kept": self.kept,
+            "buffered": len(self._slow),
+        }
+
+
+def _frame_stack(frame) -> list[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_stack(task: asyncio.Task) -> list[str]:
+    """Await chain of a pending task, outermost coroutine first."""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            stack.append(type(awaitable).__name__)
+            break
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+    return stack
+
+
+class SamplingProfiler:
+    """
+    On-demand sampling profiler for the running worker. One profile at a
+    time; sampling runs on a background thread so the event loop keeps
+    serving requests while it is being profiled.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.profiles = 0
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float, mode: str = "cpu") -> str:
+        """Collapsed stacks of the event loop thread (cpu) or of all pending tasks (async)."""
+        if mode not in ("cpu", "async"):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            loop = asyncio.get_running_loop()
+            thread_id = threading.get_ident()
+            samples = await asyncio.to_thread(self._sample, loop, thread_id, seconds, mode)
+            self.profiles += 1
+        finally:
+            self._lock.release()
+        return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, thread_id: int, seconds: float, mode: str) -> Counter:
+        samples: Counter = Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            if mode == "cpu":
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    # An idle loop shows up as its selector poll
+                    samples[";".join(_frame_stack(frame))] += 1
+            else:
+                try:
+                    tasks = list(asyncio.all_tasks(loop))
+                except RuntimeError:
+                    # The task set changed while it was copied: skip this sample
+                    tasks = []
+                for task in tasks:
+                    if not task.done():
+                        samples[";".join(_await_stack(task))] += 1
+            time.sleep(self.interval)
+        return samples
+
+    def stats(self) -> dict:
+        return {"running": self.running, "profiles": self.profiles, "interval_ms": self.interval * 1000}
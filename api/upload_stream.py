@@ -0,0 +1,300 @@
+import hashlib
+import struct
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Bytes of the upload inspected by the header sniffer (JPEG SOF markers can
+# sit behind a large EXIF/ICC segment)
+SNIFF_LIMIT = 256 * 1024
+
+# Slack for the multipart boundaries and part headers around the image
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+@dataclass
+class ImageHeader:
+    format: str
+    width: int | None = None
+    height: int | None = None
+
+
+@dataclass
+class StreamedUpload:
+    data: bytes
+    digest: str
+    filename: str | None
+    content_type: str | None
+    header: ImageHeader
+
+
+def _jpeg_dimensions(head: bytes) -> tuple[int, int] | None:
+    # Walk the marker segments up to the first SOFn frame header
+    offset = 2
+    while offset + 9 <= len(head):
+        if head[offset] != 0xFF:
+            return None
+        marker = head[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack(">H", head[offset + 2:offset + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def _webp_dimensions(head: bytes) -> tuple[int, int] | None:
+    # The first chunk after the RIFF header holds the canvas size
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30 and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25 and head[20] == 0x2F:
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def _tiff_dimensions(head: bytes) -> tuple[int, int] | None:
+    # ImageWidth (256) and ImageLength (257) entries of the first IFD
+    order = "<" if head[:2] == b"II" else ">"
+    ifd = struct.unpack(order + "I", head[4:8])[0]
+    if ifd < 8 or ifd + 2 > len(head):
+        return None
+    count = struct.unpack(order + "H", head[ifd:ifd + 2])[0]
+    if ifd + 2 + count * 12 > len(head):
+        return None
+    dimensions = {}
+    for offset in range(ifd + 2, ifd + 2 + count * 12, 12):
+        tag, kind = struct.unpack(order + "HH", head[offset:offset + 4])
+        if tag in (256, 257):
+            if kind == 3:
+                dimensions[tag] = struct.unpack(order + "H", head[offset + 8:offset + 10])[0]
+            elif kind == 4:
+                dimensions[tag] = struct.unpack(order + "I", head[offset + 8:offset + 12])[0]
+    if 256 not in dimensions or 257 not in dimensions:
+        return None
+    return dimensions[256], dimensions[257]
+
+
+def sniff_image_header(head: bytes, complete: bool = False) -> ImageHeader | None:
+    """
+    Identifies the image format and dimensions from the first bytes of an
+    upload without decoding it. WEBP and TIFF uploads whose dimensions are
+    not within the first SNIFF_LIMIT bytes are rejected, so the pixel limit
+    always applies to them.
+
+    Args:
+        head: Leading bytes of the upload
+        complete: True if head is the whole upload (no more bytes coming)
+
+    Returns:
+        The detected header, None if more bytes are needed to decide.
+
+    Raises:
+        ValueError if the bytes are not a supported image.
+    """
+    if len(head) < 32 and not complete:
+        return None
+
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24 and head[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", head[16:24])
+        return ImageHeader("PNG", width, height)
+    if head.startswith(b"\xff\xd8\xff"):
+        dimensions = _jpeg_dimensions(head)
+        if dimensions is not None:
+            return ImageHeader("JPEG", *dimensions)
+        if len(head) < SNIFF_LIMIT and not complete:
+            return None
+        return ImageHeader("JPEG")
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        width, height = struct.unpack("<HH", head[6:10])
+        return ImageHeader("GIF", width, height)
+    if head.startswith(b"BM") and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return ImageHeader("BMP", width, abs(height))
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        dimensions = _webp_dimensions(head)
+        if dimensions is None:
+            raise ValueError("WEBP without a readable canvas size")
+        return ImageHeader("WEBP", *dimensions)
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        dimensions = _tiff_dimensions(head)
+        if dimensions is not None:
+            return ImageHeader("TIFF", *dimensions)
+        if len(head) < SNIFF_LIMIT and not complete:
+            return None
+        raise ValueError("TIFF without readable dimensions in its first bytes")
+    raise ValueError("unsupported image format")
+
+
+class _ImageIngest:
+    """
+    Incremental consumer for one image: streaming MD5, header sniffing and
+    size/pixel limits, checked as each chunk arrives.
+    """
+
+    def __init__(self, max_bytes: int, max_pixels: int):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.hash = hashlib.md5()
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.header: ImageHeader | None = None
+        self._head = bytearray()
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"La imagen excede el tamaño máximo de {self.max_bytes // (1024 * 1024)}MB"
+            )
+        self.hash.update(chunk)
+        self.chunks.append(chunk)
+
+        if self.header is None:
+            self._head += chunk[:SNIFF_LIMIT - len(self._head)]
+            self._sniff(complete=False)
+
+    def finish(self) -> tuple[bytes, str, ImageHeader]:
+        if self.size == 0:
+            raise HTTPException(status_code=400, detail="La imagen está vacía")
+        if self.header is None:
+            self._sniff(complete=True)
+        return b"".join(self.chunks), self.hash.hexdigest(), self.header
+
+    def _sniff(self, complete: bool) -> None:
+        try:
+            self.header = sniff_image_header(bytes(self._head), complete=complete)
+        except ValueError:
+            raise HTTPException(status_code=415, detail="Formato de imagen no soportado o archivo corrupto")
+        if self.header is None:
+            return
+        self._head = bytearray()
+        if self.header.width is not None and self.header.height is not None:
+            if self.header.width * self.header.height > self.max_pixels:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"La imagen excede el máximo de {self.max_pixels} píxeles"
+                )
+
+
+async def read_image_uploads(
+    request: Request,
+    field_name: str,
+    max_bytes: int,
+    max_pixels: int,
+    max_files: int = 1,
+) -> list[StreamedUpload]:
+    """
+    Reads image uploads from the request body as a stream.
+
+    Accepts multipart/form-data (one or more parts named field_name) or a raw
+    image body (Content-Type: image/*). Each chunk is hashed and inspected as
+    it arrives, so oversized or undecodable images are rejected before the
+    rest of the body is read, and the MD5 digest is ready as soon as the last
+    chunk of the image has been seen.
+
+    Raises:
+        HTTPException 400/413/415 for missing, oversized or invalid images
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_bytes * max_files + MULTIPART_OVERHEAD:
+            raise HTTPException(
+                status_code=413,
+                detail=f"La solicitud excede el tamaño máximo de {max_bytes * max_files // (1024 * 1024)}MB"
+            )
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    uploads: list[StreamedUpload] = []
+
+    if content_type.startswith(b"image/"):
+        ingest = _ImageIngest(max_bytes, max_pixels)
+        async for chunk in request.stream():
+            if chunk:
+                ingest.feed(chunk)
+        data, digest, header = ingest.finish()
+        return [StreamedUpload(data, digest, None, content_type.decode("latin-1"), header)]
+
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=415, detail="Se espera multipart/form-data o un cuerpo image/*")
+
+    state = {"headers": [], "field": b"", "value": b"", "ingest": None, "filename": None, "content_type": None}
+
+    def on_part_begin() -> None:
+        state.update(headers=[], ingest=None, filename=None, content_type=None)
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        state["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        state["value"] += data[start:end]
+
+    def on_header_end() -> None:
+        state["headers"].append((state["field"].lower(), state["value"]))
+        state["field"] = b""
+        state["value"] = b""
+
+    def on_headers_finished() -> None:
+        headers = dict(state["headers"])
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("latin-1") != field_name:
+            return
+        if len(uploads) >= max_files:
+            raise HTTPException(status_code=413, detail=f"Máximo {max_files} imágenes por solicitud")
+        state["ingest"] = _ImageIngest(max_bytes, max_pixels)
+        if b"filename" in options:
+            state["filename"] = options[b"filename"].decode("utf-8", errors="replace")
+        if b"content-type" in headers:
+            state["content_type"] = headers[b"content-type"].decode("latin-1")
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if state["ingest"] is not None:
+            state["ingest"].feed(data[start:end])
+
+    def on_part_end() -> None:
+        ingest = state["ingest"]
+        if ingest is not None:
+            data, digest, header = ingest.finish()
+            uploads.append(StreamedUpload(data, digest, state["filename"], state["content_type"], header))
+            state["ingest"] = None
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except FormParserError:
+        raise HTTPException(status_code=400, detail="Cuerpo multipart inválido")
+
+    if not uploads:
+        raise HTTPException(status_code=400, detail=f"Falta el archivo '{field_name}'")
+    return uploads
+
+
+async def read_image_upload(request: Request, field_name: str, max_bytes: int, max_pixels: int) -> StreamedUpload:
+    """Streams a single image upload (see read_image_uploads)."""
+    uploads = await read_image_uploads(request, field_name, max_bytes, max_pixels, max_files=1)
+    return uploads[0]
@@ -0,0 +1,374 @@
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+# Protected brands: display name -> official domains. The registrable label of
+# each domain (paypal, bancoestado...) is what lookalikes are compared against.
+DEFAULT_BRANDS = {
+    "BancoEstado": ["bancoestado.cl"],
+    "Banco de Chile": ["bancochile.cl", "bancoedwards.cl"],
+    "Santander": ["santander.cl", "santander.com"],
+    "BCI": ["bci.cl"],
+    "Scotiabank": ["scotiabank.cl", "scotiabank.com"],
+    "Itaú": ["itau.cl"],
+    "Banco Falabella": ["bancofalabella.cl", "falabella.com"],
+    "Banco Ripley": ["bancoripley.cl", "ripley.cl"],
+    "Mercado Pago": ["mercadopago.cl", "mercadopago.com"],
+    "Mercado Libre": ["mercadolibre.cl", "mercadolibre.com"],
+    "Servicio de Impuestos Internos": ["sii.cl"],
+    "ChileAtiende": ["chileatiende.gob.cl"],
+    "Correos de Chile": ["correos.cl"],
+    "Chilexpress": ["chilexpress.cl"],
+    "Starken": ["starken.cl"],
+    "PayPal": ["paypal.com"],
+    "Apple": ["apple.com", "icloud.com"],
+    "Microsoft": ["microsoft.com", "office.com", "outlook.com", "live.com", "microsoftonline.com"],
+    "Google": ["google.com", "gmail.com", "youtube.com"],
+    "Amazon": ["amazon.com"],
+    "Netflix": ["netflix.com"],
+    "Facebook": ["facebook.com"],
+    "Instagram": ["instagram.com"],
+    "WhatsApp": ["whatsapp.com"],
+    "DHL": ["dhl.com", "dhl.cl"],
+    "FedEx": ["fedex.com"],
+    "Binance": ["binance.com"],
+    "Coinbase": ["coinbase.com"],
+}
+
+# Second-level public suffixes under which the registrable label sits one
+# level deeper (bancoestado.com.cl -> bancoestado)
+MULTI_LABEL_SUFFIXES = {
+    "com.cl", "gob.cl", "co.uk", "com.ar", "com.mx", "com.br", "com.pe", "com.co", "com.es", "gob.mx",
+}
+
+# TLDs accepted for bare domains (without scheme or www.), so that file names
+# and sentence breaks in OCR text ("archivo.pdf", "hola.Mañana") are not domains
+KNOWN_TLDS = set("""
+com net org info biz io co app dev xyz top online site shop store live me tk ml ga cf gq ru cn cl ar mx
+pe br es us uk de fr it eu ly link click support help security services account login page club icu vip
+cc ws su pw buzz gob edu gov ai tv in pl nl ch at be pt ca au jp kr ua tr ir id vn ph my sg hk tw za ng
+ke eg ma ve ec bo uy py cr pa gt do sv hn ni pr cu mobi pro name work fun space website tech world today
+""".split())
+
+# Unicode characters rendered identically (or nearly) to ASCII letters
+CONFUSABLES = str.maketrans({
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "ѕ": "s", "і": "i", "ї": "i", "ј": "j", "ԁ": "d", "һ": "h", "ԛ": "q",
+    "ԝ": "w", "ӏ": "l",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t",
+    "υ": "u", "χ": "x", "ω": "w",
+    # Latin look-alikes
+    "ı": "i", "ɡ": "g", "ɑ": "a", "ɩ": "i", "ʟ": "l", "ᴅ": "d", "ꜱ": "s", "ạ": "a", "ḅ": "b", "ẹ": "e",
+    "ọ": "o", "ụ": "u", "à": "a", "á": "a", "â": "a", "ä": "a", "ã": "a", "å": "a", "è": "e", "é": "e",
+    "ê": "e", "ë": "e", "ì": "i", "í": "i", "î": "i", "ï": "i", "ò": "o", "ó": "o", "ô": "o", "ö": "o",
+    "õ": "o", "ù": "u", "ú": "u", "û": "u", "ü": "u", "ñ": "n", "ç": "c",
+    # Digits and symbols used as letters
+    "0": "o", "1": "l", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "|": "l", "-": None, "_": None,
+})
+
+# Letter sequences that read as another letter at screen resolution
+SEQUENCE_CONFUSABLES = (("rn", "m"), ("vv", "w"), ("cj", "g"))
+
+HOST_RE = re.compile(r"(?:[\w-]{1,63}\.)+(?:xn--[a-z0-9-]+|[a-z]{2,24})", re.IGNORECASE)
+
+# Punctuation OCR leaves around URLs and addresses
+TOKEN_STRIP = "()[]{}<>\"'«».,;:!?¡¿*"
+
+
+def skeleton(label: str) -> str:
+    """Collapses a domain label to its visual skeleton (paypa1, pаypal -> paypal)."""
+    value = label.lower().translate(CONFUSABLES)
+    for sequence, replacement in SEQUENCE_CONFUSABLES:
+        value = value.replace(sequence, replacement)
+    # i/l/1 are interchangeable in most UI fonts
+    return value.replace("i", "l")
+
+
+def max_edit_distance(name: str) -> int:
+    """Edit distance tolerated for a brand name: short names only match exactly."""
+    if len(name) <= 5:
+        return 0
+    if len(name) <= 8:
+        return 1
+    return 2
+
+
+def _deletes(value: str, distance: int) -> set[str]:
+    # Every string reachable from value by removing up to distance characters
+    variants = {value}
+    frontier = {value}
+    for _ in range(distance):
+        frontier = {item[:i] + item[i + 1:] for item in frontier for i in range(len(item))}
+        variants |= frontier
+    return variants
+
+
+def _bounded_distance(a: str, b: str, limit: int) -> int | None:
+    """Optimal string alignment distance, or None if above limit."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous_previous is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return None
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def split_domain(domain: str) -> tuple[list[str], str]:
+    """Splits a host into (subdomain labels, registrable label)."""
+    labels = domain.split(".")
+    suffix_length = 2 if ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 1
+    if len(labels) <= suffix_length:
+        return [], labels[0]
+    return labels[:-suffix_length - 1], labels[-suffix_length - 1]
+
+
+def normalize_domain(domain: str) -> tuple[str, bool]:
+    """Lowercases a host and decodes punycode labels. Returns (host, had_punycode)."""
+    domain = domain.strip(".").lower()
+    punycode = False
+    labels = []
+    for label in domain.split("."):
+        if label.startswith("xn--"):
+            try:
+                label = label.encode("ascii").decode("idna")
+                punycode = True
+            except UnicodeError:
+                pass
+        labels.append(label)
+    return ".".join(labels), punycode
+
+
+def extract_domains(text: str) -> dict[str, str]:
+    """
+    Finds URLs, email addresses and bare domains in OCR text.
+
+    Works on whitespace-separated tokens (str.split runs in C) and only runs
+    the host pattern on tokens that contain a dot, which keeps long texts
+    cheap.
+
+    Returns:
+        host -> source ("url", "email" or "domain"), in order of appearance
+    """
+    found: dict[str, str] = {}
+    for token in text.split():
+        if "." not in token:
+            continue
+        token = token.strip(TOKEN_STRIP)
+        lowered = token.lower()
+        if lowered.startswith(("http://", "https://", "www.")):
+            source = "url"
+            url = token if lowered.startswith("http") else "http://" + token
+            try:
+                host = urlsplit(url).hostname or ""
+            except ValueError:
+                continue
+        elif "@" in token:
+            source = "email"
+            host = token.rsplit("@", 1)[1]
+        else:
+            source = "domain"
+            host = token.split("/", 1)[0]
+        host = host.lower()
+        if not HOST_RE.fullmatch(host):
+            continue
+        tld = host.rsplit(".", 1)[-1]
+        # Bare tokens need a known TLD: "archivo.pdf" or "hola.Mañana" are not domains
+        if source == "domain" and tld not in KNOWN_TLDS and not tld.startswith("xn--"):
+            continue
+        found.setdefault(host, source)
+    return found
+
+
+@dataclass
+class BrandMatch:
+    domain: str
+    source: str
+    brand: str
+    kind: str
+    strong: bool
+    distance: int = 0
+
+    def describe(self) -> str:
+        return f"{self.domain}: {KIND_DESCRIPTIONS[self.kind]} {self.brand}"
+
+
+# Match kinds. Only official_prefix, and punycode or homoglyph on the
+# registrable label with non-ASCII look-alike characters, are strong (treated
+# as phishing without asking the LLM). The rest are hints: brands legitimately
+# appear in other domains, and ASCII look-alikes (0/o, 1/l, rn/m) or small
+# typos are also what OCR misreads and unrelated short names (uc.cl, sil.cl)
+# look like.
+KIND_DESCRIPTIONS = {
+    "homoglyph": "usa caracteres parecidos para imitar a",
+    "punycode": "usa un dominio internacionalizado (punycode) que imita a",
+    "typosquat": "es una variante mal escrita del dominio de",
+    "official_prefix": "antepone el dominio oficial de",
+    "brand_tld": "usa el nombre de marca con otra extensión que",
+    "combosquat": "incluye el nombre de marca de",
+}
+# Labels whose lookalike result is memoized (the same hosts recur across frames)
+NEAR_CACHE_SIZE = 10_000
+
+
+class BrandIndex:
+    """
+    Precomputed lookalike index over protected brand names.
+
+    Built once: each brand label is indexed by its visual skeleton and by
+    every deletion variant within its edit-distance budget (symmetric delete
+    scheme), so a lookup only generates the deletions of the candidate and
+    probes dicts instead of comparing against every brand.
+    """
+
+    def __init__(self, brands: dict[str, list[str]] = DEFAULT_BRANDS):
+        self._lock = threading.Lock()
+        self.official: dict[str, str] = {}
+        self._names: dict[str, str] = {}
+        self._skeletons: dict[str, str] = {}
+        self._deletes: dict[str, set[str]] = {}
+        self._near_cache: dict[str, tuple[str, int] | None] = {}
+        self.lookups = 0
+        self.lookup_ns = 0
+        self.matches: dict[str, int] = {}
+
+        start = time.perf_counter()
+        for brand, domains in brands.items():
+            for domain in domains:
+                domain = domain.lower()
+                self.official[domain] = brand
+                _, label = split_domain(domain)
+                self._names[label] = brand
+        for label, brand in self._names.items():
+            label_skeleton = skeleton(label)
+            self._skeletons[label_skeleton] = label
+            for variant in _deletes(label_skeleton, max_edit_distance(label)):
+                self._deletes.setdefault(variant, set()).add(label)
+        self._longest = max((len(label) for label in self._names), default=0)
+        self.build_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    @classmethod
+    def from_file(cls, path: str | None) -> "BrandIndex":
+        """Index over DEFAULT_BRANDS plus the brands in a JSON file ({brand: [domains]})."""
+        brands = {name: list(domains) for name, domains in DEFAULT_BRANDS.items()}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                for name, domains in json.load(f).items():
+                    brands.setdefault(name, []).extend(domains)
+        return cls(brands)
+
+    def is_official(self, domain: str) -> bool:
+        labels = domain.split(".")
+        return any(".".join(labels[i:]) in self.official for i in range(len(labels) - 1))
+
+    def _near_label(self, label: str) -> tuple[str, int] | None:
+        # Closest protected label within its own edit-distance budget
+        if len(label) < 3 or len(label) > self._longest + 2:
+            return None
+        if label in self._near_cache:
+            return self._near_cache[label]
+        label_skeleton = skeleton(label)
+        best = None
+        exact = self._skeletons.get(label_skeleton)
+        if exact is not None:
+            best = (exact, 0)
+        else:
+            for variant in _deletes(label_skeleton, 2):
+                for name in self._deletes.get(variant, ()):
+                    distance = _bounded_distance(label_skeleton, skeleton(name), max_edit_distance(name))
+                    if distance is not None and (best is None or distance < best[1]):
+                        best = (name, distance)
+        if len(self._near_cache) >= NEAR_CACHE_SIZE:
+            self._near_cache.clear()
+        self._near_cache[label] = best
+        return best
+
+    def match_domain(self, domain: str, source: str = "domain") -> BrandMatch | None:
+        """Checks one host against the protected brands."""
+        host, punycode = normalize_domain(domain)
+        if self.is_official(host):
+            return None
+        subdomains, label = split_domain(host)
+
+        # Official domain used as a prefix: paypal.com.account-verify.ru
+        for i in range(len(subdomains)):
+            prefix = ".".join(subdomains[i:i + 2])
+            if prefix in self.official:
+                return BrandMatch(host, source, self.official[prefix], "official_prefix", True)
+
+        # Registrable label first, then subdomains and hyphenated words
+        # (pаypal.com, paypa1.example.net, bancoestad0-seguro.com)
+        parts = [label] + [part for part in label.split("-") if part != label]
+        for subdomain in subdomains:
+            parts += subdomain.split("-")
+        weak = None
+        for index, part in enumerate(parts):
+            near = self._near_label(part)
+            if near is None:
+                continue
+            name, distance = near
+            brand = self._names[name]
+            if part == name:
+                # The real brand name on a domain it does not own
+                if weak is None:
+                    weak = BrandMatch(host, source, brand, "brand_tld" if index == 0 else "combosquat", False)
+                continue
+            if distance == 0 and index == 0 and not part.isascii():
+                # Registrable label spelled with Unicode look-alikes: deliberate
+                return BrandMatch(host, source, brand, "punycode" if punycode else "homoglyph", True)
+            # A look-alike hint is more telling than the plain brand name
+            if weak is None or weak.kind in ("brand_tld", "combosquat"):
+                weak = BrandMatch(host, source, brand, "homoglyph" if distance == 0 else "typosquat", False, distance)
+        return weak
+
+    def analyze(self, text: str) -> list[BrandMatch]:
+        """Extracts every host from text and returns its brand matches (strong first)."""
+        start = time.perf_counter_ns()
+        matches = {}
+        for domain, source in extract_domains(text).items():
+            match = self.match_domain(domain, source)
+            if match is not None:
+                matches.setdefault(match.domain, match)
+        matches = list(matches.values())
+        matches.sort(key=lambda match: not match.strong)
+        elapsed = time.perf_counter_ns() - start
+
+        with self._lock:
+            self.lookups += 1
+            self.lookup_ns += elapsed
+            for match in matches:
+                self.matches[match.kind] = self.matches.get(match.kind, 0) + 1
+        return matches
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "brands": len(set(self._names.values())),
+                "labels": len(self._names),
+                "index_entries": len(self._deletes),
+                "build_ms": self.build_ms,
+                "lookups": self.lookups,
+                "avg_lookup_us": round(self.lookup_ns / self.lookups / 1000, 1) if self.lookups else 0.0,
+                "matches": dict(self.matches),
+            }
+
+
+def format_hints(matches: list[BrandMatch]) -> str:
+    """Domain findings appended to the text sent to the LLM."""
+    if not matches:
+        return ""
+    lines = "\n".join(f"- {match.describe()}" for match in matches)
+    return f"\n\nIndicadores de dominios detectados automáticamente:\n{lines}"